@@ -0,0 +1,95 @@
+"""
+ベンチマーク用の合成メディアを生成します（ネットワーク不要・決定的）。
+動画は ffmpeg の lavfi テストソース、PDF は PyMuPDF で描画します。
+生成済みのコーパスは仕様が変わらない限り再利用されます。
+"""
+import os
+import json
+import hashlib
+import subprocess
+import fitz  # PyMuPDF
+
+
+# コーパスの定義（種類ごとの件数とパラメータ）
+CORPORA = {
+    "small": {
+        "short": {"count": 10, "size": "320x240", "duration": 2},
+        "long": {"count": 2, "size": "640x360", "duration": 30},
+        "hires": {"count": 1, "size": "3840x2160", "duration": 3},
+        "pdf": {"pages": [5, 20, 100]},
+    },
+    "full": {
+        "short": {"count": 200, "size": "320x240", "duration": 2},
+        "long": {"count": 10, "size": "1280x720", "duration": 120},
+        "hires": {"count": 5, "size": "3840x2160", "duration": 5},
+        "pdf": {"pages": [1, 5, 10, 20, 50, 100, 200, 300, 500, 500]},
+    },
+}
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".corpus")
+
+
+def generate_video(path, size, duration, index):
+    """lavfi の testsrc2 と sine から動画を生成します。"""
+    cmd = [
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=30:duration={duration}",
+        "-f", "lavfi", "-i", f"sine=frequency={220 + index * 10}:duration={duration}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-shortest", path
+    ]
+    subprocess.run(cmd, check=True)
+
+
+def generate_pdf(path, page_count, index, width=960, height=540):
+    """図形とテキストを描画した複数ページのPDFを生成します（既定は 16:9 のスライド）。"""
+    doc = fitz.open()
+    for page_number in range(page_count):
+        page = doc.new_page(width=width, height=height)
+        shade = ((page_number * 37 + index * 11) % 200) / 255
+        page.draw_rect(fitz.Rect(40, 40, width - 40, height - 40), color=(0, 0, 0), fill=(shade, 0.5, 1 - shade))
+        page.insert_text((80, 120), f"Benchmark {index} / page {page_number + 1}", fontsize=36)
+        for line in range(10):
+            page.insert_text((80, 180 + line * 28), "Lorem ipsum dolor sit amet " * 3, fontsize=14)
+    doc.save(path)
+    doc.close()
+
+
+def ensure_corpus(name):
+    """コーパスを生成（または再利用）し、ディレクトリのパスを返します。"""
+    spec = CORPORA[name]
+    digest = hashlib.md5(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:8]
+    corpus_dir = os.path.join(CACHE_DIR, f"{name}-{digest}")
+    done_marker = os.path.join(corpus_dir, ".complete")
+    if os.path.exists(done_marker):
+        return corpus_dir
+
+    os.makedirs(corpus_dir, exist_ok=True)
+    print(f"Generating corpus '{name}' in {corpus_dir} ...")
+    for kind in ("short", "long", "hires"):
+        video = spec[kind]
+        for index in range(video["count"]):
+            generate_video(os.path.join(corpus_dir, f"{kind}_{index:03d}.mp4"),
+                           video["size"], video["duration"], index)
+    for index, page_count in enumerate(spec["pdf"]["pages"]):
+        generate_pdf(os.path.join(corpus_dir, f"doc_{index:03d}_{page_count}p.pdf"), page_count, index)
+
+    with open(done_marker, 'w') as f:
+        f.write(json.dumps(spec))
+    return corpus_dir
+
+
+def copy_corpus(corpus_dir, work_dir):
+    """コーパスを作業ディレクトリに複製します（可能な場合はハードリンク）。"""
+    os.makedirs(work_dir, exist_ok=True)
+    for name in os.listdir(corpus_dir):
+        if name.startswith("."):
+            continue
+        source = os.path.join(corpus_dir, name)
+        target = os.path.join(work_dir, name)
+        try:
+            os.link(source, target)
+        except OSError:
+            with open(source, 'rb') as src, open(target, 'wb') as dst:
+                dst.write(src.read())
+    return work_dir
@@ -0,0 +1,120 @@
+"""
+PDF の動画変換（PDFConverter.convert_pdf_to_video）を実際にエンコードして確認するチェック。
+16:9 のスライド、Letter（縦長）、両方のページが混在する PDF を生成して変換し、
+動画のフレームサイズ、ページごとのフレームの表示時刻、動画の長さを検証します（ffmpeg が必要です）。
+
+    python -m benchmarks.pdf_video_check
+"""
+import os
+import re
+import sys
+import shutil
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import cv2
+import fitz  # PyMuPDF
+from benchmarks.corpus import generate_pdf
+from modules.fileConvert_pdf import PDFConverter, video_layout
+
+# (名前, ページサイズのリスト)
+CASES = [
+    ("slide_16x9", [(960, 540)]),
+    ("letter", [(612, 792)]),
+    ("mixed", [(960, 540), (612, 792)]),
+]
+DURATION_PATTERN = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+# 表示時刻の許容誤差（秒）
+TIME_TOLERANCE = 0.1
+
+
+def build_pdf(path, sizes, pages):
+    """ページサイズごとに pages ページずつ描画した PDF を作成します。"""
+    doc = fitz.open()
+    for index, (width, height) in enumerate(sizes):
+        part = f"{path}.{index}.pdf"
+        generate_pdf(part, pages, index, width, height)
+        with fitz.open(part) as source:
+            doc.insert_pdf(source)
+        os.remove(part)
+    doc.save(path)
+    doc.close()
+
+
+def inspect_video(path):
+    """動画のフレームサイズ、フレームごとの表示時刻（秒）のリスト、動画の長さ（秒）を返します。"""
+    capture = cv2.VideoCapture(path)
+    try:
+        width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        times = []
+        while capture.read()[0]:
+            times.append(capture.get(cv2.CAP_PROP_POS_MSEC) / 1000)
+    finally:
+        capture.release()
+    # 最終ページの表示時間はコンテナの長さに反映されるため、ffmpeg の出力から読み取る
+    process = subprocess.run(["ffmpeg", "-hide_banner", "-i", path], capture_output=True, text=True)
+    match = DURATION_PATTERN.search(process.stderr)
+    duration = None
+    if match:
+        hours, minutes, seconds = match.groups()
+        duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    return width, height, times, duration
+
+
+async def check_case(work_dir, name, sizes, pages, page_duration):
+    pdf_path = os.path.join(work_dir, f"{name}.pdf")
+    output_video = os.path.join(work_dir, f"{name}.mp4")
+    build_pdf(pdf_path, sizes, pages)
+    durations, width, height = video_layout(pdf_path, page_duration)
+    await PDFConverter().convert_pdf_to_video(pdf_path, output_video, page_duration)
+
+    errors = []
+    video_width, video_height, times, duration = inspect_video(output_video)
+    if (video_width, video_height) != (width, height):
+        errors.append(f"frame size {video_width}x{video_height}, expected {width}x{height}")
+    # ページごとに1フレームが、それまでのページの表示時間の合計の時刻に表示される
+    expected_times = [sum(durations[:page]) for page in range(len(durations))]
+    if len(times) != len(expected_times):
+        errors.append(f"{len(times)} frames, expected {len(expected_times)}")
+    elif any(abs(actual - expected) > TIME_TOLERANCE for actual, expected in zip(times, expected_times)):
+        errors.append(f"frames at {times}, expected {expected_times}")
+    if duration is None or abs(duration - sum(durations)) > TIME_TOLERANCE:
+        errors.append(f"duration {duration}, expected {sum(durations):g}")
+    status = "ok" if not errors else "FAILED: " + "; ".join(errors)
+    print(f"{name:>10}: {len(durations)} pages, {width}x{height}, {len(times)} frames, {duration}s -> {status}")
+    return not errors
+
+
+async def run(options):
+    work_dir = tempfile.mkdtemp(prefix="thumb-crafter-pdf-video-")
+    try:
+        results = []
+        for name, sizes in CASES:
+            try:
+                results.append(await check_case(work_dir, name, sizes, options.pages, options.page_duration))
+            except Exception as e:
+                print(f"{name:>10}: FAILED: {e!r}")
+                results.append(False)
+        return all(results)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Thumb Crafter PDF to video check')
+    parser.add_argument('--pages', type=int, default=3,
+                        help='Pages per page size in each generated PDF')
+    parser.add_argument('--page_duration', type=float, default=2,
+                        help='Display duration of each page in seconds')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_arguments(argv)
+    return 0 if asyncio.run(run(options)) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,321 @@
+"""
+thumb-crafter のスループットを計測するベンチマーク。
+合成コーパスに対して起動時スキャン（FileHandler.list_files）とライブイベント（handle_created）を実行し、
+ファイル/秒、処理段階ごとのレイテンシのパーセンタイル、ピークRSS、サブプロセス数をJSONに出力します。
+
+    python -m benchmarks.run_benchmarks --corpus small --output results.json
+    python -m benchmarks.run_benchmarks --corpus small --baseline results.json   # 前回の結果と比較
+
+--baseline を指定した場合、thresholds.json のしきい値を超えて悪化した項目があれば終了コード 1 で終了します。
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+import psutil
+from watchdog.events import FileCreatedEvent
+from modules.filehandler import FileHandler, VIDEO_EXTENSIONS, PDF_EXTENSION
+from modules.manifest import ThumbnailManifest
+from modules.fileGenerate_thumbnail import VideoThumbnailGenerator
+from modules.fileConvert_pdf import PDFConverter
+from benchmarks.corpus import CORPORA, ensure_corpus, copy_corpus
+
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_THRESHOLDS = os.path.join(BENCH_DIR, "thresholds.json")
+SCENARIOS = ("startup_cold", "startup_warm", "live")
+
+# レイテンシを計測する処理段階（クラス, メソッド名, 段階名）
+STAGES = [
+    (FileHandler, "handle_created", "handle_created"),
+    (VideoThumbnailGenerator, "create_thumbnail", "video_thumbnail"),
+    (PDFConverter, "convert_pdf_to_images", "pdf_sequence"),
+    (PDFConverter, "convert_pdf_to_video", "pdf_video"),
+]
+
+
+class StageTimer:
+    """コルーチンメソッドを差し替えて、処理段階ごとの所要時間を記録します。"""
+
+    def __init__(self):
+        self.samples = {}
+        self.originals = []
+
+    def install(self):
+        for owner, attr, stage in STAGES:
+            original = getattr(owner, attr)
+            self.originals.append((owner, attr, original))
+            setattr(owner, attr, self.timed(original, stage))
+
+    def uninstall(self):
+        for owner, attr, original in self.originals:
+            setattr(owner, attr, original)
+        self.originals = []
+
+    def timed(self, method, stage):
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                self.samples.setdefault(stage, []).append(time.perf_counter() - started)
+        return wrapper
+
+
+class SubprocessCounter:
+    """subprocess.Popen の生成回数を数えます（asyncio のサブプロセスも Popen を経由します）。"""
+
+    def __init__(self):
+        self.count = 0
+        self.original = None
+
+    def install(self):
+        self.original = subprocess.Popen.__init__
+        counter = self
+
+        def init(popen, *args, **kwargs):
+            counter.count += 1
+            counter.original(popen, *args, **kwargs)
+        subprocess.Popen.__init__ = init
+
+    def uninstall(self):
+        subprocess.Popen.__init__ = self.original
+
+
+class ResourceSampler(threading.Thread):
+    """自プロセスと子プロセスのRSS合計・子プロセス数のピークを一定間隔で記録します。"""
+    INTERVAL = 0.05
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.process = psutil.Process()
+        self.peak_rss = 0
+        self.peak_children = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.sample()
+            self.stopped.wait(self.INTERVAL)
+
+    def sample(self):
+        try:
+            children = self.process.children(recursive=True)
+            rss = self.process.memory_info().rss
+            for child in children:
+                try:
+                    rss += child.memory_info().rss
+                except psutil.Error:
+                    pass
+        except psutil.Error:
+            return
+        self.peak_rss = max(self.peak_rss, rss)
+        self.peak_children = max(self.peak_children, len(children))
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.sample()
+
+
+def percentiles(values):
+    """最近傍法によるパーセンタイル（秒）を返します。"""
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": rank(50), "p90": rank(90), "p95": rank(95), "p99": rank(99),
+        "max": ordered[-1],
+    }
+
+
+def source_files(work_dir):
+    return sorted(
+        os.path.join(work_dir, name) for name in os.listdir(work_dir)
+        if os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS + [PDF_EXTENSION]
+    )
+
+
+def make_handler(options, manifest=None):
+    return FileHandler(
+        False,
+        thumbnail_time_seconds=1,
+        convert_document=options.pdf_mode,
+        page_duration=5,
+        manifest=manifest,
+        max_workers=options.max_workers,
+        video_backend=options.video_backend,
+    )
+
+
+async def run_startup(work_dir, options, manifest_path):
+    manifest = ThumbnailManifest(manifest_path).load()
+    handler = make_handler(options, manifest)
+    await handler.list_files(work_dir)
+    await handler.scheduler.stop()
+
+
+async def run_live(work_dir, options):
+    handler = make_handler(options)
+    await asyncio.gather(*(handler.handle_created(FileCreatedEvent(path))
+                           for path in source_files(work_dir)))
+    await handler.scheduler.stop()
+
+
+def run_scenario(name, work_dir, options, manifest_path):
+    """シナリオを1回実行し、計測結果を返します。"""
+    files = len(source_files(work_dir))
+    timer, counter, sampler = StageTimer(), SubprocessCounter(), ResourceSampler()
+    timer.install()
+    counter.install()
+    sampler.start()
+    started = time.perf_counter()
+    try:
+        if name == "live":
+            asyncio.run(run_live(work_dir, options))
+        else:
+            asyncio.run(run_startup(work_dir, options, manifest_path))
+    finally:
+        elapsed = time.perf_counter() - started
+        sampler.stop()
+        counter.uninstall()
+        timer.uninstall()
+
+    result = {
+        "files": files,
+        "elapsed_sec": elapsed,
+        "files_per_sec": files / elapsed if elapsed else 0,
+        "latency": {stage: percentiles(values) for stage, values in timer.samples.items()},
+        "peak_rss_mb": sampler.peak_rss / (1024 * 1024),
+        "peak_children": sampler.peak_children,
+        "subprocesses": counter.count,
+    }
+    print(f"{name}: {files} files in {elapsed:.2f}s ({result['files_per_sec']:.1f} files/s), "
+          f"peak RSS {result['peak_rss_mb']:.0f} MB, {counter.count} subprocesses")
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, thresholds):
+    """前回の結果と比較し、しきい値を超えて悪化した項目のリストを返します。"""
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        checks = [("files_per_sec", current["files_per_sec"], previous["files_per_sec"], False),
+                  ("peak_rss_mb", current["peak_rss_mb"], previous["peak_rss_mb"], True),
+                  ("subprocesses", current["subprocesses"], previous["subprocesses"], True)]
+        for stage, latency in current["latency"].items():
+            old = previous.get("latency", {}).get(stage)
+            if old:
+                checks.append((f"latency.{stage}.p95", latency["p95"], old["p95"], True))
+
+        for metric, value, old, higher_is_worse in checks:
+            limit = thresholds.get(metric.split(".")[0], {}).get("max_regression")
+            if limit is None:
+                continue
+            if not old:
+                # 前回が 0 の場合は増加しただけで悪化とみなす
+                change = float("inf") if higher_is_worse and value > 0 else 0
+            else:
+                change = (value - old) / old if higher_is_worse else (old - value) / old
+            if change > limit:
+                regressions.append(f"{name}: {metric} {old:.3f} -> {value:.3f} ({change:+.0%}, limit {limit:.0%})")
+    return regressions
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Thumb Crafter benchmarks')
+    parser.add_argument('--corpus', choices=sorted(CORPORA), default='small',
+                        help='Synthetic corpus to generate and process')
+    parser.add_argument('--scenarios', default=",".join(SCENARIOS),
+                        help=f'Comma separated scenarios ({", ".join(SCENARIOS)})')
+    parser.add_argument('--pdf_mode', choices=['sequence', 'video'], default='sequence',
+                        help='How PDFs are converted during the benchmark')
+    parser.add_argument('--video_backend', choices=['opencv', 'ffmpeg'], default='opencv')
+    parser.add_argument('--max_workers', type=int, default=0,
+                        help='Startup scan concurrency (0 = CPU count)')
+    parser.add_argument('--output', default=None,
+                        help='Write results to this JSON file')
+    parser.add_argument('--baseline', default=None,
+                        help='Compare against a previous results JSON and fail on regressions')
+    parser.add_argument('--thresholds', default=DEFAULT_THRESHOLDS,
+                        help='Regression thresholds JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_arguments(argv)
+    corpus_dir = ensure_corpus(options.corpus)
+    results = {
+        "version": 1,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "platform": {"system": platform.platform(), "python": platform.python_version(),
+                     "cpus": os.cpu_count()},
+        "corpus": options.corpus,
+        "options": {"pdf_mode": options.pdf_mode, "video_backend": options.video_backend,
+                    "max_workers": options.max_workers},
+        "scenarios": {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="thumb-crafter-bench-") as temp_dir:
+        manifest_path = os.path.join(temp_dir, "manifest.json")
+        startup_dir = os.path.join(temp_dir, "startup")
+        for name in options.scenarios.split(","):
+            name = name.strip()
+            if name not in SCENARIOS:
+                raise SystemExit(f"Unknown scenario: {name}")
+            if name == "startup_warm":
+                # 直前の startup_cold の出力とマニフェストを再利用する
+                if not os.path.isdir(startup_dir):
+                    copy_corpus(corpus_dir, startup_dir)
+                    asyncio.run(run_startup(startup_dir, options, manifest_path))
+                work_dir = startup_dir
+            elif name == "startup_cold":
+                work_dir = copy_corpus(corpus_dir, startup_dir)
+            else:
+                work_dir = copy_corpus(corpus_dir, os.path.join(temp_dir, name))
+            results["scenarios"][name] = run_scenario(name, work_dir, options, manifest_path)
+
+    if options.output:
+        with open(options.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {options.output}")
+
+    if options.baseline:
+        with open(options.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(options.thresholds, 'r', encoding='utf-8') as f:
+            thresholds = json.load(f)
+        regressions = compare(results, baseline, thresholds)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
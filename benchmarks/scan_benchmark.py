@@ -0,0 +1,135 @@
+"""
+起動時スキャンのディレクトリ走査のスループット（エントリ/秒）を計測するベンチマーク。
+生成済みの出力（サムネイル、<名前>_sequence フォルダのページ画像）と深い階層を含む合成ツリーを作成し、
+従来の os.walk による走査（すべてのファイルを列挙し、深さは降りた後に判定）と modules.scanner.scan_files を比較します。
+
+    python -m benchmarks.scan_benchmark --directories 200 --output benchmarks/results/scan.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from modules.scanner import scan_files
+from modules.filehandler import VIDEO_EXTENSIONS, PDF_EXTENSION
+
+
+EXTENSIONS = VIDEO_EXTENSIONS + [PDF_EXTENSION]
+
+
+def build_tree(root, directories, videos, documents, pages, depth):
+    """カメラ・日付ごとのフォルダに動画・PDF と生成済みの出力を配置した合成ツリーを作成します。"""
+    for d in range(directories):
+        folder = os.path.join(root, f"2024-{d % 12 + 1:02d}", f"cam{d}")
+        os.makedirs(folder, exist_ok=True)
+        for i in range(videos):
+            touch(os.path.join(folder, f"clip_{i:04d}.mp4"))
+            touch(os.path.join(folder, f"clip_{i:04d}_thumbnail.png"))
+        for i in range(documents):
+            touch(os.path.join(folder, f"doc_{i:03d}.pdf"))
+            touch(os.path.join(folder, f"doc_{i:03d}_thumbnail.png"))
+            sequence = os.path.join(folder, f"doc_{i:03d}_sequence")
+            os.makedirs(sequence, exist_ok=True)
+            for page in range(pages):
+                touch(os.path.join(sequence, f"page-{page:03d}.png"))
+        # 深さの上限を超える階層（誤使用を想定）
+        deep = os.path.join(folder, *[f"level{n}" for n in range(depth)])
+        os.makedirs(deep, exist_ok=True)
+        for i in range(videos):
+            touch(os.path.join(deep, f"deep_{i:04d}.mp4"))
+
+
+def touch(path):
+    with open(path, "wb"):
+        pass
+
+
+def walk_files(start_path):
+    """従来の走査: os.walk ですべてのファイルを列挙し、深さ 4 以下のディレクトリのファイルを返します。"""
+    filelist = []
+    entries = 0
+    for root, dirs, files in os.walk(start_path):
+        entries += len(dirs) + len(files)
+        current_depth = root.count(os.path.sep) - start_path.count(os.path.sep)
+        if current_depth < 5:
+            for file in files:
+                filelist.append(os.path.join(root, file))
+    return filelist, entries
+
+
+def scanner_files(start_path):
+    stats = {}
+    files = scan_files(start_path, EXTENSIONS, stats=stats)
+    return files, stats["entries"]
+
+
+def measure(scan, root, repeat):
+    """走査の時間（最小値）と、返したファイル数・走査したエントリ数を返します。"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        files, entries = scan(root)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(files), entries
+
+
+def run(options):
+    root = tempfile.mkdtemp(prefix="thumb-crafter-scan-")
+    try:
+        build_tree(root, options.directories, options.videos, options.documents, options.pages, options.depth)
+        # ツリー全体のエントリ数（プルーニングで降りなかった分も含む）
+        _, tree_entries = walk_files(root)
+        results = {}
+        for name, scan in (("os_walk", walk_files), ("scandir", scanner_files)):
+            elapsed, files, entries = measure(scan, root, options.repeat)
+            results[name] = {
+                "elapsed_sec": elapsed,
+                "entries": entries,
+                "files": files,
+                "entries_per_sec": entries / elapsed if elapsed else 0,
+                # ツリー全体を処理し終えるまでの実効スループット
+                "tree_entries_per_sec": tree_entries / elapsed if elapsed else 0,
+            }
+            print(f"{name:>8}: {entries}/{tree_entries} entries, {files} files in {elapsed * 1000:.1f} ms "
+                  f"({results[name]['entries_per_sec']:.0f} entries/s, "
+                  f"{results[name]['tree_entries_per_sec']:.0f} tree entries/s)")
+        return results
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Thumb Crafter startup scan benchmark')
+    parser.add_argument('--directories', type=int, default=200,
+                        help='Number of leaf folders in the synthetic tree')
+    parser.add_argument('--videos', type=int, default=20,
+                        help='Videos (each with a generated thumbnail) per folder')
+    parser.add_argument('--documents', type=int, default=2,
+                        help='PDFs (each with a generated _sequence folder) per folder')
+    parser.add_argument('--pages', type=int, default=50,
+                        help='Page images in each _sequence folder')
+    parser.add_argument('--depth', type=int, default=6,
+                        help='Depth of the nested folders below each leaf folder')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Repeat each measurement and keep the fastest run')
+    parser.add_argument('--output', default=None,
+                        help='Write the results as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_arguments(argv)
+    results = run(options)
+    if options.output:
+        os.makedirs(os.path.dirname(os.path.abspath(options.output)), exist_ok=True)
+        with open(options.output, 'w', encoding='utf-8') as f:
+            json.dump({"options": vars(options), "results": results}, f, indent=2)
+        print(f"Results written to {options.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+通知のワイヤ形式ごとのエンコード時間とイベントあたりのバイト数を比較するベンチマーク。
+Notifier が作成する delta（バッチの大きさ別）とスナップショットのメッセージを、
+従来の形式（pickle した JSON 文字列）と binary（圧縮なし・zlib 圧縮あり）でエンコードします。
+
+    python -m benchmarks.wire_benchmark --files 5000 --output benchmarks/results/wire.json
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import argparse
+from modules.notification import Notifier, OP_ADD, KIND_FILE
+from utils.communication.wire import encode_json, encode_binary, COMPRESS_THRESHOLD
+from utils.communication.wire_decoder import decode
+
+
+ROOT = os.path.join(os.sep, "media", "library")
+
+# 形式名 -> メッセージ（辞書）を送信するバイト列に変換する関数
+FORMATS = {
+    "json_pickle": lambda message: pickle.dumps(encode_json(message)),
+    "binary": lambda message: encode_binary(message, ROOT, compress_threshold=None),
+    "binary_zlib": lambda message: encode_binary(message, ROOT, COMPRESS_THRESHOLD),
+}
+
+
+class Capture:
+    def __init__(self):
+        self.messages = []
+
+    def send_message(self, ip, port, message):
+        self.messages.append(message)
+
+
+def synthetic_paths(count, per_directory=200):
+    """日付・カメラごとのフォルダに分かれた動画ファイルのパスを作成します。"""
+    return [os.path.join(ROOT, f"2024-{i // per_directory % 12 + 1:02d}", f"cam{i // per_directory}",
+                         f"clip_{i:06d}.mp4") for i in range(count)]
+
+
+def event_for(path):
+    base = os.path.splitext(path)[0]
+    return {"type": "created", "path": path,
+            "renditions": {"thumbnail": f"{base}_thumbnail.png", "list": f"{base}_list.jpeg"}}
+
+
+def build_messages(paths, batch_size):
+    """Notifier で delta メッセージを作成し、(メッセージ, イベント数) のリストを返します。"""
+    capture = Capture()
+    notifier = Notifier(capture, "localhost", 0, lambda: (paths, []), encode=lambda message: message)
+    for start in range(0, len(paths), batch_size):
+        for path in paths[start:start + batch_size]:
+            notifier.record(OP_ADD, KIND_FILE, path)
+            with notifier.lock:
+                notifier.events.append(event_for(path))
+        notifier.flush()
+    return [(message, len(message["events"])) for message in capture.messages]
+
+
+def build_snapshot(paths):
+    capture = Capture()
+    notifier = Notifier(capture, "localhost", 0, lambda: (paths, []), encode=lambda message: message)
+    notifier.send_snapshot("startup")
+    return [(message, len(message["files"])) for message in capture.messages]
+
+
+def measure(encode, messages, repeat):
+    """メッセージをすべてエンコードする時間（最小値）と合計バイト数を返します。"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = sum(len(encode(message)) for message, _ in messages)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, size
+
+
+def run(options):
+    paths = synthetic_paths(options.files)
+    cases = {f"delta_batch_{size}": build_messages(paths, size) for size in options.batch_sizes}
+    cases["snapshot"] = build_snapshot(paths)
+
+    # デコード結果が元のメッセージと一致することを確認する
+    for messages in cases.values():
+        for message, _ in messages[:10]:
+            assert decode(FORMATS["binary_zlib"](message)) == message
+
+    results = {}
+    for case, messages in cases.items():
+        items = sum(count for _, count in messages)
+        results[case] = {}
+        for name, encode in FORMATS.items():
+            elapsed, size = measure(encode, messages, options.repeat)
+            results[case][name] = {
+                "messages": len(messages),
+                "items": items,
+                "bytes": size,
+                "bytes_per_item": size / items,
+                "encode_us_per_item": elapsed / items * 1e6,
+            }
+            print(f"{case:>16} {name:>12}: {size / items:8.1f} bytes/item, "
+                  f"{elapsed / items * 1e6:7.2f} us/item")
+    return results
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Thumb Crafter wire format benchmark')
+    parser.add_argument('--files', type=int, default=5000,
+                        help='Number of synthetic file paths')
+    parser.add_argument('--batch_sizes', type=lambda s: [int(v) for v in s.split(",")], default=[1, 20, 100],
+                        help='Comma separated number of events per delta message')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Repeat each measurement and keep the fastest run')
+    parser.add_argument('--output', default=None,
+                        help='Write the results as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_arguments(argv)
+    results = run(options)
+    if options.output:
+        os.makedirs(os.path.dirname(os.path.abspath(options.output)), exist_ok=True)
+        with open(options.output, 'w', encoding='utf-8') as f:
+            json.dump({"files": options.files, "results": results}, f, indent=2)
+        print(f"Results written to {options.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,32 @@
 import os
 import sys
+import json
 import asyncio
 import logging
+import multiprocessing
 from utils.logwriter import setup_logging
 from PyQt5.QtWidgets import QApplication, QMessageBox
 from PyQt5.QtCore import QTimer
 from watchdog.observers import Observer
-from modules.filehandler import FileHandler
+from modules.filehandler import FileHandler, MAIN_LOOP, run_in_main_loop, registry
 from modules.config_manager import ConfigManager
-from utils.communication.udp_client import DelayedUDPSender as DelayedUDPSenderUDP, hello_server as hello_server_udp
-from utils.communication.tcp_client import DelayedTCPSender as DelayedTCPSenderTCP, hello_server as hello_server_tcp
+from modules.manifest import ThumbnailManifest
+from modules.scheduler import JobScheduler
+from modules.fileConvert_pdf import configure_render_pool
+from modules.metrics import METRICS
+from modules.profiler import PROFILER, profile_command
+from modules.notification import UDP_MAX_MESSAGE_BYTES
+from modules.pubsub import SubscriptionHub
+from modules.registry import is_under
+from modules.queries import QueryCommands
+from modules.polling_observer import PollingObserver
+from modules.output_tracker import OUTPUTS
+from modules.config_reload import SENDER_KEYS, RESTART_KEYS, changed_keys, diff_roots
+from utils.communication.udp_client import UDPSender, hello_server as hello_server_udp
+from utils.communication.tcp_client import TCPSender, hello_server as hello_server_tcp
+from utils.communication.tcp_stream import PersistentTCPSender
 from utils.communication.ipc_client import check_existing_instance
-from utils.communication.ipc_server import start_server
+from utils.communication.ipc_server import start_server, register_command, register_stream, parse_options, set_key
 from utils.multiple_pid import block_global_instance
 from tray.tray_icon import TrayIcon
 
@@ -21,9 +36,17 @@ setup_logging()
 class ThumbCrafter:
     def __init__(self):
         self.observer = None
-        self.event_handler = None
+        self.event_handlers = []
+        # 監視中のルートごとの設定と、オブザーバーの監視（ルート -> ObservedWatch）
+        self.roots = []
+        self.watches = {}
         self.server_task = None
-        self.sender = None
+        # 通知先 (protocol, ip, port[, TCPの送信設定]) -> 送信クライアント
+        self.senders = {}
+        # 設定の再読み込みを1つずつ実行する
+        self.reload_lock = asyncio.Lock()
+        self.hub = None
+        self.queries = None
         self.loop = None
         self.tray = None  # TrayIconを初期化して保持
         try:
@@ -38,15 +61,17 @@ class ThumbCrafter:
             print(f"Error during initialization: {e}")
             self.config = {}
 
+        # 変換ジョブのスケジューラ（再起動しても共有する）
+        self.scheduler = JobScheduler(self.config.get('job_limits'))
+        # PDFページのレンダリングに使用するプロセス数
+        configure_render_pool(self.config.get('pdf_render_processes', 0))
+        PROFILER.configure(self.config.get('profile', False), self.config.get('profile_sample_rate', 1))
+
         # デフォルトターゲットディレクトリの設定
         if not self.config['target']:
             self.config['target'] = os.path.abspath(
                 os.path.join(os.getcwd(), os.pardir))
 
-        # ターゲットディレクトリが存在しない場合は作成
-        if not os.path.exists(self.config['target']):
-            os.makedirs(self.config['target'])
-
     async def start(self):
         try:
             if self.config.get('single_instance_only', True):  # 重複起動を禁止
@@ -59,7 +84,11 @@ class ThumbCrafter:
                     )
                     return False
 
-            if check_existing_instance(12321, self.config['target']):
+            roots = self.roots = self.root_configs()
+            targets = [root['target'] for root in roots]
+            # 監視対象のキー（複数のルートの場合は "|" で連結）
+            instance_key = "|".join(targets)
+            if check_existing_instance(12321, instance_key):
                 self.show_error_dialog(
                     "既に同じターゲットで動作中です",
                     None,
@@ -68,69 +97,281 @@ class ThumbCrafter:
                 )
                 return False
 
-            # 通信プロトコルの設定
-            if self.config['protocol'] == 'udp' or (self.config['protocol'] is None and self.config.get('ip')):
-                self.sender = DelayedUDPSenderUDP(self.config['send_interval'])
-                hello_server = hello_server_udp
-            elif self.config['protocol'] == 'tcp':
-                self.sender = DelayedTCPSenderTCP(self.config['send_interval'])
-                hello_server = hello_server_tcp
-            else:
-                self.sender = None
-                def hello_server(x): return None
-
-            # FileHandlerの初期化
-            self.event_handler = FileHandler(
-                self.sender,
-                self.config['ignore_subfolders'],
-                self.config['ip'],
-                self.config['port'],
-                self.config['thumbnail_time_seconds'],
-                self.config['convert_slide'],
-                self.config['convert_document'],
-                self.config['page_duration']
-            )
+            # IPC の SUBSCRIBE で接続した購読者への配信（すべてのルートで共有）
+            self.hub = SubscriptionHub(
+                registry.snapshot, common_root(targets), self.config.get('subscriber_queue_size', 256))
 
-            # サーバー通信の開始
-            if self.sender:
-                response = hello_server(self.config['target'])
-                if response == "overlapping":
-                    return False
+            # ルートディレクトリごとに FileHandler を作成する（スケジューラ・ジョブの同時実行数は共有）
+            self.senders = {}
+            self.event_handlers = []
+            for root in roots:
+                sender, hello_server = self.create_sender(root)
+                self.event_handlers.append(self.create_handler(root, sender))
 
-            # 初期ファイル処理
-            print(f"Initializing file handler for directory: {
-                self.config['target']}")
-            await self.event_handler.list_files(self.config['target'])
-
-            # オブザーバーの開始
-            self.observer = Observer()
-            self.observer.schedule(
-                self.event_handler,
-                self.config['target'],
-                recursive=not self.config['ignore_subfolders']
-            )
-            print(f"Starting observer on directory: {self.config['target']}")
+                # サーバー通信の開始
+                if sender:
+                    response = hello_server(root['target'])
+                    if response == "overlapping":
+                        return False
+
+            # 初期ファイル処理（すべてのルートを並行してスキャンする）
+            for target in targets:
+                print(f"Initializing file handler for directory: {target}")
+            await asyncio.gather(*(handler.list_files(handler.root) for handler in self.event_handlers))
+
+            # オブザーバーの開始（1つのオブザーバーですべてのルートを監視する）
+            self.observer = self.create_observer()
+            self.watches = {}
+            for root, handler in zip(roots, self.event_handlers):
+                self.watches[root['target']] = self.observer.schedule(
+                    handler,
+                    root['target'],
+                    recursive=not root['ignore_subfolders']
+                )
+                print(f"Starting observer on directory: {root['target']}")
             self.observer.start()
 
             # IPCサーバーの開始（非同期タスクとして起動し、バックグラウンドで実行）
+            register_command("METRICS", lambda args: METRICS.render())
+            register_command("PROFILE", profile_command)
+            register_command("SNAPSHOT", self.snapshot_command)
+            register_command("RESYNC", self.resync_command)
+            register_stream("SUBSCRIBE", self.hub.serve)
+            self.queries = QueryCommands(self.event_handlers, registry, self.scheduler)
+            self.queries.register(register_command)
             self.server_task = asyncio.create_task(
-                start_server(12321, self.config['target']))
+                start_server(12321, instance_key, self.config.get('ipc_bind', 'localhost')))
 
             return True
 
-        except FileNotFoundError:
+        except FileNotFoundError as e:
             self.show_error_dialog(
                 "見つかりません",
-                f"{self.config['target']}",
+                f"{e.filename or self.config['target']}",
                 2000,
                 exit_handler
             )
-            print(f"Error: ターゲットディレクトリが見つかりません: {self.config['target']}")
+            print(f"Error: ターゲットディレクトリが見つかりません: {e.filename or self.config['target']}")
             return False
         except Exception as e:
             print(f"Error: {str(e)}")
             return False
 
+    def root_configs(self):
+        """
+        ルートディレクトリごとの設定のリストを返します。
+        設定ファイルの targets の各要素（ディレクトリのパス、または target を含む辞書）は、
+        指定しなかった項目に全体の設定を使用します。targets がない場合は target のみを監視します。
+        """
+        base = {key: value for key, value in self.config.items() if key != 'targets'}
+        roots = []
+        for entry in self.config.get('targets') or [{}]:
+            if isinstance(entry, str):
+                entry = {'target': entry}
+            root = {**base, **entry}
+            root['target'] = os.path.abspath(root['target'] or self.config['target'])
+            overlapping = [other['target'] for other in roots
+                           if is_under(root['target'], other['target']) or is_under(other['target'], root['target'])]
+            if overlapping:
+                # 同じファイルを二重に処理しないよう、重なるルートは監視しない
+                logging.error(f"Skipping target {root['target']}: overlaps {overlapping[0]}")
+                continue
+            # ターゲットディレクトリが存在しない場合は作成
+            if not os.path.exists(root['target']):
+                os.makedirs(root['target'])
+            roots.append(root)
+        return roots
+
+    def create_observer(self):
+        """watch_mode に応じたオブザーバーを返します（polling はネットワーク共有向けの定期スキャン）。"""
+        # ログは監視対象の中に置かれることがあるため、常にイベントを破棄する
+        OUTPUTS.exclude('./logs')
+        if self.config.get('watch_mode', 'native') == 'polling':
+            # ポーリングでは既存ファイルの上書き（サムネイル、シーケンスフォルダのページ画像の再生成）は
+            # フルスキャンでのみ検出されるため、書き込みのイベントは最大でフルスキャンの間隔と
+            # ポーリング間隔（スキャンの開始の遅れとスキャン時間の分を含めて2回分）だけ遅れて届く
+            OUTPUTS.grace = max(OUTPUTS.grace, self.config.get('poll_full_scan_interval', 300)
+                                + 2 * self.config.get('poll_max_interval', 60))
+            return PollingObserver(
+                self.config.get('poll_interval', 5),
+                self.config.get('poll_max_interval', 60),
+                self.config.get('poll_full_scan_interval', 300))
+        return Observer()
+
+    def create_sender(self, root):
+        """ルートの通知先に送信するクライアントと hello_server を返します（同じ通知先のルートは共有する）。"""
+        protocol = root.get('protocol')
+        if protocol == 'udp' or (protocol is None and root.get('ip')):
+            protocol, hello_server = 'udp', hello_server_udp
+        elif protocol == 'tcp':
+            hello_server = hello_server_tcp
+        else:
+            return None, None
+        route = (protocol, root['ip'], root['port'])
+        if protocol == 'tcp':
+            # 送信設定が変わった場合は新しい送信クライアントを作成する
+            route += (root.get('tcp_persistent', True), root.get('tcp_queue_size', 1000), root.get('tcp_overflow', 'drop_oldest'))
+        if route not in self.senders:
+            if protocol == 'udp':
+                self.senders[route] = UDPSender()
+            elif root.get('tcp_persistent', True):
+                # 接続を維持し、長さ付きフレームで送信する
+                self.senders[route] = PersistentTCPSender(
+                    MAIN_LOOP,
+                    queue_size=root.get('tcp_queue_size', 1000),
+                    overflow=root.get('tcp_overflow', 'drop_oldest'),
+                    name=f"{root['ip']}:{root['port']}")
+            else:
+                self.senders[route] = TCPSender()
+        return self.senders[route], hello_server
+
+    def create_handler(self, root, sender):
+        # 生成済み出力のマニフェスト（ルートごと）
+        manifest = None
+        if root.get('manifest', True):
+            manifest = ThumbnailManifest.for_target(
+                root['target'],
+                use_fingerprint=root.get('manifest_fingerprint', False)
+            ).load()
+            # マニフェストの保存（一時ファイルからの置き換え）のイベントを破棄する
+            OUTPUTS.exclude(manifest.path)
+            OUTPUTS.exclude(f"{manifest.path}.tmp")
+
+        return FileHandler(
+            root['ignore_subfolders'],
+            sender=sender,
+            ip=root['ip'],
+            port=root['port'],
+            thumbnail_time_seconds=root['thumbnail_time_seconds'],
+            convert_slide=root['convert_slide'],
+            convert_document=root['convert_document'],
+            page_duration=root['page_duration'],
+            manifest=manifest,
+            max_workers=root.get('max_workers', 0),
+            quiet_period=root.get('quiet_period', 2.0),
+            scheduler=self.scheduler,
+            video_backend=root.get('video_backend', 'opencv'),
+            renditions=root.get('renditions'),
+            notify_format=root.get('notify_format', 'delta'),
+            max_message_bytes=max_message_bytes(sender),
+            send_interval=root['send_interval'],
+            send_max_delay=root.get('send_max_delay', 5),
+            send_max_batch=root.get('send_max_batch', 100),
+            wire=root.get('wire', 'json'),
+            root=root['target'],
+            hub=self.hub
+        )
+
+    def apply_config(self, config):
+        """
+        設定を変更し、変更された項目のみを再起動せずに反映します（トレイの設定ダイアログから呼び出す）。
+        反映はバックグラウンドのイベントループで行い、完了を待ちません。
+        """
+        future = asyncio.run_coroutine_threadsafe(self.reload(config), MAIN_LOOP)
+        future.add_done_callback(report_reload)
+
+    async def reload(self, config):
+        """
+        変更前後のルートごとの設定を比較し、差分のみを反映します。
+        ファイルのスキャンは追加されたルートと、新たに監視対象になったサブフォルダのみで行います。
+        """
+        async with self.reload_lock:
+            config = {**self.config, **config}
+            if not config.get('target'):
+                config['target'] = self.config['target']
+            keys = changed_keys(self.config, config)
+            restart_keys = keys.intersection(RESTART_KEYS)
+            if restart_keys:
+                logging.warning(f"Settings applied at the next start: {', '.join(sorted(restart_keys))}")
+            if keys & {'profile', 'profile_sample_rate'}:
+                PROFILER.configure(config.get('profile', False), config.get('profile_sample_rate', 1))
+            self.config = config
+            if self.observer is None:
+                return
+
+            roots = self.root_configs()
+            added, removed, changed = diff_roots(self.roots, roots)
+            self.roots = roots
+            handlers = {handler.root: handler for handler in self.event_handlers}
+            scans = []
+
+            for root in removed:
+                handler = handlers[root['target']]
+                self.observer.unschedule(self.watches.pop(root['target']))
+                handler.release()
+                handler.destroy("[Exit] Target removed")
+                # QueryCommands と同じリストを参照しているため、リストを置き換えずに更新する
+                self.event_handlers.remove(handler)
+                print(f"Stopped observer on directory: {root['target']}")
+
+            for old, root, root_keys in changed:
+                handler = handlers[root['target']]
+                if root_keys.intersection(SENDER_KEYS):
+                    sender, hello_server = self.create_sender(root)
+                    handler.set_sender(sender, root['ip'], root['port'], root.get('notify_format', 'delta'),
+                                       max_message_bytes(sender), root.get('wire', 'json'))
+                    if sender:
+                        hello_server(root['target'])
+                if 'ignore_subfolders' in root_keys:
+                    self.observer.unschedule(self.watches[root['target']])
+                    self.watches[root['target']] = self.observer.schedule(
+                        handler, root['target'], recursive=not root['ignore_subfolders'])
+                    scans.append(handler.change_scope(root['ignore_subfolders']))
+                extensions = handler.reconfigure(root)
+                if extensions:
+                    scans.append(handler.reprocess(extensions))
+
+            for root in added:
+                sender, hello_server = self.create_sender(root)
+                handler = self.create_handler(root, sender)
+                self.event_handlers.append(handler)
+                if sender:
+                    hello_server(root['target'])
+                self.watches[root['target']] = self.observer.schedule(
+                    handler, root['target'], recursive=not root['ignore_subfolders'])
+                scans.append(handler.list_files(handler.root))
+                print(f"Starting observer on directory: {root['target']}")
+
+            await self.close_unused_senders()
+            targets = [root['target'] for root in roots]
+            self.hub.root = common_root(targets)
+            set_key("|".join(targets))
+            logging.info(f"Config reloaded: {len(added)} added, {len(removed)} removed, {len(changed)} changed target(s)")
+
+        # 再生成・スキャンは次の再読み込みを待たせないようにロックの外で行う
+        await asyncio.gather(*scans)
+
+    async def close_unused_senders(self):
+        """どのルートからも使われなくなった送信クライアントを閉じます。"""
+        used = [handler.sender for handler in self.event_handlers]
+        for route, sender in list(self.senders.items()):
+            if not any(sender is other for other in used):
+                del self.senders[route]
+                if isinstance(sender, (PersistentTCPSender, TCPSender)):
+                    await sender.aclose()
+
+    def handlers_for(self, args):
+        """IPCコマンドの root=<パス> で指定したルートのハンドラ（指定しない場合はすべて）を返します。"""
+        root = parse_options(args).get('root')
+        if root is None:
+            return self.event_handlers
+        handler = self.queries.handler_for(root)
+        if handler is None:
+            raise LookupError(f"Unknown root: {root}")
+        return [handler]
+
+    def snapshot_command(self, args):
+        """IPC の SNAPSHOT [root=<パス>] コマンド: ルートごとのスナップショットを1行ずつ応答として返します。"""
+        return "".join(json.dumps(handler.notifier.snapshot("request")) + "\n"
+                       for handler in self.handlers_for(args))
+
+    def resync_command(self, args):
+        """IPC の RESYNC [root=<パス>] コマンド: 通知の送信先にスナップショットを再送します。"""
+        handlers = self.handlers_for(args)
+        for handler in handlers:
+            handler.notifier.send_snapshot("resync")
+        return "OK " + " ".join(str(handler.notifier.seq) for handler in handlers) + "\n"
+
     def show_error_dialog(self, message, details=None, timeout=2000, exit_handler=None):
         """エラーダイアログを表示"""
         msg = QMessageBox()
@@ -154,14 +395,44 @@ class ThumbCrafter:
         if self.observer:
             self.observer.stop()
             self.observer.join()
-        if self.event_handler:
-            self.event_handler.destroy("[Exit] Normal")
+        for handler in self.event_handlers:
+            handler.destroy("[Exit] Normal")
+        for sender in self.senders.values():
+            if isinstance(sender, (PersistentTCPSender, TCPSender)):
+                # 終了メッセージを含む送信待ちのメッセージを送ってから切断する
+                sender.close()
+        if self.hub:
+            # 購読者の接続を閉じる
+            MAIN_LOOP.call_soon_threadsafe(self.hub.close)
         if self.server_task:
-            self.server_task.cancel()
+            # サーバータスクはバックグラウンドのイベントループ上で動作している
+            MAIN_LOOP.call_soon_threadsafe(self.server_task.cancel)
+        # 実行中・待機中の変換ジョブを破棄
+        MAIN_LOOP.call_soon_threadsafe(self.scheduler.cancel_all)
 
     def restart(self):
         self.stop()
-        asyncio.run(self.start())
+        run_in_main_loop(self.start())
+
+
+def max_message_bytes(sender):
+    # UDPは1データグラムに収まるようにメッセージを分割する
+    return UDP_MAX_MESSAGE_BYTES if isinstance(sender, UDPSender) else None
+
+
+def report_reload(future):
+    try:
+        future.result()
+    except Exception as e:
+        logging.error(f"Failed to reload config: {e}")
+
+
+def common_root(targets):
+    """すべてのルートを含むディレクトリを返します（ドライブが異なる場合は空文字列）。"""
+    try:
+        return os.path.commonpath(targets)
+    except ValueError:
+        return ""
 
 
 def exit_handler(reason, thumb_crafter):
@@ -183,7 +454,7 @@ def main():
 
     try:
         while True:
-            if asyncio.run(thumb_crafter.start()):
+            if run_in_main_loop(thumb_crafter.start()):
                 print("Tray icon initialized")
                 timer = QTimer()
                 timer.timeout.connect(lambda: None)  # キープアライブ用タイマー
@@ -203,4 +474,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # PyInstallerでexe化した場合にPDFレンダリング用のワーカープロセスを起動できるようにする
+    multiprocessing.freeze_support()
     main()
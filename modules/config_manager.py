@@ -9,16 +9,47 @@ from utils.solvepath import exe_path
 class ConfigManager:
     DEFAULT_CONFIG = {
         'target': '',
+        'targets': [],  # 複数のディレクトリを監視する場合のルートごとの設定（指定しない項目は全体の設定を使用）
         'ignore_subfolders': False,
         'protocol': 'none',
         'ip': 'localhost',
         'port': 12345,
-        'send_interval': 1,  # UDP送信の間隔
+        'send_interval': 1,  # 最後のイベントからこの秒数だけ無更新が続いたらまとめて送信
+        'send_max_delay': 5,  # イベントが途切れない場合も最初のイベントからこの秒数で送信
+        'send_max_batch': 100,  # 保留中のイベントがこの件数に達したら送信
+        'tcp_persistent': True,  # TCPの接続を維持し長さ付きフレームで送信（False の場合は送信ごとに接続）
+        'tcp_queue_size': 1000,  # TCP送信待ちのメッセージの上限
+        'tcp_overflow': 'drop_oldest',  # 上限を超えた場合に "drop_oldest"（古いものを破棄）または "drop_newest"
         'thumbnail_time_seconds': 1,  # 動画の何秒目をサムネイルに書き出すか
         "convert_slide": "none",      # スライド（PPT）を処理しない "none", または "video", "sequence" に変換
         "convert_document": "none",  # 電子文書（PDF）を処理しない "none", または "video", "sequence" に変換
         "page_duration": 5,
-        'single_instance_only': False  # デフォルトで多重起動防止を無効
+        'single_instance_only': False,  # デフォルトで多重起動防止を無効
+        'manifest': True,  # 生成済み出力を記録し、起動時に変更のないファイルをスキップ
+        'manifest_fingerprint': False,  # 更新日時が変わった場合に内容のフィンガープリントで同一性を確認
+        'max_workers': 0,  # 起動時スキャンの同時実行数（0 の場合はCPU数）
+        'quiet_period': 2.0,  # ファイルのサイズと更新日時がこの秒数変化しなければ書き込み完了とみなす
+        'watch_mode': 'native',  # ファイルの監視方法 "native"（OSのイベント）または "polling"（ネットワーク共有向けの定期スキャン）
+        'poll_interval': 5,  # polling の最短のスキャン間隔（秒）。ツリーが大きくスキャンに時間がかかる場合は延長
+        'poll_max_interval': 60,  # polling のスキャン間隔の上限（秒）
+        'poll_full_scan_interval': 300,  # polling で更新日時の変わらないディレクトリも含めてすべて確認する間隔（秒）
+        'video_backend': 'opencv',  # 動画のデコード方法 "opencv"（プロセス内）または "ffmpeg"
+        'pdf_render_processes': 0,  # PDFページをレンダリングするプロセス数（0 の場合はCPU数）
+        'renditions': [  # サムネイルの出力（名前、長辺の最大ピクセル数（0 は元のサイズ）、形式 png/jpeg/webp、品質）
+            {'name': 'thumbnail', 'max_size': 0, 'format': 'png'}
+        ],
+        'wire': 'json',  # 通知のワイヤ形式 "json"（pickleしたJSON文字列）または "binary"（長さ付きのバイナリフレーム）
+        'subscriber_queue_size': 256,  # IPC の SUBSCRIBE の購読者ごとの送信待ちメッセージの上限
+        'ipc_bind': 'localhost',  # IPCポート（12321）で待ち受けるアドレス（"0.0.0.0" の場合は他のホストの受信側からも RESYNC などを送信できる）
+        'notify_format': 'delta',  # 通知の形式 "delta"（スナップショット＋連番付きの差分）または "legacy"（毎回ファイルリスト全体）
+        'profile': False,  # 変換ジョブを cProfile/tracemalloc で計測し ./logs/profiles/ に出力
+        'profile_sample_rate': 1,  # プロファイリング中に N 件に1件のジョブを計測
+        'job_limits': {  # ジョブの種類ごとの同時実行数
+            'video': 4,   # 動画の長さ取得・サムネイル生成
+            'pdf': 2,     # PDFページのレンダリング
+            'office': 1,  # PowerPoint/LibreOfficeによる変換
+            'encode': 1   # 動画エンコード
+        }
     }
 
     def __init__(self, app_name="thumb-crafter"):
@@ -84,7 +115,7 @@ class ConfigManager:
         parser.add_argument('--port', default=None, type=int,
                             help='Port number to send the messages')
         parser.add_argument('--send_interval', default=None, type=int,
-                            help='Delay in seconds for sending messages')
+                            help='Send pending notification events after this many quiet seconds')
         parser.add_argument('--protocol', choices=['none', 'udp', 'tcp'], default=None,
                             help='Communication protocol to use (none, udp, tcp)')
         parser.add_argument('--convert_slide', choices=['none', 'video', 'sequence'],
@@ -93,6 +124,40 @@ class ConfigManager:
                             default=None,  help='Process documents as video or sequence')
         parser.add_argument('--page_duration', default=None,
                             type=int,  help='Duration of each page in seconds')
+        parser.add_argument('--no_manifest', dest='manifest', action='store_false', default=None,
+                            help='Disable the thumbnail manifest and regenerate every output at startup')
+        parser.add_argument('--manifest_fingerprint', action='store_true', default=None,
+                            help='Verify unchanged files by a fast content fingerprint when only mtime differs')
+        parser.add_argument('--max_workers', default=None, type=int,
+                            help='Maximum number of concurrent jobs during the startup scan (0 = CPU count)')
+        parser.add_argument('--quiet_period', default=None, type=float,
+                            help='Seconds a file must stay unchanged before it is processed')
+        parser.add_argument('--watch_mode', choices=['native', 'polling'], default=None,
+                            help='Watch with native file system events, or poll with directory snapshots (for SMB/NFS shares)')
+        parser.add_argument('--poll_interval', default=None, type=float,
+                            help='Minimum seconds between polling scans (extended for large trees)')
+        parser.add_argument('--video_backend', choices=['opencv', 'ffmpeg'], default=None,
+                            help='Decode video thumbnails in-process with OpenCV or with ffmpeg subprocesses')
+        parser.add_argument('--pdf_render_processes', default=None, type=int,
+                            help='Number of worker processes for PDF page rendering (0 = CPU count)')
+        parser.add_argument('--notify_format', choices=['delta', 'legacy'], default=None,
+                            help='Send a snapshot followed by sequenced deltas, or the full file list on every event')
+        parser.add_argument('--wire', choices=['json', 'binary'], default=None,
+                            help='Encode notifications as pickled JSON strings or compact length-prefixed binary frames')
+        parser.add_argument('--send_max_delay', default=None, type=float,
+                            help='Maximum seconds to hold notification events before sending')
+        parser.add_argument('--send_max_batch', default=None, type=int,
+                            help='Send notification events as soon as this many are pending')
+        parser.add_argument('--tcp_queue_size', default=None, type=int,
+                            help='Maximum number of messages waiting on the persistent TCP connection')
+        parser.add_argument('--tcp_overflow', choices=['drop_oldest', 'drop_newest'], default=None,
+                            help='Which message to drop when the TCP send queue is full')
+        parser.add_argument('--ipc_bind', default=None,
+                            help='Address the IPC port listens on (e.g. 0.0.0.0 to accept RESYNC from remote receivers)')
+        parser.add_argument('--profile', action='store_true', default=None,
+                            help='Profile conversion jobs and write the results to ./logs/profiles')
+        parser.add_argument('--profile_sample_rate', default=None, type=int,
+                            help='Profile one in N conversion jobs')
 
         return vars(parser.parse_args())
 
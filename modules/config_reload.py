@@ -0,0 +1,41 @@
+"""
+設定の変更を再起動せずに反映するための差分。
+変更された設定項目を次のように分類し、ルートディレクトリ（target）ごとに必要な処理だけを行います。
+
+    通知先（SENDER_KEYS）:   送信クライアントを差し替え、新しい通知先にスナップショットを送信する
+    送信のタイミング・変換:   FileHandler.reconfigure で更新し、出力が変わる種類のファイルのみ再生成する
+    監視範囲（SCAN_KEYS）:    追加されたルート・新たに監視対象になったサブフォルダのみをスキャンする
+    RESTART_KEYS:            次回の起動時に反映する
+"""
+
+
+SENDER_KEYS = ("protocol", "ip", "port", "tcp_persistent", "tcp_queue_size", "tcp_overflow", "wire", "notify_format")
+SCAN_KEYS = ("target", "ignore_subfolders")
+# プロセス全体で共有しているため、実行中には変更できない設定
+RESTART_KEYS = ("job_limits", "pdf_render_processes", "manifest", "manifest_fingerprint",
+                "subscriber_queue_size", "single_instance_only", "ipc_bind",
+                "watch_mode", "poll_interval", "poll_max_interval", "poll_full_scan_interval")
+
+
+def changed_keys(old, new):
+    """値が変わった設定項目の集合を返します。"""
+    return {key for key in old.keys() | new.keys() if old.get(key) != new.get(key)}
+
+
+def diff_roots(old_roots, new_roots):
+    """
+    ルートごとの設定のリストを target で対応付け、(追加されたルート, 削除されたルート, 変更されたルート) を返します。
+    変更されたルートは (変更前の設定, 変更後の設定, 変更された項目の集合) のリストです。
+    """
+    old_by_target = {root['target']: root for root in old_roots}
+    new_by_target = {root['target']: root for root in new_roots}
+    added = [root for target, root in new_by_target.items() if target not in old_by_target]
+    removed = [root for target, root in old_by_target.items() if target not in new_by_target]
+    changed = []
+    for target, root in new_by_target.items():
+        old = old_by_target.get(target)
+        if old is not None:
+            keys = changed_keys(old, root)
+            if keys:
+                changed.append((old, root, keys))
+    return added, removed, changed
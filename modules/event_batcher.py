@@ -0,0 +1,93 @@
+"""
+通知するイベントをまとめて送信するタイミングを決めます（イベントループのタイマーを使用し、スレッドは起動しません）。
+次のいずれかの時点で flush を呼び出し、保留中のイベントをすべて1回の送信にまとめます。
+
+    quiet_period: 最後のイベントからこの秒数だけ新しいイベントがない
+    max_delay:    最初のイベントからこの秒数が経過した（イベントが途切れない場合でも送信する）
+    max_batch:    保留中のイベントがこの件数に達した
+
+イベントは flush 側（Notifier）に保持されるため、タイマーを延長しても破棄されません。
+"""
+import time
+import asyncio
+from modules.metrics import METRICS
+
+
+class EventBatcher:
+    def __init__(self, flush, loop, quiet_period=1.0, max_delay=5.0, max_batch=100):
+        # flush: 保留中のイベントをすべて送信する関数（例: Notifier.flush）
+        self.flush = flush
+        self.loop = loop
+        self.count = 0
+        self.first = None
+        self.last = None
+        self.timer = None
+        self.configure(quiet_period, max_delay, max_batch)
+
+    def configure(self, quiet_period, max_delay, max_batch):
+        """送信のタイミングを変更します（保留中のイベントには次のイベントから適用されます）。"""
+        self.quiet_period = max(0.0, quiet_period)
+        self.max_delay = max(self.quiet_period, max_delay)
+        self.max_batch = max(1, max_batch)
+
+    def add(self, count=1):
+        """イベントが保留されたことを通知します。イベントループ以外のスレッドからも呼び出せます。"""
+        if self.in_loop_thread() or not self.loop.is_running():
+            self.schedule(count)
+        else:
+            self.loop.call_soon_threadsafe(self.schedule, count)
+
+    def in_loop_thread(self):
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def schedule(self, count):
+        now = time.monotonic()
+        if self.first is None:
+            self.first = now
+        self.last = now
+        self.count += count
+        if self.count >= self.max_batch:
+            self.fire("max_batch")
+            return
+        # 無更新の期限と最大遅延のうち早い方でタイマーを設定し直す
+        deadline = min(self.last + self.quiet_period, self.first + self.max_delay)
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = self.loop.call_at(self.loop.time() + max(0.0, deadline - now), self.expire)
+
+    def expire(self):
+        self.timer = None
+        reason = "max_delay" if self.last + self.quiet_period > self.first + self.max_delay else "quiet"
+        self.fire(reason)
+
+    def fire(self, reason):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.count:
+            METRICS.inc("notify_batches_total", reason=reason)
+            METRICS.inc("notify_batched_events_total", self.count)
+        self.count = 0
+        self.first = self.last = None
+        self.flush()
+
+    def discard(self):
+        """保留中のイベントが破棄された場合（スナップショットの送信時など）にタイマーを解除します。"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.count = 0
+        self.first = self.last = None
+
+    def close(self, timeout=5):
+        """保留中のイベントを直ちに送信します（終了時）。イベントループ以外のスレッドからも呼び出せます。"""
+        if self.in_loop_thread() or not self.loop.is_running():
+            self.fire("close")
+            return
+
+        async def fire():
+            self.fire("close")
+        asyncio.run_coroutine_threadsafe(fire(), self.loop).result(timeout)
@@ -0,0 +1,135 @@
+"""
+watchdogのイベントをパスごとにまとめ、ファイルの書き込み完了を待ってから処理を実行します。
+サイズと更新日時が一定時間（quiet_period）変化しなくなった時点で書き込み完了とみなします。
+処理中にファイルが上書きされた場合は、実行中のジョブをキャンセルして再実行します。
+"""
+import os
+import time
+import asyncio
+import logging
+from modules.metrics import METRICS, STAGE_EVENT
+
+
+class PathState:
+    """1つのパスに対する保留中イベントと実行状態"""
+
+    def __init__(self, event):
+        self.event = event
+        # 最初のイベントを受信した時刻（ジョブ開始までの待ち時間の計測用）
+        self.received = time.monotonic()
+        self.last_stat = None
+        self.timer = None
+        self.task = None
+        self.rerun = False
+
+
+class EventCoalescer:
+    def __init__(self, handler, quiet_period=2.0, loop=None, cancel=None, name=None):
+        # handler: イベントを受け取るコルーチン関数（例: FileHandler.handle_created）
+        self.handler = handler
+        # cancel: 処理中のファイルが上書きされた場合に呼び出す関数（例: JobScheduler.cancel）
+        self.cancel = cancel
+        self.quiet_period = quiet_period
+        self.loop = loop
+        self.states = {}
+        # 複数のルートディレクトリを監視する場合に、メトリクスをルートごとに区別する名前
+        self.name = name
+        METRICS.register(f"coalescer:{name}" if name else "coalescer", self.collect_metrics)
+
+    def submit(self, event):
+        """
+        イベントを登録します。イベントループのスレッドから呼び出してください。
+        同じパスのイベントは1つのジョブにまとめられ、実行中に届いた場合は終了後にもう一度だけ実行されます。
+        """
+        path = event.src_path
+        state = self.states.get(path)
+        if state is None:
+            state = self.states[path] = PathState(event)
+        if state.task is not None:
+            # 実行中のジョブは終了後に再実行する。内容が変わっている場合は実行中のジョブを打ち切る
+            state.event = event
+            state.rerun = True
+            if self.cancel and self.stat(path) != state.last_stat:
+                self.cancel(path)
+            return
+        state.last_stat = self.stat(path)
+        self.arm(path, state)
+
+    def discard(self, path):
+        """削除されたパスの保留中イベントを破棄します。"""
+        state = self.states.get(path)
+        if state is None:
+            return
+        state.rerun = False
+        if state.timer is not None:
+            state.timer.cancel()
+            state.timer = None
+        if state.task is None:
+            del self.states[path]
+
+    def close(self):
+        """メトリクスの登録を解除します（ハンドラの破棄時）。"""
+        METRICS.unregister(f"coalescer:{self.name}" if self.name else "coalescer", self.collect_metrics)
+
+    def state_of(self, path):
+        """パスの状態（"waiting": 書き込み完了待ち、"running": 処理中、None: なし）を返します。"""
+        state = self.states.get(path)
+        if state is None:
+            return None
+        return "running" if state.task is not None else "waiting"
+
+    def pending_count(self):
+        return sum(1 for state in self.states.values() if state.task is None)
+
+    def collect_metrics(self):
+        return [("pending_events", {"root": self.name} if self.name else {}, self.pending_count())]
+
+    @staticmethod
+    def stat(path):
+        try:
+            stat_result = os.stat(path)
+            return (stat_result.st_size, stat_result.st_mtime_ns)
+        except OSError:
+            return None
+
+    def arm(self, path, state):
+        if state.timer is not None:
+            state.timer.cancel()
+        loop = self.loop or asyncio.get_running_loop()
+        state.timer = loop.call_later(self.quiet_period, self.check, path)
+
+    def check(self, path):
+        """静止期間の経過後にサイズと更新日時を確認し、変化がなければジョブを開始します。"""
+        state = self.states.get(path)
+        if state is None:
+            return
+        state.timer = None
+        current = self.stat(path)
+        if current is None:
+            # 書き込み途中で削除・移動された
+            logging.info(f"Dropping events for missing file: {path}")
+            del self.states[path]
+            return
+        if current != state.last_stat:
+            # まだ書き込み中のため、静止期間を延長する
+            state.last_stat = current
+            self.arm(path, state)
+            return
+        METRICS.observe(STAGE_EVENT, time.monotonic() - state.received)
+        loop = self.loop or asyncio.get_running_loop()
+        state.task = loop.create_task(self.run(path, state))
+
+    async def run(self, path, state):
+        try:
+            await self.handler(state.event)
+        except Exception as e:
+            logging.error(f"Failed to handle coalesced event: {path} ({e})")
+        finally:
+            state.task = None
+            if state.rerun:
+                state.rerun = False
+                state.received = time.monotonic()
+                state.last_stat = self.stat(path)
+                self.arm(path, state)
+            elif self.states.get(path) is state:
+                del self.states[path]
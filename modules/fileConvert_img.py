@@ -0,0 +1,220 @@
+
+"""
+画像から動画を生成するモジュール
+シーケンス画像から動画を作成する版と、レンダリングしたフレームを一時ファイルなしで
+ffmpegに直接流し込むストリーミング版（StreamingVideoEncoder）があります。
+StreamingVideoEncoder の可変フレームレート出力には ffmpeg 5.1 以降の -fps_mode を使用し、
+それより古い ffmpeg では同じ意味の -vsync vfr を使用します。
+"""
+import os
+import re
+import cv2
+import glob
+import asyncio
+import logging
+import subprocess
+import numpy as np
+from modules.profiler import watch_subprocess
+
+
+class ImgToVideo:
+    def images_to_video(image_dir, output_video, fps=1):
+        """画像を動画に変換"""
+        # 出力がディレクトリの場合、ファイル名を指定
+        if os.path.isdir(output_video):
+            dirname = os.path.basename(image_dir).replace("_sequence", "")
+            output_video = os.path.join(
+                output_video, f"{dirname}.mp4")  # デフォルトファイル名
+        images = sorted(glob.glob(os.path.join(image_dir, "*.png")))
+        if not images:
+            print("No images found in directory")
+            return
+
+        frame = cv2.imread(images[0])
+        height, width, _ = frame.shape
+
+        fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+        video = cv2.VideoWriter(
+            output_video, fourcc, fps, (width, height))
+
+        for image in images:
+            frame = cv2.imread(image)
+            video.write(frame)
+
+        video.release()
+        print(f"Video saved: {output_video}")
+
+    def images_to_video_ffmpeg(image_dir, output_video, fps=1):
+        """画像を動画に変換（ffmpegを使用）"""
+        # 出力がディレクトリの場合、ファイル名を指定
+        if os.path.isdir(output_video):
+            dirname = os.path.basename(image_dir).replace("_sequence", "")
+            output_video = os.path.join(
+                output_video, f"{dirname}.mp4")  # デフォルトファイル名
+
+        # 例: page-001.png, page-002.png
+        input_pattern = os.path.join(image_dir, "page-%03d.png")
+        cmd = [
+            "ffmpeg",
+            "-y",  # 既存ファイルを上書き
+            "-framerate", str(fps),  # フレームレート
+            "-i", input_pattern,  # 入力画像パターン
+            "-c:v", "libx264",  # H.264コーデック
+            "-pix_fmt", "yuv420p",  # 再生互換性のためのピクセルフォーマット
+            output_video
+        ]
+
+        try:
+            subprocess.run(cmd, check=True)
+            print(f"Video created: {output_video}")
+        except subprocess.CalledProcessError as e:
+            print(f"Error occurred during ffmpeg execution: {e}")
+
+
+# -fps_mode が追加された ffmpeg のバージョン
+FPS_MODE_VERSION = (5, 1)
+FFMPEG_VERSION_PATTERN = re.compile(r"ffmpeg version n?(\d+)\.(\d+)")
+# 可変フレームレートを指定するオプション（最初のエンコード時に ffmpeg -version で判定する）
+_vfr_options = None
+
+
+async def vfr_options():
+    """インストールされている ffmpeg で可変フレームレート出力を指定するオプションを返します。"""
+    global _vfr_options
+    if _vfr_options is None:
+        version = None
+        try:
+            process = await asyncio.create_subprocess_exec(
+                "ffmpeg", "-hide_banner", "-version",
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+            stdout, _ = await process.communicate()
+            match = FFMPEG_VERSION_PATTERN.search(stdout.decode(errors="replace"))
+            if match:
+                version = (int(match.group(1)), int(match.group(2)))
+        except OSError:
+            pass
+        # 開発版（バージョン番号のないビルド）は新しいものとして扱う
+        if version is not None and version < FPS_MODE_VERSION:
+            logging.info(f"ffmpeg {version[0]}.{version[1]} does not support -fps_mode, using -vsync vfr")
+            _vfr_options = ["-vsync", "vfr"]
+        else:
+            _vfr_options = ["-fps_mode", "vfr"]
+    return _vfr_options
+
+
+def timestamp_expression(durations):
+    """
+    フレーム番号 N から表示開始時刻（秒）を求める ffmpeg の式を作成します。
+    同じ表示時間が続く区間をまとめ、d * clip(N - 開始番号, 0, 区間の長さ) の和で表します
+    （全ページ同じ表示時間の場合は1項のみ）。
+    """
+    terms = []
+    start = 0
+    while start < len(durations):
+        end = start
+        while end < len(durations) and durations[end] == durations[start]:
+            end += 1
+        terms.append(f"{durations[start]:g}*clip(N-{start},0,{end - start})")
+        start = end
+    return "+".join(terms) or "0"
+
+
+class StreamingVideoEncoder:
+    """
+    ページごとに1フレームだけを、表示時間に応じた表示時刻（可変フレームレート）付きでエンコードします。
+    生のRGBフレームをffmpegの標準入力に書き込むため、一時ファイルは作成しません。
+    エンコード時間は動画の長さではなくページ数に比例します。
+    ffmpegが見つからない場合は cv2.VideoWriter（1fps、フレームを秒数分繰り返す）で書き出します。
+
+        encoder = StreamingVideoEncoder(output_video, width, height, [5, 5, 10])
+        await encoder.open()
+        await encoder.write(frame_bytes)  # width * height * 3 バイトのRGB（ページ数分）
+        await encoder.close()
+    """
+
+    def __init__(self, output_video, width, height, durations):
+        self.output_video = str(output_video)
+        self.width = width
+        self.height = height
+        # ページごとの表示秒数
+        self.durations = list(durations)
+        self.index = 0
+        self.last_frame = None
+        self.process = None
+        self.writer = None
+        self.stderr_task = None
+        self.watcher = None
+
+    async def open(self):
+        # 最終ページの表示時間を確定させるため、最後に同じフレームを終了時刻に1枚追加する
+        timestamps = timestamp_expression(self.durations)
+        cmd = [
+            "ffmpeg",
+            "-y",  # 既存ファイルを上書き
+            "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgb24",  # 標準入力から生のRGBフレームを受け取る
+            "-s", f"{self.width}x{self.height}",
+            "-framerate", "1",
+            "-i", "-",
+            "-vf", f"settb=1/1000,setpts='({timestamps})/TB'",  # ページごとの表示時刻
+            *await vfr_options(),  # フレームを複製せず、表示時刻どおりに出力
+            "-c:v", "libx264",  # H.264コーデック
+            "-pix_fmt", "yuv420p",  # 再生互換性のためのピクセルフォーマット
+            self.output_video
+        ]
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                *cmd, stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+            # stderrのパイプが詰まってffmpegが停止しないよう、並行して読み込む
+            self.stderr_task = asyncio.create_task(self.process.stderr.read())
+            self.watcher = watch_subprocess(self.process, cmd)
+        except FileNotFoundError:
+            logging.info("ffmpeg not found, falling back to cv2.VideoWriter")
+            fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+            self.writer = cv2.VideoWriter(
+                self.output_video, fourcc, 1, (self.width, self.height))
+        return self
+
+    async def write(self, frame):
+        """1ページ分のRGBデータを書き込みます（ffmpegの読み込みが追いつくまで待機）。"""
+        if self.process:
+            await self.write_raw(frame)
+        else:
+            image = np.frombuffer(frame, dtype=np.uint8).reshape(self.height, self.width, 3)
+            image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+            for _ in range(max(1, round(self.durations[self.index]))):
+                await asyncio.to_thread(self.writer.write, image)
+        self.last_frame = frame
+        self.index += 1
+
+    async def write_raw(self, frame):
+        self.process.stdin.write(frame)
+        await self.process.stdin.drain()
+
+    async def close(self):
+        """入力を閉じてエンコードの完了を待ちます。"""
+        if self.process:
+            if self.last_frame is not None:
+                await self.write_raw(self.last_frame)
+            self.process.stdin.close()
+            await self.process.wait()
+            stderr = await self.stderr_task
+            if self.watcher is not None:
+                await self.watcher
+            if self.process.returncode != 0:
+                raise RuntimeError(f"Error during ffmpeg encoding: {
+                                   stderr.decode(errors='replace').strip()[-1000:]}")
+        elif self.writer:
+            self.writer.release()
+        print(f"Video saved: {self.output_video}")
+
+    async def abort(self):
+        """エンコードを中断し、書きかけの出力を削除します。"""
+        if self.process and self.process.returncode is None:
+            self.process.kill()
+            await self.process.wait()
+        elif self.writer:
+            self.writer.release()
+        if os.path.exists(self.output_video):
+            os.remove(self.output_video)
@@ -2,16 +2,202 @@
 PDFをシーケンス画像に変換します。
 pip（PyMuPDF）を使用する版と、外部ツール（ImageMagick）を使用する版があります。
 外部ツール（ImageMagick）を使用する方法は高速かつ効率的ですがインストールが複雑です。
+PyMuPDF版はページのレンダリングをプロセスプールで並列に実行し、イベントループを塞ぎません。
+また、ページごとのフィンガープリントを保存し、PDFが更新された場合は変更されたページのみを再レンダリングします。
 """
 import os
+import re
+import json
 import asyncio
-import shutil
+import hashlib
+import logging
 from pathlib import Path
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import fitz  # PyMuPDF
-from modules.fileConvert_img import ImgToVideo
+from modules.fileConvert_img import StreamingVideoEncoder
+from modules.fileGenerate_thumbnail import communicate
+from modules.renditions import DEFAULT_RENDITIONS, rendition_paths, save_renditions_from_file
+from modules.metrics import METRICS, STAGE_PDF_RENDER, STAGE_ENCODE, STAGE_OFFICE
+from modules.profiler import profiled, run_in_worker, reset_worker
+
+
+# ページのレンダリング解像度
+RENDER_DPI = 150
+# 1つのワーカーにまとめて渡すページ数
+PAGES_PER_CHUNK = 8
+# ページごとのフィンガープリントを保存するファイル（シーケンスフォルダ内）
+FINGERPRINT_FILE = ".fingerprints.json"
+PAGE_IMAGE_PATTERN = re.compile(r"page-(\d+)\.png")
+# 動画変換時にレンダリング済みで書き込み待ちのフレームの最大数（メモリ使用量の上限）
+FRAMES_IN_FLIGHT = 4
+# フレームと同じ縦横比とみなすページの縦横比の差（この範囲ではレターボックスにせず引き伸ばす）
+ASPECT_TOLERANCE = 0.01
+
+# ページのレンダリングに使用するプロセスプール（すべてのPDFで共有、必要になった時点で作成）
+_render_pool = None
+_render_processes = None
+# ワーカープロセス内で開いているドキュメント
+_cached_doc = None
+
+
+def configure_render_pool(processes=None):
+    """レンダリング用プロセスプールのプロセス数を設定します（None または 0 の場合はCPU数）。"""
+    global _render_processes
+    _render_processes = processes or None
+
+
+def get_render_pool():
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(max_workers=_render_processes, initializer=reset_worker)
+    return _render_pool
+
+
+def reset_render_pool(broken_pool):
+    """ワーカーがクラッシュしたプールを破棄します（他のPDFが既に作り直している場合は何もしない）。"""
+    global _render_pool
+    if _render_pool is broken_pool:
+        _render_pool = None
+        broken_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def page_fingerprints(pdf_path):
+    """
+    ワーカープロセスで実行: ページごとにコンテンツ、リソース、ページサイズのフィンガープリントを返します。
+    画像やフォームなどのストリームは複数ページで共有されることが多いため、ハッシュをキャッシュします。
+    """
+    stream_digests = {}
+
+    def stream_digest(doc, xref):
+        if xref not in stream_digests:
+            digest = hashlib.blake2b(doc.xref_object(xref, compressed=True).encode(), digest_size=16)
+            if doc.xref_is_stream(xref):
+                digest.update(doc.xref_stream_raw(xref) or b"")
+            stream_digests[xref] = digest.hexdigest()
+        return stream_digests[xref]
+
+    fingerprints = []
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(repr((tuple(page.mediabox), tuple(page.cropbox), page.rotation)).encode())
+            digest.update(page.read_contents())
+            digest.update(repr(doc.xref_get_key(page.xref, "Resources")).encode())
+            # ページが参照するフォント・画像・フォームXObjectの内容
+            xrefs = sorted({item[0] for item in page.get_fonts(full=True)}
+                           | {item[0] for item in page.get_images(full=True)}
+                           | {item[0] for item in page.get_xobjects()})
+            for xref in xrefs:
+                if xref > 0:
+                    digest.update(stream_digest(doc, xref).encode())
+            fingerprints.append(digest.hexdigest())
+    return fingerprints
+
+
+def page_image_path(sequence_dir, page_number):
+    return os.path.join(sequence_dir, f"page-{page_number:03d}.png")
+
+
+def load_fingerprints(sequence_dir, dpi=RENDER_DPI):
+    """シーケンスフォルダに保存された前回のフィンガープリントを読み込みます（解像度が異なる場合は無効）。"""
+    try:
+        with open(os.path.join(sequence_dir, FINGERPRINT_FILE), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data["pages"] if data.get("dpi") == dpi else []
+    except (OSError, ValueError, KeyError):
+        return []
+
+
+def save_fingerprints(sequence_dir, fingerprints, dpi=RENDER_DPI):
+    path = os.path.join(sequence_dir, FINGERPRINT_FILE)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump({"dpi": dpi, "pages": fingerprints}, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def prune_pages(sequence_dir, page_count):
+    """ページが削除された場合に残っている古い page-NNN.png を削除します。"""
+    for name in os.listdir(sequence_dir):
+        match = PAGE_IMAGE_PATTERN.fullmatch(name)
+        if match and int(match.group(1)) >= page_count:
+            os.remove(os.path.join(sequence_dir, name))
+            logging.info(f"Pruned stale page image: {name}")
+
+
+def render_pages(pdf_path, page_numbers, sequence_dir, dpi=RENDER_DPI):
+    """ワーカープロセスで実行: PDFを各ワーカーで開き、指定したページをPNGとして保存します。"""
+    with fitz.open(pdf_path) as doc:
+        for page_number in page_numbers:
+            pix = doc[page_number].get_pixmap(dpi=dpi)
+            pix.save(page_image_path(sequence_dir, page_number))
+    return page_numbers
+
+
+def open_cached(pdf_path):
+    """
+    ワーカープロセスで実行: 同じPDFのページが続けて届くため、開いたドキュメントを再利用します。
+    Windowsでファイルをロックし続けないよう、メモリに読み込んでから開きます。
+    """
+    global _cached_doc
+    key = (pdf_path, os.stat(pdf_path).st_mtime_ns)
+    if _cached_doc is None or _cached_doc[0] != key:
+        if _cached_doc is not None:
+            _cached_doc[1].close()
+        with open(pdf_path, 'rb') as f:
+            _cached_doc = (key, fitz.open("pdf", f.read()))
+    return _cached_doc[1]
+
+
+def video_layout(pdf_path, page_duration, dpi=RENDER_DPI):
+    """
+    ワーカープロセスで実行: ページごとの表示秒数と、1ページ目を基準にした動画のフレームサイズ（偶数）を返します。
+    ページに表示時間（/Dur）が設定されている場合はそれを優先します。
+    """
+    doc = open_cached(pdf_path)
+    if len(doc) == 0:
+        return [], 0, 0
+    durations = []
+    for page in doc:
+        kind, value = doc.xref_get_key(page.xref, "Dur")
+        durations.append(float(value) if kind in ("int", "float") and float(value) > 0 else page_duration)
+    rect = doc[0].rect
+    scale = dpi / 72
+    # yuv420pでエンコードするため幅・高さを偶数にそろえる
+    width = max(2, int(rect.width * scale) // 2 * 2)
+    height = max(2, int(rect.height * scale) // 2 * 2)
+    return durations, width, height
+
+
+def render_frame(pdf_path, page_number, width, height):
+    """ワーカープロセスで実行: ページをフレームサイズに収まるようにレンダリングし、RGBのバイト列を返します。"""
+    page = open_cached(pdf_path)[page_number]
+    scale_x = width / page.rect.width
+    scale_y = height / page.rect.height
+    if abs(scale_x - scale_y) <= ASPECT_TOLERANCE * max(scale_x, scale_y):
+        # フレームと同じ縦横比のページは、偶数への切り捨て分だけ縦横の倍率を変えてフレームサイズちょうどにレンダリングする
+        matrix = fitz.Matrix(scale_x, scale_y)
+    else:
+        scale = min(scale_x, scale_y)
+        matrix = fitz.Matrix(scale, scale)
+    pix = page.get_pixmap(matrix=matrix, alpha=False)
+    if (pix.width, pix.height) == (width, height):
+        return pix.samples
+    # サイズの異なるページは白背景の中央に配置する（Pixmap.irect はタプルのため IRect に変換する）
+    canvas = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, width, height), False)
+    canvas.clear_with(255)
+    pix.set_origin((width - pix.width) // 2, (height - pix.height) // 2)
+    canvas.copy(pix, fitz.IRect(pix.irect) & fitz.IRect(canvas.irect))
+    return canvas.samples
 
 
 class PDFConverter:
+    def __init__(self, renditions=None):
+        # 1ページ目から生成するサムネイルのレンディション
+        self.renditions = renditions or DEFAULT_RENDITIONS
+
+    @profiled("pdf_sequence")
     async def convert_pdf_to_images(self, pdf_path):
         """PDFをシーケンス画像に変換し、1ページ目をサムネイルとして生成します。"""
         # 出力ディレクトリの設定
@@ -19,24 +205,69 @@ class PDFConverter:
         sequence_dir = Path(pdf_path).parent / f"{pdf_name}_sequence"
         os.makedirs(sequence_dir, exist_ok=True)
 
-        # PyMuPDFを使ってPDFを画像に変換
-        doc = fitz.open(pdf_path)
-        for page_number in range(len(doc)):
-            page = doc[page_number]
-            pix = page.get_pixmap(dpi=150)  # 解像度を設定（150 DPI）
-            output_image = sequence_dir / f"page-{page_number:03d}.png"
-            pix.save(output_image)
-            print(f"Saved {output_image}")
+        # PyMuPDFを使ってPDFを画像に変換（変更されたページのみをプロセスプールで並列にレンダリング）
+        page_count, rendered = await self.render_document(pdf_path, sequence_dir)
+        print(f"Rendered {len(rendered)}/{page_count} pages to {sequence_dir}")
 
-        # 1ページ目をサムネイルとしてコピー
+        # 1ページ目からサムネイルを生成（1ページ目が変わった場合、またはサムネイルがない場合のみ）
         first_page = sequence_dir / "page-000.png"
-        thumbnail_path = Path(pdf_path).parent / f"{pdf_name}_thumbnail.png"
-        if first_page.exists():
-            shutil.copy(first_page, thumbnail_path)
-            print(f"Thumbnail saved: {thumbnail_path}")
+        thumbnails = rendition_paths(pdf_path, self.renditions).values()
+        if first_page.exists() and (0 in rendered or not all(os.path.exists(path) for path in thumbnails)):
+            outputs = await run_in_worker(
+                None, save_renditions_from_file, first_page, pdf_path, self.renditions)
+            print(f"Thumbnail saved: {outputs}")
 
         return sequence_dir
 
+    async def render_document(self, pdf_path, sequence_dir):
+        """
+        共有プロセスプールでシーケンスを更新し、(ページ数, レンダリングしたページ番号のリスト) を返します。
+        ワーカーのクラッシュでプールが壊れた場合（別のPDFが原因の場合もある）は、
+        このPDF専用のプールで1回だけ再試行し、再度クラッシュした場合はこのPDFのみ失敗とします。
+        """
+        pool = get_render_pool()
+        try:
+            return await self.update_sequence(pool, pdf_path, sequence_dir)
+        except BrokenProcessPool:
+            reset_render_pool(pool)
+            logging.error(f"PDF render worker crashed, retrying in an isolated pool: {pdf_path}")
+
+        pool = ProcessPoolExecutor(max_workers=_render_processes, initializer=reset_worker)
+        try:
+            return await self.update_sequence(pool, pdf_path, sequence_dir)
+        except BrokenProcessPool:
+            raise RuntimeError(f"PDF render worker crashed: {pdf_path}")
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    async def update_sequence(self, pool, pdf_path, sequence_dir):
+        """
+        ページのフィンガープリントを前回と比較し、変更・追加されたページのみをレンダリングします。
+        削除されたページの画像は削除し、最後に新しいフィンガープリントを保存します。
+        """
+        fingerprints = await run_in_worker(pool, page_fingerprints, str(pdf_path))
+        previous = load_fingerprints(sequence_dir)
+        page_numbers = [
+            page_number for page_number, fingerprint in enumerate(fingerprints)
+            if page_number >= len(previous) or previous[page_number] != fingerprint
+            or not os.path.exists(page_image_path(sequence_dir, page_number))
+        ]
+
+        # チャンクに分けてワーカーに配り、完了した順に保存する
+        chunks = [page_numbers[i:i + PAGES_PER_CHUNK]
+                  for i in range(0, len(page_numbers), PAGES_PER_CHUNK)]
+        with METRICS.timer(STAGE_PDF_RENDER):
+            await asyncio.gather(*(
+                run_in_worker(pool, render_pages, str(pdf_path), chunk, str(sequence_dir))
+                for chunk in chunks
+            ))
+        METRICS.inc("pdf_pages_total", len(page_numbers), result="rendered")
+        METRICS.inc("pdf_pages_total", len(fingerprints) - len(page_numbers), result="unchanged")
+
+        prune_pages(sequence_dir, len(fingerprints))
+        save_fingerprints(sequence_dir, fingerprints)
+        return len(fingerprints), page_numbers
+
     async def convert_pdf_to_imagemagick(self, pdf_path):
         # ImageMagickのインストールが必要です。
         """PDFをシーケンス画像に変換し、1ページ目をサムネイルとして生成します。"""
@@ -53,15 +284,14 @@ class PDFConverter:
                "150", pdf_path, str(output_image)]
         await self.run_subprocess(cmd, f"PDF converted to images: {sequence_dir}")
 
-        # 1ページ目をサムネイルにコピー
+        # 1ページ目からサムネイルを生成
         first_page = sequence_dir / "page-000.png"
-        thumbnail_path = Path(pdf_path).parent / \
-            f"{pdf_name}_thumbnail.png"
         if first_page.exists():
-            shutil.copy(first_page, thumbnail_path)
+            save_renditions_from_file(first_page, pdf_path, self.renditions)
 
         return sequence_dir
 
+    @profiled("ppt_to_pdf")
     async def convert_ppt_to_pdf(self, ppt_path):
         # LibreOfficeのインストールが必要です。
         """PPT/PPSXをPDFに変換し、その後PDFを画像に変換します。"""
@@ -73,7 +303,8 @@ class PDFConverter:
             'soffice', '--headless', '--convert-to', 'pdf', '--outdir',
             str(ppt_path.parent), str(ppt_path)
         ]
-        await self.run_subprocess(cmd_ppt_to_pdf, f"PPT converted to PDF: {pdf_path}")
+        with METRICS.timer(STAGE_OFFICE):
+            await self.run_subprocess(cmd_ppt_to_pdf, f"PPT converted to PDF: {pdf_path}")
         return pdf_path
 
     async def run_subprocess(self, cmd, success_message):
@@ -82,26 +313,48 @@ class PDFConverter:
             *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
         )
 
-        stdout, stderr = await process.communicate()
+        stdout, stderr = await communicate(process, cmd)
 
         if process.returncode != 0:
             raise RuntimeError(f"Error during subprocess: {
                                stderr.decode().strip()}")
 
-    async def convert_pdf_to_video(self, pdf_path, output_video, fps=1):
-        """PDFを動画に変換"""
-        temp_dir = "temp_images"
-        try:
-            # PDFを画像に変換
-            print("Converting PDF to images...")
-            temp_dir = await self.convert_pdf_to_images(pdf_path)
-
-            # 画像から動画を作成
-            print("Creating video from images...")
-            await ImgToVideo.images_to_video(temp_dir, output_video, fps)
+    @profiled("pdf_video")
+    async def convert_pdf_to_video(self, pdf_path, output_video, page_duration=5):
+        """
+        PDFを動画に変換します。各ページは page_duration 秒（ページに /Dur がある場合はその秒数）表示されます。
+        ページをワーカープロセスでフレームにレンダリングし、ページごとに1フレームだけをffmpegに直接流し込みます（一時ファイルなし）。
+        レンダリング済みで未書き込みのフレームは最大 FRAMES_IN_FLIGHT 枚に制限されます。
+        """
+        print("Converting PDF to video...")
+        pool = get_render_pool()
+        durations, width, height = await run_in_worker(
+            pool, video_layout, str(pdf_path), page_duration)
+        page_count = len(durations)
+        if page_count == 0:
+            raise ValueError(f"PDF has no pages: {pdf_path}")
 
-            print("PDF to video conversion completed.")
-        finally:
-            # 一時ディレクトリを削除
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)  # ディレクトリとその中身を削除
+        encoder = await StreamingVideoEncoder(output_video, width, height, durations).open()
+        pending = deque()
+        try:
+            # レンダリングとエンコードは並行して進むため、全体を encode として計測する
+            with METRICS.timer(STAGE_ENCODE):
+                for page_number in range(page_count):
+                    pending.append(run_in_worker(
+                        pool, render_frame, str(pdf_path), page_number, width, height))
+                    if len(pending) >= FRAMES_IN_FLIGHT:
+                        await encoder.write(await pending.popleft())
+                while pending:
+                    await encoder.write(await pending.popleft())
+                await encoder.close()
+            METRICS.inc("pdf_pages_total", page_count, result="encoded")
+        except BaseException as e:
+            for future in pending:
+                future.cancel()
+            await encoder.abort()
+            if isinstance(e, BrokenProcessPool):
+                reset_render_pool(pool)
+                raise RuntimeError(f"PDF render worker crashed: {pdf_path}")
+            raise
+        print("PDF to video conversion completed.")
+        return output_video
@@ -1,17 +1,37 @@
 """ 
 PowerPointのCOMオブジェクトを使用してプレゼンテーションをビデオとしてエクスポートします。
 pywin32 ライブラリを使用
+変換はイベントループを塞がないよう asyncio.to_thread のワーカースレッドから呼び出されるため、呼び出しごとにそのスレッドで COM を初期化します。
 """
 import time
+import functools
+import pythoncom
 import win32com.client
 from pathlib import Path
 import os
-import shutil
 from pathlib import Path
 import win32com.client
+from modules.renditions import DEFAULT_RENDITIONS, save_renditions_from_file
+
+
+def com_thread(method):
+    """呼び出したスレッドで COM を初期化してからメソッドを実行します。"""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        pythoncom.CoInitialize()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            pythoncom.CoUninitialize()
+    return wrapper
 
 
 class PowerPointConverter:
+    def __init__(self, renditions=None):
+        # 1ページ目から生成するサムネイルのレンディション
+        self.renditions = renditions or DEFAULT_RENDITIONS
+
+    @com_thread
     def convert_ppt_to_images(self, ppt_path):
         """PPTX/PPSXをシーケンス画像に変換し、1ページ目をサムネイルとして生成します。"""
         try:
@@ -32,12 +52,11 @@ class PowerPointConverter:
                 slide.Export(str(output_image), "PNG")
                 print(f"Saved slide {index} as {output_image}")
 
-            # 最初のスライドをサムネイルとしてコピー
+            # 最初のスライドからサムネイルを生成
             first_page = output_dir / "page-001.png"
-            thumbnail_path = ppt_path.parent / f"{ppt_path.stem}_thumbnail.png"
             if first_page.exists():
-                shutil.copy(first_page, thumbnail_path)
-                print(f"Thumbnail saved: {thumbnail_path}")
+                outputs = save_renditions_from_file(first_page, ppt_path, self.renditions)
+                print(f"Thumbnail saved: {outputs}")
 
             # プレゼンテーションを閉じる
             presentation.Close()
@@ -48,6 +67,7 @@ class PowerPointConverter:
             print(f"Error converting PowerPoint to images: {e}")
             raise
 
+    @com_thread
     def export_ppt_to_video(self, folder_path, output_folder, slide_duration=5, resolution=1080, frame_rate=30, event_handler=None):
         powerpoint = None
         try:
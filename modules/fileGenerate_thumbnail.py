@@ -1,53 +1,104 @@
 """ 
 動画ファイルからサムネイルを生成するモジュール
 ffmpegまたはOpenCVを使用して動画ファイルからサムネイルを生成します。
+OpenCVバックエンドはプロセスを起動せずにデコードするため、短い動画を大量に処理する場合に高速です。
 """
-import os
 import asyncio
+import logging
 import cv2
+import numpy as np
+from modules.renditions import DEFAULT_RENDITIONS, save_renditions
+from modules.metrics import METRICS, STAGE_PROBE, STAGE_DECODE
+from modules.profiler import profiled, watch_subprocess, run_in_worker
+
+
+async def communicate(process, cmd=""):
+    """
+    サブプロセスの完了を待ちます。待機中にキャンセルされた場合はプロセスを強制終了します。
+    プロファイリング中のジョブではプロセスの実時間とCPU時間を記録します。
+    """
+    watcher = watch_subprocess(process, cmd)
+    try:
+        return await process.communicate()
+    except asyncio.CancelledError:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+    finally:
+        if watcher is not None:
+            await asyncio.wait([watcher])
 
 
 class VideoThumbnailGenerator:
+    # 使用可能なバックエンド（opencv: プロセス内でデコード、ffmpeg: ffprobe/ffmpegを起動）
+    BACKENDS = ("opencv", "ffmpeg")
+
+    def __init__(self, backend="opencv", renditions=None):
+        self.backend = backend if backend in self.BACKENDS else "ffmpeg"
+        self.renditions = renditions or DEFAULT_RENDITIONS
+
+    @profiled("video_thumbnail")
     async def create_thumbnail(self, file_path, user_second):
-        """ffmpegを使用し、指定された動画ファイルからサムネイルを非同期で生成します。"""
-        thumbnail_path = f"{os.path.splitext(file_path)[0]}_thumbnail.png"
+        """
+        指定された動画ファイルからフレームを1回だけデコードし、すべてのレンディションを非同期で生成します。
+        OpenCVで開けない場合はffmpegを使用します。生成したレンディションの {名前: パス} を返します。
+        """
+        frame = None
+        if self.backend == "opencv":
+            # デコードはGILを解放するため、スレッドで実行してイベントループを塞がない
+            frame = await run_in_worker(None, self.video_to_frame, file_path, user_second)
+            if frame is None:
+                logging.info(f"OpenCV could not decode {file_path}, falling back to ffmpeg")
+
+        if frame is None:
+            frame = await self.video_to_frame_ffmpeg(file_path, user_second)
+
+        return await run_in_worker(None, save_renditions, frame, file_path, self.renditions)
+
+    async def video_to_frame_ffmpeg(self, file_path, user_second):
+        """ffmpegを使用し、指定された動画ファイルからフレームをPNGとして標準出力に書き出して読み込みます。"""
         duration = await self.get_video_duration(file_path)
 
         if user_second == 0 or duration <= user_second:
             # 動画の長さが指定秒以下の場合、最初のフレームをサムネイルとして生成
-            cmd = f'ffmpeg -y -i "{file_path}" -vframes 1 "{thumbnail_path}"'
+            cmd = f'ffmpeg -y -i "{file_path}" -vframes 1 -f image2pipe -vcodec png -'
         else:
             # 分と秒に分割して時間指定
             minutes, seconds = divmod(user_second, 60)
             cmd = f'ffmpeg -y -i "{file_path}" -ss {int(minutes):02d}:{int(
-                seconds):02d} -t 00:00:01 -vframes 1 "{thumbnail_path}"'
+                seconds):02d} -t 00:00:01 -vframes 1 -f image2pipe -vcodec png -'
 
-        process = await asyncio.create_subprocess_shell(
-            cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
+        with METRICS.timer(STAGE_DECODE):
+            process = await asyncio.create_subprocess_shell(
+                cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
 
-        stdout, stderr = await process.communicate()
+            stdout, stderr = await communicate(process, cmd)
 
-        if process.returncode == 0:
-            return thumbnail_path
-        else:
+        if process.returncode != 0 or not stdout:
             raise Exception(f"Thumbnail generation failed: {
                             stderr.decode().strip()}")
+        frame = cv2.imdecode(np.frombuffer(stdout, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise Exception(f"Thumbnail generation failed: cannot decode frame from {file_path}")
+        return frame
 
     async def get_video_duration(self, file_path):
         """ffmpegを使用し、指定された動画ファイルの長さを非同期で取得します。"""
         cmd = f'ffprobe -v error -show_entries format=duration -of default=noprint_wrappers=1:nokey=1 "{
             file_path}"'
 
-        process = await asyncio.create_subprocess_shell(
-            cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
+        with METRICS.timer(STAGE_PROBE):
+            process = await asyncio.create_subprocess_shell(
+                cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
 
-        stdout, stderr = await process.communicate()
+            stdout, stderr = await communicate(process, cmd)
 
         if process.returncode == 0:
             return float(stdout.decode().strip())
@@ -55,36 +106,35 @@ class VideoThumbnailGenerator:
             raise Exception(f"Failed to get video duration: {
                             stderr.decode().strip()}")
 
-    def video_to_thumbnail(video_path, output_image, time_in_seconds=0):
+    def video_to_frame(self, video_path, time_in_seconds=0):
         """
-        動画から指定した時間のフレームをサムネイルとして保存（OpenCV版）
+        動画から指定した時間のフレームを読み込みます（OpenCV版）
+        動画の長さが指定秒以下の場合は最初のフレームを使用します。
         :param video_path: 動画ファイルのパス
-        :param output_image: 出力されるサムネイル画像のパス
         :param time_in_seconds: サムネイルを抽出する時間（秒単位）
+        :return: BGR形式のフレーム画像。OpenCVで開けない・読めない場合は None
         """
-        # 動画を読み込む
-        cap = cv2.VideoCapture(video_path)
-
-        if not cap.isOpened():
-            print(f"Error: Cannot open video {video_path}")
-            return
-
-        # フレームレートを取得
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        print(f"FPS: {fps}")
-
-        # 指定された秒数に対応するフレーム番号を計算
-        frame_number = int(fps * time_in_seconds)
-        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
-
-        # フレームを読み取る
-        ret, frame = cap.read()
-        if ret:
-            # フレームを画像として保存
-            cv2.imwrite(output_image, frame)
-            print(f"Thumbnail saved at: {output_image}")
-        else:
-            print("Error: Cannot read the frame")
-
-        # リソースを解放
-        cap.release()
+        with METRICS.timer(STAGE_DECODE):
+            # 動画を読み込む
+            cap = cv2.VideoCapture(video_path)
+            try:
+                if not cap.isOpened():
+                    return None
+
+                # フレームレートとフレーム数から動画の長さを取得
+                fps = cap.get(cv2.CAP_PROP_FPS)
+                frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+                duration = frame_count / fps if fps > 0 else 0
+
+                if time_in_seconds and duration > time_in_seconds:
+                    cap.set(cv2.CAP_PROP_POS_MSEC, time_in_seconds * 1000)
+
+                # フレームを読み取る
+                ret, frame = cap.read()
+                return frame if ret else None
+            except cv2.error as e:
+                logging.error(f"OpenCV error while reading {video_path}: {e}")
+                return None
+            finally:
+                # リソースを解放
+                cap.release()
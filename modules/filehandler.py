@@ -4,22 +4,38 @@
 """
 import os
 import asyncio
-import json
+import time
 import logging
+import threading
 from utils.logwriter import setup_logging
-from watchdog.events import FileSystemEventHandler
+from watchdog.events import FileSystemEventHandler, FileCreatedEvent, FileDeletedEvent
 from modules.fileGenerate_thumbnail import VideoThumbnailGenerator
 from modules.fileConvert_pdf import PDFConverter
 from modules.fileConvert_ppt import PowerPointConverter
+from modules.event_coalescer import EventCoalescer
+from modules.event_batcher import EventBatcher
+from modules.scanner import scan_files
+from modules.output_tracker import OUTPUTS
+from modules.renditions import DEFAULT_RENDITIONS, rendition_paths
+from modules.metrics import METRICS, STAGE_OFFICE
+from modules.notification import Notifier, OP_ADD, OP_REMOVE, KIND_FILE, KIND_SEQUENCE_FOLDER
+from modules.registry import FileRegistry, KIND_SOURCE, STATUS_READY, STATUS_PROCESSING, STATUS_FAILED, is_under
+from modules.scheduler import (JobScheduler, JobCancelled, JOB_VIDEO, JOB_PDF, JOB_OFFICE,
+                               JOB_ENCODE, PRIORITY_LIVE, PRIORITY_STARTUP)
+from utils.communication.wire import encoder_for
 
 
 # 監視対象の拡張子
 VIDEO_EXTENSIONS = ['.mp4', '.avi', '.mkv', '.flv', '.mov']
 PDF_EXTENSION = '.pdf'
 PPT_EXTENSIONS = ['.pptx', '.ppsx']
+SOURCE_EXTENSIONS = VIDEO_EXTENSIONS + [PDF_EXTENSION] + PPT_EXTENSIONS
 
-# 対象の動画ファイルのパスのリスト
-video_files = []
+# 通知する動画ファイルとPDFおよびPPTのシーケンス画像フォルダのレジストリ
+registry = FileRegistry()
+# 非同期処理用のイベントループ（起動処理はメインスレッドで、監視中はバックグラウンドスレッドで実行）
+MAIN_LOOP = asyncio.new_event_loop()
+_loop_thread = None
 
 setup_logging()
 
@@ -27,58 +43,82 @@ setup_logging()
 class FileHandler(FileSystemEventHandler):
     """ファイルの追加や変更を監視し、処理およびUDPメッセージ送信を実行します。"""
 
-
-# 監視対象の拡張子
-VIDEO_EXTENSIONS = ['.mp4', '.avi', '.mkv', '.flv', '.mov']
-PDF_EXTENSION = '.pdf'
-PPT_EXTENSIONS = ['.pptx', '.ppsx']
-
-# 対象の動画ファイルのパスのリスト
-video_files = []
-# PDFおよびPPTのシーケンス画像フォルダのリスト
-sequence_folders = []
-# メインスレッドのイベントループを作成
-MAIN_LOOP = asyncio.get_event_loop()
-
-setup_logging()
-
-
-class FileHandler(FileSystemEventHandler):
-    """ファイルの追加や変更を監視し、処理およびUDPメッセージ送信を実行します。"""
-
-    def __init__(self, ignore_subfolders, sender=None, ip=None, port=None, thumbnail_time_seconds=1, convert_slide=None, convert_document=None, page_duration=5):
+    def __init__(self, ignore_subfolders, sender=None, ip=None, port=None, thumbnail_time_seconds=1, convert_slide=None, convert_document=None, page_duration=5, manifest=None, max_workers=None, quiet_period=2.0, scheduler=None, video_backend="opencv", renditions=None, notify_format="delta", max_message_bytes=None, send_interval=1.0, send_max_delay=5.0, send_max_batch=100, wire="json", root=None, hub=None):
         super().__init__()
         self.ignore_subfolders = ignore_subfolders
         self.sender = sender
         self.ip = ip
         self.port = port
         self.thumbnail_time_seconds = thumbnail_time_seconds
+        self.video_backend = video_backend
         self.page_duration = page_duration
         self.convert_slide = convert_slide
         self.convert_document = convert_document
-        self.pdf_converter = PDFConverter()
-        self.ppt_converter = PowerPointConverter()
-        self.event_queue = [] if sender else None
+        # サムネイルのレンディション（1回のデコードから複数のサイズ・形式を出力）
+        self.renditions = renditions or DEFAULT_RENDITIONS
+        self.pdf_converter = PDFConverter(self.renditions)
+        self.ppt_converter = PowerPointConverter(self.renditions)
+        # 通知（起動時はスナップショット、以降は連番付きの差分を送信）
+        # 監視対象のルートディレクトリ（複数のルートを監視する場合、通知するファイルリストはこの配下のみ）
+        self.root = root
+        self.notifier = Notifier(sender, ip, port, lambda: registry.snapshot(root), notify_format, max_message_bytes,
+                                 encode=encoder_for(wire, root), root=root)
+        # 無更新・最大遅延・最大件数のいずれかでイベントをまとめて送信する
+        self.notifier.batcher = EventBatcher(
+            self.notifier.flush, MAIN_LOOP, send_interval, send_max_delay, send_max_batch)
+        # IPC の SUBSCRIBE で接続した購読者にも配信する
+        self.notifier.hub = hub
+        # 起動時スキャンの進捗（IPC の QUEUE コマンドで参照）
+        self.scan_progress = None
+        # 生成済み出力の永続マニフェスト（None の場合は常に再生成）
+        self.manifest = manifest
+        # 起動時スキャンの同時実行数（None または 0 の場合はCPU数）
+        self.max_workers = max_workers
+        # 変換ジョブのスケジューラ（複数のハンドラで共有可能）
+        self.scheduler = scheduler or JobScheduler()
+        # パスごとにイベントをまとめ、書き込み完了を待ってから処理する（処理中に上書きされた場合はジョブをキャンセル）
+        self.coalescer = EventCoalescer(
+            self.handle_created, quiet_period, MAIN_LOOP, cancel=self.scheduler.cancel, name=root)
 
     def on_created(self, event):
         """ファイル作成時に呼び出されます。"""
-        if not event.is_directory:
-            asyncio.run_coroutine_threadsafe(
-                self.handle_created(event), MAIN_LOOP)
+        METRICS.inc("events_total", type=event.event_type)
+        if not event.is_directory and not self.is_own_output(event.src_path, event):
+            MAIN_LOOP.call_soon_threadsafe(self.coalescer.submit, event)
 
     def on_modified(self, event):
         """ファイル変更時に呼び出されます。"""
-        if not event.is_directory:
-            asyncio.run_coroutine_threadsafe(
-                self.handle_created(event), MAIN_LOOP)
+        METRICS.inc("events_total", type=event.event_type)
+        if not event.is_directory and not self.is_own_output(event.src_path, event):
+            MAIN_LOOP.call_soon_threadsafe(self.coalescer.submit, event)
 
     def on_deleted(self, event):
         """ファイル削除時に呼び出されます。"""
         print(f"File created event: {event.src_path}")
-        if not event.is_directory:
+        METRICS.inc("events_total", type=event.event_type)
+        if not event.is_directory and not self.is_own_output(event.src_path, event):
             asyncio.run_coroutine_threadsafe(
                 self.handle_deleted(event), MAIN_LOOP)
 
+    def on_moved(self, event):
+        """ファイル移動（名前の変更）時に呼び出されます。移動元の削除と移動先の作成として処理します。"""
+        METRICS.inc("events_total", type=event.event_type)
+        if event.is_directory:
+            return
+        if not self.is_own_output(event.src_path, event):
+            asyncio.run_coroutine_threadsafe(
+                self.handle_deleted(FileDeletedEvent(event.src_path)), MAIN_LOOP)
+        if not self.is_own_output(event.dest_path, event):
+            MAIN_LOOP.call_soon_threadsafe(self.coalescer.submit, FileCreatedEvent(event.dest_path))
+
+    @staticmethod
+    def is_own_output(path, event):
+        """thumb-crafter が書き込んだ出力のイベントかどうかを返します（イベントループに渡す前に watchdog のスレッドで判定する）。"""
+        if OUTPUTS.matches(path):
+            METRICS.inc("events_suppressed_total", type=event.event_type)
+            return True
+        return False
+
     async def handle_created(self, event):
         """ファイル作成・変更時に非同期で処理します。"""
         file_path = event.src_path
@@ -86,71 +126,201 @@ class FileHandler(FileSystemEventHandler):
         logging.info(f"handle_created called with file: {
                      file_path}, extension: {ext}")
 
-        # 動画ファイルの場合、サムネイルを作成
-        if ext in VIDEO_EXTENSIONS:
-            await self.create_thumbnail(file_path)
+        params = self.conversion_params(ext)
+        outputs = None
+        if params is None:
+            logging.info(f"Ignoring file: {file_path} (unsupported extension or conversion disabled)")
+            METRICS.inc("files_total", result="ignored")
+        else:
+            try:
+                # 起動時スキャンでは走査時の stat を再利用する
+                stat_result = getattr(event, "stat_result", None) or os.stat(file_path)
+            except OSError as e:
+                logging.error(f"Failed to stat file: {file_path} ({e})")
+                stat_result = None
+
+            if self.manifest and stat_result:
+                outputs = self.manifest.lookup(file_path, params, stat_result)
+            if outputs is not None:
+                # 前回から変更がなく出力もそろっている場合は再生成しない
+                logging.info(f"Skipping unchanged file: {file_path}")
+                METRICS.inc("files_total", result="unchanged")
+                self.restore_outputs(file_path, ext, outputs)
+            elif stat_result:
+                self.mark_source(file_path, STATUS_PROCESSING)
+                mode = params["mode"]
+                priority = PRIORITY_STARTUP if getattr(
+                    event, "startup", False) else PRIORITY_LIVE
+                try:
+                    outputs = await self.scheduler.submit(
+                        file_path,
+                        self.job_class(ext, mode),
+                        lambda: self.process_file(file_path, ext, mode),
+                        priority,
+                        stat_result.st_size
+                    )
+                except JobCancelled:
+                    # 削除・上書きされたファイルの処理は後続のイベントに任せる
+                    logging.info(f"Job cancelled: {file_path}")
+                    METRICS.inc("files_total", result="cancelled")
+                    return
+                METRICS.inc("files_total", result="processed" if outputs else "failed")
+                if not outputs:
+                    self.mark_source(file_path, STATUS_FAILED)
+                elif ext not in VIDEO_EXTENSIONS:
+                    # 動画は出力（サムネイル）の登録で ready になる
+                    self.mark_source(file_path, STATUS_READY, outputs)
+                if outputs and self.manifest:
+                    self.manifest.record(file_path, params, outputs, stat_result)
+                    self.manifest.save(force=False)
 
-        # PDFファイルの場合
-        elif ext == PDF_EXTENSION:
-            mode = self.convert_document.lower()
-            if mode == "video":
-                await self.convert_pdf_to_video(file_path)
-            elif mode == "sequence":
-                await self.convert_pdf_to_images(file_path)
-            else:
-                logging.info(f"Ignoring PDF file: {
-                             file_path} (convert_document={mode})")
+        # イベントをキューに追加
+        self.queue_event(event, outputs)
 
-        # PowerPointファイルの場合
+    def conversion_params(self, ext):
+        """拡張子に対応する変換モードと、出力に影響するパラメータを返します（処理対象外の場合は None）。"""
+        if ext in VIDEO_EXTENSIONS:
+            return {"mode": "thumbnail", "thumbnail_time_seconds": self.thumbnail_time_seconds,
+                    "renditions": self.renditions}
+        if ext == PDF_EXTENSION:
+            mode = (self.convert_document or "none").lower()
         elif ext in PPT_EXTENSIONS:
-            mode = self.convert_slide.lower()
+            mode = (self.convert_slide or "none").lower()
+        else:
+            return None
+
+        if mode == "video":
+            return {"mode": mode, "page_duration": self.page_duration,
+                    "thumbnail_time_seconds": self.thumbnail_time_seconds,
+                    "renditions": self.renditions}
+        if mode == "sequence":
+            return {"mode": mode, "renditions": self.renditions}
+        return None
+
+    def active_extensions(self):
+        """現在の設定で処理対象になる拡張子の集合を返します。"""
+        return {ext for ext in SOURCE_EXTENSIONS if self.conversion_params(ext) is not None}
+
+    @staticmethod
+    def job_class(ext, mode):
+        """ファイルの種類と変換モードに対応するジョブの種類を返します。"""
+        if ext in VIDEO_EXTENSIONS:
+            return JOB_VIDEO
+        if ext == PDF_EXTENSION:
+            return JOB_ENCODE if mode == "video" else JOB_PDF
+        return JOB_OFFICE
+
+    async def process_file(self, file_path, ext, mode):
+        """変換モードに応じてファイルを処理し、生成された出力の辞書を返します。"""
+        # 書き込む出力を先に登録し、その監視イベントを破棄する
+        with OUTPUTS.writing(*self.expected_outputs(file_path, ext, mode)):
+            # 動画ファイルの場合、サムネイルを作成
+            if ext in VIDEO_EXTENSIONS:
+                return await self.create_thumbnail(file_path)
+
+            # PDFファイルの場合
+            if ext == PDF_EXTENSION:
+                if mode == "video":
+                    return await self.convert_pdf_to_video(file_path)
+                return await self.convert_pdf_to_images(file_path)
+
+            # PowerPointファイルの場合
             if mode == "video":
-                await self.convert_ppt_to_video(file_path)
-            elif mode == "sequence":
-                await self.convert_ppt_to_images(file_path)
-            else:
-                logging.info(f"Ignoring PowerPoint file: {
-                             file_path} (convert_slide={mode})")
+                return await self.convert_ppt_to_video(file_path)
+            return await self.convert_ppt_to_images(file_path)
 
-        # その他のファイル
+    def expected_outputs(self, file_path, ext, mode):
+        """ファイルの処理で書き込む出力の (ファイルのリスト, ディレクトリのリスト) を返します。"""
+        base = os.path.splitext(file_path)[0]
+        if ext in VIDEO_EXTENSIONS:
+            return list(rendition_paths(file_path, self.renditions).values()), []
+        if mode == "video":
+            # 変換した動画とそのサムネイル（PPTの場合は LibreOffice で変換した PDF を含む）
+            video_path = base + ".mp4"
+            files = [video_path] + list(rendition_paths(video_path, self.renditions).values())
+            if ext in PPT_EXTENSIONS:
+                files.append(base + PDF_EXTENSION)
+            return files, []
+        return list(rendition_paths(file_path, self.renditions).values()), [base + "_sequence"]
+
+    def restore_outputs(self, file_path, ext, outputs):
+        """マニフェストに記録された出力をファイルリストに復元します。"""
+        if ext in VIDEO_EXTENSIONS:
+            self.track(KIND_FILE, file_path, outputs=outputs, update=False)
         else:
-            logging.info(f"Ignoring file: {file_path} (unsupported extension)")
+            self.mark_source(file_path, STATUS_READY, outputs)
+        if "video" in outputs:
+            self.track(KIND_FILE, outputs["video"], source=file_path, update=False)
+        if "sequence" in outputs:
+            self.track(KIND_SEQUENCE_FOLDER, outputs["sequence"], source=file_path, update=False)
+
+    def track(self, kind, path, source=None, outputs=None, update=True):
+        """レジストリにパスを登録し、通知の差分に記録します（既にある場合は更新として記録）。"""
+        op = registry.add(path, kind, source, outputs)
+        if op == OP_ADD or update:
+            self.notifier.record(op, kind, path)
+
+    def untrack(self, path):
+        """レジストリからパスを削除し、通知の差分に記録します。"""
+        entry = registry.remove(path)
+        if entry is not None and entry.kind != KIND_SOURCE:
+            self.notifier.record(OP_REMOVE, entry.kind, path)
+
+    @staticmethod
+    def mark_source(file_path, status, outputs=None):
+        """
+        変換元のファイルの状態（processing / failed / ready）をレジストリに記録し、STATUS・LIST で参照できるようにします。
+        通知するファイルリストに既にある場合（再生成する動画）はその状態を更新し、ない場合は KIND_SOURCE として登録します。
+        """
+        entry = registry.get(file_path)
+        if entry is None or entry.kind == KIND_SOURCE:
+            registry.add(file_path, KIND_SOURCE, outputs=outputs, status=status)
+        else:
+            registry.set_status(file_path, status)
 
-        # イベントをキューに追加
-        self.queue_event(event)
+    def source_paths(self):
+        """ルート配下の KIND_SOURCE のエントリのパスのリストを返します。"""
+        return [path for path in registry.paths(KIND_SOURCE) if is_under(path, self.root)]
 
     async def handle_deleted(self, event):
         """ファイル削除時に非同期で処理します。"""
         file_path = event.src_path
         logging.info(f"handle_deleted called with file: {file_path}")
+        self.coalescer.discard(file_path)
+        self.scheduler.cancel(file_path)
+
+        self.untrack(file_path)
 
-        if file_path in video_files:
-            video_files.remove(file_path)
+        if self.manifest:
+            self.manifest.remove(file_path)
 
-        thumb_path = f"{os.path.splitext(file_path)[0]}_thumbnail.png"
-        if os.path.isfile(thumb_path):
-            os.remove(thumb_path)
-            logging.info(f"Thumbnail deleted: {thumb_path}")
+        thumb_paths = rendition_paths(file_path, self.renditions).values()
+        with OUTPUTS.writing(thumb_paths):
+            for thumb_path in thumb_paths:
+                if os.path.isfile(thumb_path):
+                    os.remove(thumb_path)
+                    logging.info(f"Thumbnail deleted: {thumb_path}")
 
         self.queue_event(event)
 
     async def create_thumbnail(self, file_path):
         """動画ファイルのサムネイル生成"""
         try:
-            await VideoThumbnailGenerator().create_thumbnail(file_path, self.thumbnail_time_seconds)
-            if file_path not in video_files:
-                video_files.append(file_path)
+            renditions = await VideoThumbnailGenerator(self.video_backend, self.renditions).create_thumbnail(file_path, self.thumbnail_time_seconds)
+            outputs = {"renditions": renditions}
+            self.track(KIND_FILE, file_path, outputs=outputs)
+            return outputs
         except Exception as e:
             logging.error(f"Failed to create video thumbnail: {e}")
 
     async def convert_pdf_to_images(self, pdf_path):
         """PDFをシーケンス画像に変換し、1ページ目をサムネイルに設定します。"""
         try:
-            output_dir = await self.pdf_converter.convert_pdf_to_images(pdf_path)
+            output_dir = str(await self.pdf_converter.convert_pdf_to_images(pdf_path))
 
-            if output_dir not in sequence_folders:
-                sequence_folders.append(output_dir)
-                return output_dir
+            outputs = {"sequence": output_dir, "renditions": rendition_paths(pdf_path, self.renditions)}
+            self.track(KIND_SEQUENCE_FOLDER, output_dir, source=pdf_path, outputs=outputs)
+            return outputs
         except Exception as e:
             logging.error(f"Failed to convert PDF: {e}")
 
@@ -166,7 +336,10 @@ class FileHandler(FileSystemEventHandler):
             )
 
             # 動画からサムネイルを生成（on_createdイベントが発火されないため手動で呼び出す）
-            await self.create_thumbnail(output_video)
+            outputs = await self.create_thumbnail(output_video)
+            if outputs:
+                outputs["video"] = output_video
+            return outputs
         except Exception as e:
             logging.error(f"Failed to convert PDF to video: {e}")
 
@@ -178,8 +351,10 @@ class FileHandler(FileSystemEventHandler):
 
         try:
             # PPTから動画に変換
-            self.ppt_converter.export_ppt_to_video(
-                folder_path, folder_path, self.page_duration)
+            # PowerPoint のエクスポートは完了まで待機するため、ワーカースレッドで実行する
+            with METRICS.timer(STAGE_OFFICE):
+                await asyncio.to_thread(
+                    self.ppt_converter.export_ppt_to_video, folder_path, folder_path, self.page_duration)
 
         except Exception as e:
             logging.error(f"Failed to convert PPT to video: {e}")
@@ -197,50 +372,132 @@ class FileHandler(FileSystemEventHandler):
 
         if os.path.exists(video_path):
             # 動画からサムネイルを生成（動画が正常にエクスポートされても、on_createdイベントが発火されないため手動で呼び出す）
-            await self.create_thumbnail(video_path)
+            outputs = await self.create_thumbnail(video_path)
             logging.info(f"Thumbnail created for video: {video_path}")
+            if outputs:
+                outputs["video"] = video_path
+            return outputs
 
     async def convert_ppt_to_images(self, ppt_path):
         """PPTX/PPSXをシーケンス画像に変換し、1ページ目をサムネイルに設定します。"""
         try:
             # PPTをシーケンス画像に変換
-            output_dir = await self.ppt_converter.convert_ppt_to_images(ppt_path)
+            # PowerPoint の書き出しはイベントループを塞がないようワーカースレッドで実行する
+            with METRICS.timer(STAGE_OFFICE):
+                output_dir = str(await asyncio.to_thread(self.ppt_converter.convert_ppt_to_images, ppt_path))
 
-            if output_dir not in sequence_folders:
-                sequence_folders.append(output_dir)
-                return output_dir
+            outputs = {"sequence": output_dir, "renditions": rendition_paths(ppt_path, self.renditions)}
+            self.track(KIND_SEQUENCE_FOLDER, output_dir, source=ppt_path, outputs=outputs)
+            return outputs
         except Exception as e:
             logging.error(f"Failed to convert PPT to images: {e}")
 
-    def queue_event(self, event):
-        """イベントをキューに追加し、UDPメッセージを送信します。"""
-        if self.event_queue is not None:
-            self.event_queue.append(event)
-            self.send_udp_message()
-
-    def send_udp_message(self):
-        """UDPメッセージを送信します。"""
-        if self.sender and self.event_queue:
-            try:
-                events = [{"type": event.event_type, "path": event.src_path}
-                          for event in self.event_queue]
-                message = json.dumps({
-                    "events": events,
-                    "files": video_files,
-                    "sequence_folders": sequence_folders
-                })
-                self.sender.send_message(self.ip, self.port, message)
-                self.event_queue.clear()
-            except Exception as e:
-                logging.error(f"Error in sending UDP message: {e}")
+    def queue_event(self, event, outputs=None):
+        """イベント（および生成された出力）を通知します。"""
+        self.notifier.queue_event(event_payload(event, outputs))
+
+    def reconfigure(self, config):
+        """
+        変換・送信のタイミングなどの設定（ルートごとの設定）を実行中に変更します。
+        出力に影響するパラメータが変わったファイルの拡張子の集合を返します。
+        """
+        before = {ext: self.conversion_params(ext) for ext in SOURCE_EXTENSIONS}
+        self.thumbnail_time_seconds = config['thumbnail_time_seconds']
+        self.page_duration = config['page_duration']
+        self.convert_slide = config['convert_slide']
+        self.convert_document = config['convert_document']
+        renditions = config.get('renditions') or DEFAULT_RENDITIONS
+        if renditions != self.renditions:
+            self.renditions = renditions
+            self.pdf_converter = PDFConverter(renditions)
+            self.ppt_converter = PowerPointConverter(renditions)
+        self.video_backend = config.get('video_backend', 'opencv')
+        self.max_workers = config.get('max_workers', 0)
+        self.coalescer.quiet_period = config.get('quiet_period', 2.0)
+        self.notifier.batcher.configure(
+            config['send_interval'], config.get('send_max_delay', 5), config.get('send_max_batch', 100))
+        after = {ext: self.conversion_params(ext) for ext in SOURCE_EXTENSIONS}
+        return {ext for ext in SOURCE_EXTENSIONS if before[ext] != after[ext]}
+
+    def set_sender(self, sender, ip, port, notify_format="delta", max_message_bytes=None, wire="json"):
+        """通知先を差し替え、新しい通知先にスナップショットを送信します（ファイルリストはそのまま）。"""
+        self.sender = sender
+        self.ip = ip
+        self.port = port
+        self.notifier.reroute(sender, ip, port, notify_format, max_message_bytes, encoder_for(wire, self.root))
+        self.notifier.send_snapshot("reconfigure")
+
+    async def reprocess(self, extensions):
+        """
+        変換の設定が変わった種類のファイルのみを再生成します。
+        変換しない設定になったファイルは、シーケンスフォルダをファイルリストから外します。
+        """
+        filelist = await asyncio.to_thread(scan_files, self.root, extensions, not self.ignore_subfolders)
+        targets = []
+        for file_path, stat_result in filelist:
+            ext = os.path.splitext(file_path)[1].lower()
+            params = self.conversion_params(ext)
+            mode = params["mode"] if params else None
+            # 変換した動画は動画ファイルとして残るため、シーケンスフォルダのみを外す
+            for entry in registry.from_source(file_path):
+                if entry.kind == KIND_SEQUENCE_FOLDER and mode != "sequence":
+                    self.untrack(entry.path)
+            if params is not None:
+                targets.append((file_path, stat_result))
+            else:
+                # 変換しなくなったファイルの状態を外す
+                entry = registry.get(file_path)
+                if entry is not None and entry.kind == KIND_SOURCE:
+                    self.untrack(file_path)
+                if self.manifest:
+                    self.manifest.remove(file_path)
+                self.queue_event(FileMockEvent(file_path, "modified"))
+        logging.info(f"Reprocessing {len(targets)} file(s) for changed settings: {sorted(extensions)}")
+        await handle_files(self, targets, self.max_workers, "modified")
+        if self.manifest:
+            self.manifest.save()
+
+    async def change_scope(self, ignore_subfolders):
+        """
+        サブフォルダを監視するかどうかを変更します。
+        新たに対象になったサブフォルダのファイルのみを処理し、対象外になったファイルはファイルリストから外します。
+        """
+        self.ignore_subfolders = ignore_subfolders
+        if not ignore_subfolders:
+            filelist = await asyncio.to_thread(scan_files, self.root, self.active_extensions())
+            await handle_files(self, [(path, stat_result) for path, stat_result in filelist
+                                      if os.path.dirname(path) != self.root], self.max_workers)
+            return
+        files, sequence_folders = registry.snapshot(self.root)
+        for path in files + sequence_folders + self.source_paths():
+            entry = registry.get(path)
+            # シーケンスフォルダ・変換した動画は元のファイルの場所で判断する
+            origin = entry.source if entry is not None and entry.source else path
+            if os.path.dirname(origin) != self.root:
+                self.untrack(path)
+        self.notifier.schedule()
+
+    def release(self):
+        """ルートの監視をやめる場合に、保留中のイベントを破棄し、配下のファイルをファイルリストから外します。"""
+        for path in list(self.coalescer.states):
+            self.coalescer.discard(path)
+            self.scheduler.cancel(path)
+        files, sequence_folders = registry.snapshot(self.root)
+        for path in files + sequence_folders + self.source_paths():
+            self.untrack(path)
+        self.notifier.close()
 
     def destroy(self, reason):
-        """終了メッセージを送信します。"""
+        """保留中のイベントと終了メッセージを送信します。"""
         if self.sender:
             try:
-                self.sender.send_message(self.ip, self.port, reason)
+                self.notifier.close()
+                self.sender.send_message(self.ip, self.port, self.notifier.encode(reason))
             except Exception as e:
                 logging.error(f"Error in sending message: {e}")
+        if self.manifest:
+            self.manifest.save()
+        self.coalescer.close()
         logging.info(f"Destroy called with reason: {reason}")
 
     async def list_files(self, start_path):
@@ -249,37 +506,131 @@ class FileHandler(FileSystemEventHandler):
         logging.info('===============')
         logging.info(f"Listing files in directory: {start_path}")
         print(f"Listing files in directory: {start_path}")
-        await set_filehandle(self, start_path, self.ignore_subfolders, [])
-        # 送信機能がある場合のみイベントを送信
-        if self.sender:
-            self.sender.send_message(self.ip, self.port, json.dumps({
-                "events": [{"type": "Startup", "path": ""}],
-                "files": video_files,
-                "sequence_folders": sequence_folders
-            }))
-
-
-async def set_filehandle(event_handler, start_path, ignore_subfolders, filelist):
-    """指定したディレクトリ（およびそのサブディレクトリ）内のすべてのファイルに対して `on_created` を呼び出します。"""
-    if ignore_subfolders:
-        for file in os.listdir(start_path):
-            file_path = os.path.join(start_path, file)
-            await event_handler.handle_created(FileMockEvent(file_path))
-    else:
-        for root, _, files in os.walk(start_path):
-            current_depth = root.count(
-                os.path.sep) - start_path.count(os.path.sep)
-            # サブディレクトリの深さが 4 以下の場合のみ処理を行う（誤使用を想定した暴走ガード）
-            if current_depth < 5:
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    await event_handler.handle_created(FileMockEvent(file_path))
+        # 起動時スキャン中の変更は差分として送らず、完了後のスナップショットに含める
+        self.notifier.suspended = True
+        try:
+            await set_filehandle(self, start_path, self.ignore_subfolders, self.max_workers)
+        finally:
+            self.notifier.suspended = False
+        if self.manifest:
+            self.manifest.save()
+        # 送信機能がある場合のみスナップショットを送信
+        self.notifier.send_snapshot("startup")
+
+
+def resume_main_loop():
+    """MAIN_LOOP をバックグラウンドスレッドで実行し、監視中のイベントを処理できるようにします。"""
+    global _loop_thread
+    if _loop_thread is None or not _loop_thread.is_alive():
+        _loop_thread = threading.Thread(
+            target=MAIN_LOOP.run_forever, name="thumb-crafter-loop", daemon=True)
+        _loop_thread.start()
+
+
+def pause_main_loop():
+    """バックグラウンドスレッドの MAIN_LOOP を停止し、スレッドの終了を待ちます。"""
+    global _loop_thread
+    if _loop_thread is not None and _loop_thread.is_alive():
+        MAIN_LOOP.call_soon_threadsafe(MAIN_LOOP.stop)
+        _loop_thread.join()
+    _loop_thread = None
+
+
+def run_in_main_loop(coro):
+    """
+    コルーチンを呼び出し元のスレッド（GUIスレッド）で MAIN_LOOP 上で実行し、
+    完了後は MAIN_LOOP をバックグラウンドで再開します。
+    """
+    pause_main_loop()
+    try:
+        return MAIN_LOOP.run_until_complete(coro)
+    finally:
+        resume_main_loop()
+
+
+def event_payload(event, outputs=None):
+    """通知メッセージに含めるイベント情報を作成します（生成したレンディションのパスを含む）。"""
+    payload = {"type": event.event_type, "path": event.src_path}
+    if outputs and outputs.get("renditions"):
+        payload["renditions"] = outputs["renditions"]
+    return payload
+
+
+async def set_filehandle(event_handler, start_path, ignore_subfolders, max_workers=None):
+    """指定したディレクトリ（およびそのサブディレクトリ）内の処理対象のファイルに対して、最大 max_workers 件を並行して `handle_created` を呼び出します。"""
+    # ディレクトリの走査はブロッキングのため別スレッドで実行（処理対象外の拡張子はここで除外する）
+    filelist = await asyncio.to_thread(
+        scan_files, start_path, event_handler.active_extensions(), not ignore_subfolders)
+    await handle_files(event_handler, filelist, max_workers)
+
+
+async def handle_files(event_handler, filelist, max_workers=None, event_type="created"):
+    """
+    (パス, stat_result) のリストに対して、起動時スキャンと同じ優先度で最大 max_workers 件を並行して `handle_created` を呼び出します。
+    stat_result が None の場合は処理時に取得します。
+    """
+    max_workers = max(1, max_workers or os.cpu_count() or 1)
+    progress = event_handler.scan_progress = ScanProgress(len(filelist))
+    logging.info(f"Startup scan: {progress.total} files, {max_workers} workers")
+    pending = iter(filelist)
+
+    async def worker():
+        # 共有イテレータから次のファイルを取り出して処理する（イベントループ内のため排他不要）
+        for file_path, stat_result in pending:
+            try:
+                await event_handler.handle_created(FileMockEvent(file_path, event_type, stat_result))
+            except Exception as e:
+                logging.error(f"Failed to handle file during startup scan: {file_path} ({e})")
+            progress.advance()
+
+    await asyncio.gather(*(worker() for _ in range(min(max_workers, len(filelist)))))
+    progress.finish()
+
+
+class ScanProgress:
+    """起動時スキャンの進捗を一定間隔でログ出力します。"""
+    REPORT_INTERVAL = 5  # 秒
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.started = time.monotonic()
+        self.last_report = self.started
+        self.finished = None
+
+    def advance(self):
+        self.done += 1
+        now = time.monotonic()
+        if now - self.last_report >= self.REPORT_INTERVAL:
+            self.last_report = now
+            self.report(now)
+
+    def report(self, now):
+        elapsed = max(now - self.started, 1e-6)
+        percent = self.done * 100 // self.total if self.total else 100
+        message = (f"Startup scan: {self.done}/{self.total} ({percent}%), "
+                   f"{self.done / elapsed:.1f} files/s")
+        logging.info(message)
+        print(message)
+
+    def finish(self):
+        self.finished = time.monotonic()
+        self.report(self.finished)
+
+    def to_dict(self):
+        elapsed = max((self.finished or time.monotonic()) - self.started, 1e-6)
+        return {"total": self.total, "done": self.done, "finished": self.finished is not None,
+                "elapsed_sec": round(elapsed, 3), "files_per_sec": round(self.done / elapsed, 1)}
 
 
 class FileMockEvent:
     """on_createdに渡すための擬似イベントクラス"""
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, event_type='created', stat_result=None):
         self.src_path = file_path
         self.is_directory = False
-        self.event_type = 'created'
+        self.event_type = event_type
+        # 起動時スキャンで取得した stat（None の場合は処理時に取得する）
+        self.stat_result = stat_result
+        # 起動時スキャンのイベントはライブイベントより低い優先度で処理する
+        self.startup = True
@@ -0,0 +1,178 @@
+"""
+生成済みの出力（サムネイル、シーケンスフォルダ、動画）を記録する永続マニフェスト。
+パス・サイズ・更新日時（およびオプションで高速フィンガープリント）をキーにして、
+起動時に変更のないファイルの再生成をスキップします。
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from utils.solvepath import exe_path
+
+# シーケンスフォルダ内のページ画像（PDF は page-000.png から、PPT は page-001.png から）
+PAGE_IMAGE_PATTERN = re.compile(r"page-\d+\.png")
+
+
+class ThumbnailManifest:
+    VERSION = 1
+    # フィンガープリントに使用する先頭・末尾のバイト数
+    FINGERPRINT_BLOCK = 64 * 1024
+    # ライブイベント時に保存する最小間隔（秒）
+    SAVE_INTERVAL = 10
+
+    def __init__(self, manifest_path, use_fingerprint=False):
+        self.path = manifest_path
+        self.use_fingerprint = use_fingerprint
+        self.entries = {}
+        self.dirty = False
+        self.last_saved = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def for_target(cls, target, app_name="thumb-crafter", use_fingerprint=False):
+        """監視対象ディレクトリごとのマニフェストを作成します（exeと同じディレクトリに保存）。"""
+        digest = hashlib.md5(cls.normalize(target).encode("utf-8")).hexdigest()[:8]
+        return cls(exe_path(f"{app_name}_manifest_{digest}.json"), use_fingerprint)
+
+    @staticmethod
+    def normalize(file_path):
+        return os.path.normcase(os.path.abspath(file_path))
+
+    def load(self):
+        """マニフェストを読み込みます。破損している場合は空の状態から開始します。"""
+        if not os.path.exists(self.path):
+            return self
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION:
+                self.entries = data.get("entries", {})
+            logging.info(f"Manifest loaded: {self.path} ({len(self.entries)} entries)")
+        except Exception as e:
+            logging.error(f"Failed to load manifest, starting empty: {e}")
+            self.entries = {}
+        return self
+
+    def save(self, force=True):
+        """マニフェストを一時ファイル経由でアトミックに保存します。"""
+        if not self.dirty:
+            return
+        if not force and time.monotonic() - self.last_saved < self.SAVE_INTERVAL:
+            return
+        with self.lock:
+            data = {"version": self.VERSION, "entries": dict(self.entries)}
+            self.dirty = False
+            self.last_saved = time.monotonic()
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            self.dirty = True
+            logging.error(f"Failed to save manifest: {e}")
+
+    def fingerprint(self, file_path, size):
+        """ファイルの先頭と末尾のブロックから高速なフィンガープリントを計算します。"""
+        digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+        with open(file_path, 'rb') as f:
+            digest.update(f.read(self.FINGERPRINT_BLOCK))
+            if size > self.FINGERPRINT_BLOCK * 2:
+                f.seek(-self.FINGERPRINT_BLOCK, os.SEEK_END)
+                digest.update(f.read(self.FINGERPRINT_BLOCK))
+        return digest.hexdigest()
+
+    def file_state(self, file_path, stat_result=None):
+        stat_result = stat_result or os.stat(file_path)
+        return {"size": stat_result.st_size, "mtime": stat_result.st_mtime_ns}
+
+    def lookup(self, file_path, params, stat_result=None):
+        """
+        ファイルが前回の処理から変更されておらず、出力がすべて存在する場合は出力の辞書を返します。
+        それ以外の場合は None を返します。
+        """
+        entry = self.entries.get(self.normalize(file_path))
+        if entry is None or entry.get("params") != params:
+            return None
+        try:
+            state = self.file_state(file_path, stat_result)
+        except OSError:
+            return None
+        if state["size"] != entry.get("size"):
+            return None
+        if state["mtime"] != entry.get("mtime"):
+            # 更新日時のみ異なる場合（コピーや復元）はフィンガープリントで同一性を確認
+            if not self.use_fingerprint or not entry.get("fingerprint"):
+                return None
+            try:
+                if self.fingerprint(file_path, state["size"]) != entry["fingerprint"]:
+                    return None
+            except OSError:
+                return None
+            with self.lock:
+                entry["mtime"] = state["mtime"]
+                self.dirty = True
+        outputs = entry.get("outputs", {})
+        if not all(os.path.exists(path) for path in output_paths(outputs)):
+            return None
+        # シーケンスフォルダが残っていても、ページ画像が削除されている場合は再生成する
+        sequence_dir = outputs.get("sequence")
+        if sequence_dir and not all(os.path.exists(os.path.join(sequence_dir, name))
+                                    for name in entry.get("pages", [])):
+            return None
+        return outputs
+
+    def record(self, file_path, params, outputs, stat_result=None):
+        """処理済みファイルの状態と出力を記録します。"""
+        try:
+            state = self.file_state(file_path, stat_result)
+            if self.use_fingerprint:
+                state["fingerprint"] = self.fingerprint(file_path, state["size"])
+        except OSError as e:
+            logging.error(f"Failed to record manifest entry for {file_path}: {e}")
+            return
+        state["params"] = params
+        state["outputs"] = normalize_outputs(outputs)
+        if "sequence" in state["outputs"]:
+            state["pages"] = sequence_pages(state["outputs"]["sequence"])
+        with self.lock:
+            self.entries[self.normalize(file_path)] = state
+            self.dirty = True
+
+    def get(self, file_path):
+        """記録されているエントリ（状態・パラメータ・出力）のコピーを返します（記録がない場合は None）。"""
+        with self.lock:
+            entry = self.entries.get(self.normalize(file_path))
+            return dict(entry) if entry is not None else None
+
+    def remove(self, file_path):
+        with self.lock:
+            if self.entries.pop(self.normalize(file_path), None) is not None:
+                self.dirty = True
+
+
+def normalize_outputs(outputs):
+    """出力の辞書（レンディションなどの入れ子を含む）をJSONに保存できる形に変換します。"""
+    if isinstance(outputs, dict):
+        return {name: normalize_outputs(value) for name, value in outputs.items() if value}
+    return str(outputs)
+
+
+def sequence_pages(sequence_dir):
+    """シーケンスフォルダ内のページ画像のファイル名のリストを返します。"""
+    try:
+        return sorted(name for name in os.listdir(sequence_dir) if PAGE_IMAGE_PATTERN.fullmatch(name))
+    except OSError:
+        return []
+
+
+def output_paths(outputs):
+    """出力の辞書に含まれるすべてのパスを列挙します。"""
+    for value in outputs.values():
+        if isinstance(value, dict):
+            yield from output_paths(value)
+        else:
+            yield value
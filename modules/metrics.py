@@ -0,0 +1,165 @@
+"""
+処理段階ごとのメトリクス（カウンタ・レイテンシのヒストグラム・ゲージ）を集計するモジュール。
+IPCサーバーの METRICS コマンド（または GET /metrics）で Prometheus のテキスト形式として取得できます。
+
+    with METRICS.timer("decode"):
+        frame = ...
+
+watchdog のスレッドからも呼び出されるため、更新はロックで保護しています。
+"""
+import time
+import threading
+from contextlib import contextmanager
+
+
+PREFIX = "thumbcrafter"
+
+# 処理段階
+STAGE_EVENT = "event"            # watchdogイベントの受信
+STAGE_PROBE = "probe"            # 動画の長さ取得
+STAGE_DECODE = "decode"          # フレームのデコード
+STAGE_ENCODE = "encode"          # サムネイル・動画の書き出し
+STAGE_PDF_RENDER = "pdf_render"  # PDFページのレンダリング
+STAGE_OFFICE = "office"          # PowerPoint/LibreOfficeによる変換
+STAGE_NOTIFY = "notify"          # 通知の送信
+STAGE_TCP_SEND = "tcp_send"      # TCP接続（再接続を含む）と書き込み
+STAGE_TCP_QUEUE = "tcp_queue"    # TCP送信キューに追加してから送信完了まで
+STAGE_POLL = "poll"              # ポーリング監視の1回のスキャン
+
+
+class Histogram:
+    # バケットの上限（秒）
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+    def __init__(self):
+        self.counts = [0] * len(self.BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.BUCKETS, self.counts):
+            total += count
+            yield bound, total
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}    # (名前, ラベル) -> 値
+        self.histograms = {}  # 処理段階 -> Histogram
+        self.collectors = {}  # 名前 -> ゲージを返す関数
+        self.started = time.time()
+
+    def inc(self, name, value=1, **labels):
+        """カウンタを加算します。"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, stage, seconds, result="ok"):
+        """処理段階の所要時間と結果（ok / error / cancelled）を記録します。"""
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+        self.inc("stage_total", stage=stage, result=result)
+
+    @contextmanager
+    def timer(self, stage):
+        """with ブロックの所要時間を記録します。例外はそのまま送出されます。"""
+        started = time.perf_counter()
+        result = "ok"
+        try:
+            yield
+        except BaseException as e:
+            result = "cancelled" if type(e).__name__ in ("CancelledError", "JobCancelled") else "error"
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - started, result)
+
+    def register(self, name, collector):
+        """
+        ゲージを返す関数を登録します（同じ名前で登録し直すと置き換え）。
+        関数は (メトリクス名, ラベルの辞書, 値) のリストを返してください。
+        """
+        with self.lock:
+            self.collectors[name] = collector
+
+    def unregister(self, name, collector=None):
+        """登録を解除します（collector を指定した場合は、その関数が登録されている場合のみ）。"""
+        with self.lock:
+            if collector is None or self.collectors.get(name) == collector:
+                self.collectors.pop(name, None)
+
+    def gauges(self):
+        with self.lock:
+            collectors = list(self.collectors.values())
+        values = [("uptime_seconds", {}, time.time() - self.started)]
+        for collector in collectors:
+            try:
+                values.extend(collector())
+            except Exception:
+                # 停止中のコンポーネントなど。取得できないゲージは省略する
+                continue
+        return values
+
+    def snapshot(self):
+        """現在の値を辞書で返します。"""
+        with self.lock:
+            counters = [(name, dict(labels), value) for (name, labels), value in self.counters.items()]
+            stages = {
+                stage: {"count": h.count, "sum": h.sum, "buckets": dict(h.cumulative())}
+                for stage, h in self.histograms.items()
+            }
+        return {"counters": counters, "stages": stages, "gauges": self.gauges()}
+
+    def render(self):
+        """Prometheus のテキスト形式で出力します。"""
+        snapshot = self.snapshot()
+        lines = []
+        declared = set()
+        for name, labels, value in sorted(snapshot["counters"], key=lambda c: (c[0], sorted(c[1].items()))):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {PREFIX}_{name} counter")
+            lines.append(f"{PREFIX}_{name}{format_labels(labels)} {value}")
+
+        name = f"{PREFIX}_stage_seconds"
+        lines.append(f"# TYPE {name} histogram")
+        for stage, data in sorted(snapshot["stages"].items()):
+            for bound, count in data["buckets"].items():
+                lines.append(f"{name}_bucket{format_labels({'stage': stage, 'le': bound})} {count}")
+            lines.append(f"{name}_bucket{format_labels({'stage': stage, 'le': '+Inf'})} {data['count']}")
+            lines.append(f"{name}_sum{format_labels({'stage': stage})} {data['sum']:.6f}")
+            lines.append(f"{name}_count{format_labels({'stage': stage})} {data['count']}")
+
+        for name, labels, value in snapshot["gauges"]:
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {PREFIX}_{name} gauge")
+            lines.append(f"{PREFIX}_{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# アプリ全体で共有するメトリクス
+METRICS = Metrics()
@@ -0,0 +1,239 @@
+"""
+通知メッセージ（UDP/TCP）のプロトコル。
+バージョン2（delta）では、起動時と要求時にファイルリスト全体のスナップショットを送信し、
+以降は追加・削除・更新の差分のみを連番（seq）付きで送信します。
+
+    {"version": 2, "type": "snapshot", "root": "...", "session": "...", "seq": 10, "snapshot_id": "...",
+     "chunk": 0, "chunks": 1, "reason": "startup", "files": [...], "sequence_folders": [...]}
+    {"version": 2, "type": "delta", "root": "...", "session": "...", "seq": 11,
+     "events": [{"type": "created", "path": "..."}],
+     "changes": [{"op": "add", "kind": "file", "path": "..."}]}
+
+session と seq、ファイルリストは監視対象のルートディレクトリ（root）ごとに独立しています。
+複数のルートが同じ通知先を共有する場合があるため、受信側は (root, session) ごとに状態を保持します。
+受信側は seq が連続していない場合（または session が変わった場合）に、IPCの RESYNC コマンドで
+スナップショットの再送を要求できます（SNAPSHOT コマンドは応答として直接スナップショットを返します）。
+UDPの1データグラムに収まらないメッセージは、単独で解釈できる複数のメッセージに分割されます。
+notify_format が "legacy" の場合は従来どおり毎回ファイルリスト全体を送信します。
+送信するバイト列への変換は encode（utils.communication.wire）で行います。
+batcher（EventBatcher）を設定すると、イベントを保留して batcher が決めたタイミングでまとめて送信します。
+"""
+import json
+import uuid
+import logging
+import threading
+from modules.metrics import METRICS, STAGE_NOTIFY
+from utils.communication.wire import encode_json
+
+
+PROTOCOL_VERSION = 2
+FORMATS = ("delta", "legacy")
+# UDPで1メッセージに使用する最大バイト数（pickleのオーバーヘッドを考慮し64KBより小さくする）
+UDP_MAX_MESSAGE_BYTES = 60000
+
+# 差分の種類
+OP_ADD = "add"
+OP_REMOVE = "remove"
+OP_UPDATE = "update"
+# ファイルリストの種類
+KIND_FILE = "file"                        # files（動画ファイル）
+KIND_SEQUENCE_FOLDER = "sequence_folder"  # sequence_folders
+
+
+class Notifier:
+    def __init__(self, sender, ip, port, snapshot_source, message_format="delta", max_message_bytes=None, encode=None,
+                 root=None):
+        self.sender = sender
+        self.ip = ip
+        self.port = port
+        # 現在のファイルリスト (files, sequence_folders) を返す関数
+        self.snapshot_source = snapshot_source
+        self.message_format = message_format if message_format in FORMATS else "delta"
+        # 1メッセージの最大バイト数（None の場合は分割しない）
+        self.max_message_bytes = max_message_bytes
+        # メッセージ（辞書または文字列）をワイヤ形式に変換する関数
+        self.encode = encode or encode_json
+        # メッセージの送信元のルートディレクトリ（同じ通知先を共有するルートを受信側で区別する）
+        self.root = root
+        # 受信側がアプリの再起動を検出するためのID
+        self.session = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.events = []
+        self.changes = []
+        # 起動時スキャン中は差分を送らず、完了後にスナップショットを送信する
+        self.suspended = False
+        # 送信のタイミングを決める EventBatcher（None の場合はイベントごとに送信する）
+        self.batcher = None
+        # IPC の購読者に配信する SubscriptionHub（modules.pubsub）
+        self.hub = None
+        self.lock = threading.Lock()
+
+    @property
+    def legacy(self):
+        return self.message_format == "legacy"
+
+    def record(self, op, kind, path):
+        """ファイルリストの変更を次の差分に記録します。"""
+        if (self.legacy and not self.hub) or self.suspended:
+            return
+        with self.lock:
+            self.changes.append({"op": op, "kind": kind, "path": path})
+
+    def queue_event(self, payload):
+        """イベントを追加し、保留中の差分を送信します（batcher がある場合は送信を予約します）。"""
+        if self.suspended:
+            return
+        with self.lock:
+            self.events.append(payload)
+        self.schedule()
+
+    def schedule(self, count=1):
+        """保留中のイベントと差分の送信を予約します（batcher がない場合は直ちに送信します）。"""
+        if self.batcher:
+            self.batcher.add(count)
+        else:
+            self.flush()
+
+    def close(self):
+        """保留中のイベントを送信します（終了時）。"""
+        if self.batcher:
+            self.batcher.close()
+        else:
+            self.flush()
+
+    def reroute(self, sender, ip, port, message_format, max_message_bytes, encode):
+        """通知先とメッセージの形式を変更します（設定の再読み込み時）。保留中のイベントは変更前の通知先に送信します。"""
+        self.close()
+        with self.lock:
+            self.sender = sender
+            self.ip = ip
+            self.port = port
+            self.message_format = message_format if message_format in FORMATS else "delta"
+            self.max_message_bytes = max_message_bytes
+            self.encode = encode or encode_json
+
+    def flush(self):
+        """保留中のイベントと差分をメッセージにして送信します（購読者にも配信します）。"""
+        with self.lock:
+            events, changes = self.events, self.changes
+            self.events, self.changes = [], []
+        if not events and not changes:
+            return
+        self.publish(events, changes)
+        if not self.sender:
+            return
+        try:
+            with METRICS.timer(STAGE_NOTIFY):
+                if self.legacy:
+                    files, sequence_folders = self.snapshot_source()
+                    messages = [self.encode({
+                        "root": self.root,
+                        "events": events,
+                        "files": files,
+                        "sequence_folders": sequence_folders
+                    })]
+                else:
+                    messages = self.delta_messages(events, changes)
+                self.send(messages)
+        except Exception as e:
+            logging.error(f"Error in sending notification: {e}")
+
+    def publish(self, events, changes):
+        """IPC の購読者にイベントと差分を配信します。"""
+        if self.hub and (events or changes):
+            try:
+                self.hub.publish(events, changes)
+            except Exception as e:
+                logging.error(f"Error in publishing notification: {e}")
+
+    def delta_messages(self, events, changes):
+        """差分を最大サイズに収まるように分割し、連番を付けたメッセージのリストを返します。"""
+        messages = []
+        for chunk in split_items({"events": events, "changes": changes}, self.max_message_bytes):
+            with self.lock:
+                self.seq += 1
+                seq = self.seq
+            messages.append(self.encode({
+                "version": PROTOCOL_VERSION, "type": "delta", "root": self.root, "session": self.session, "seq": seq,
+                **chunk
+            }))
+        return messages
+
+    def snapshot(self, reason="request"):
+        """現在のファイルリスト全体のスナップショットを（分割せずに）返します。"""
+        files, sequence_folders = self.snapshot_source()
+        with self.lock:
+            seq = self.seq
+        return {
+            "version": PROTOCOL_VERSION, "type": "snapshot", "root": self.root, "session": self.session, "seq": seq,
+            "snapshot_id": uuid.uuid4().hex[:12], "chunk": 0, "chunks": 1, "reason": reason,
+            "files": list(files), "sequence_folders": list(sequence_folders)
+        }
+
+    def snapshot_messages(self, reason):
+        """スナップショットを最大サイズに収まるように分割したメッセージのリストを返します。"""
+        snapshot = self.snapshot(reason)
+        fields = {"files": snapshot["files"], "sequence_folders": snapshot["sequence_folders"]}
+        chunks = list(split_items(fields, self.max_message_bytes)) or [{"files": [], "sequence_folders": []}]
+        messages = []
+        for index, chunk in enumerate(chunks):
+            snapshot.update(chunk, chunk=index, chunks=len(chunks))
+            messages.append(self.encode(snapshot))
+        return messages
+
+    def send_snapshot(self, reason):
+        """スナップショットを送信します（起動時、または受信側からの再同期要求時）。"""
+        if not self.sender:
+            return
+        if self.legacy:
+            files, sequence_folders = self.snapshot_source()
+            self.send([self.encode({
+                "root": self.root,
+                "events": [{"type": "Startup", "path": ""}],
+                "files": files,
+                "sequence_folders": sequence_folders
+            })])
+            return
+        # スナップショットより前の差分（changes）はスナップショットに反映されるため送信しない。
+        # イベント（既存ファイルの更新など）はスナップショットに含まれないため、差分として先に送信する
+        with self.lock:
+            events, changes = self.events, self.changes
+            self.events, self.changes = [], []
+        if self.batcher:
+            self.batcher.discard()
+        # 購読者はスナップショットを受け取らないため、差分も含めて配信する
+        self.publish(events, changes)
+        try:
+            with METRICS.timer(STAGE_NOTIFY):
+                messages = self.delta_messages(events, []) if events else []
+                self.send(messages + self.snapshot_messages(reason))
+        except Exception as e:
+            logging.error(f"Error in sending snapshot: {e}")
+
+    def send(self, messages):
+        for message in messages:
+            self.sender.send_message(self.ip, self.port, message)
+        METRICS.inc("notify_messages_total", len(messages), format=self.message_format)
+
+
+def split_items(fields, max_bytes):
+    """
+    {フィールド名: 値のリスト} を、JSONにしたときに max_bytes 程度に収まるように分割し、
+    同じ形の辞書を順に返します（max_bytes が None の場合は分割しない）。
+    1件で max_bytes を超える値はそのまま1つのメッセージになります。
+    """
+    # メッセージのヘッダー部分の余裕
+    budget = max_bytes - 512 if max_bytes else None
+    chunk = {name: [] for name in fields}
+    size = 0
+    for name, values in fields.items():
+        for value in values:
+            value_size = len(json.dumps(value)) + 2
+            if size and budget and size + value_size > budget:
+                yield chunk
+                chunk = {name: [] for name in fields}
+                size = 0
+            chunk[name].append(value)
+            size += value_size
+    if size:
+        yield chunk
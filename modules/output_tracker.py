@@ -0,0 +1,94 @@
+"""
+thumb-crafter が監視対象のディレクトリに書き込む出力（サムネイル、シーケンスフォルダのページ画像、変換した動画など）の記録。
+書き込む前にパスを登録しておき、その出力による監視イベントを watchdog のスレッドで破棄します
+（イベントループに渡さず、通知も送信しない）。
+
+    with OUTPUTS.writing([thumbnail_path], [sequence_dir]):
+        ...  # 出力を書き込む
+
+ディレクトリを登録した場合は、その配下のすべてのパスが対象になります。
+イベントは書き込みの完了後に届くこともあるため、登録は書き込みの終了から grace 秒後まで有効です。
+ログや manifest のように常に書き込むパスは exclude で期限なしに登録します。
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+from modules.metrics import METRICS
+
+
+# 書き込みの終了後も出力のイベントを破棄する秒数
+DEFAULT_GRACE = 5.0
+
+
+def normalize(path):
+    return os.path.normcase(os.path.abspath(str(path)))
+
+
+class OutputTracker:
+    def __init__(self, grace=DEFAULT_GRACE):
+        self.grace = grace
+        self.lock = threading.Lock()
+        # 正規化したパス -> 書き込み中の数（0 の場合は expires の期限まで有効）
+        self.active = {}
+        # 正規化したパス -> 期限（time.monotonic()、期限なしの場合は None）
+        self.expires = {}
+        METRICS.register("outputs", self.collect_metrics)
+
+    @contextmanager
+    def writing(self, files=(), directories=()):
+        """with ブロックの間（と終了後 grace 秒）、files と directories 配下のパスのイベントを破棄します。"""
+        paths = [normalize(path) for path in list(files) + list(directories)]
+        with self.lock:
+            for path in paths:
+                self.active[path] = self.active.get(path, 0) + 1
+        try:
+            yield
+        finally:
+            deadline = time.monotonic() + self.grace
+            with self.lock:
+                for path in paths:
+                    count = self.active.get(path, 0) - 1
+                    if count > 0:
+                        self.active[path] = count
+                        continue
+                    self.active.pop(path, None)
+                    if self.expires.get(path, 0) is not None:
+                        self.expires[path] = deadline
+                self.purge()
+
+    def exclude(self, path):
+        """path（ディレクトリの場合は配下のすべて）のイベントを常に破棄します。"""
+        with self.lock:
+            self.expires[normalize(path)] = None
+
+    def matches(self, path):
+        """path が登録した出力（またはその配下）かどうかを返します。watchdog のスレッドから呼び出されます。"""
+        path = normalize(path)
+        now = time.monotonic()
+        with self.lock:
+            if not self.active and not self.expires:
+                return False
+            while True:
+                if path in self.active:
+                    return True
+                deadline = self.expires.get(path, 0)
+                if deadline is None or deadline > now:
+                    return True
+                parent = os.path.dirname(path)
+                if parent == path:
+                    return False
+                path = parent
+
+    def purge(self):
+        """期限の過ぎた登録を削除します（ロックを取得して呼び出してください）。"""
+        now = time.monotonic()
+        for path in [path for path, deadline in self.expires.items() if deadline is not None and deadline <= now]:
+            del self.expires[path]
+
+    def collect_metrics(self):
+        with self.lock:
+            return [("output_paths_tracked", {}, len(self.active) + len(self.expires))]
+
+
+OUTPUTS = OutputTracker()
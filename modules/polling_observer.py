@@ -0,0 +1,234 @@
+"""
+ネイティブのファイルイベントが届かない・取りこぼされるネットワーク共有（SMB/NFS）向けのポーリング監視。
+watchdog の Observer と同じ schedule / unschedule / start / stop / join を持ち、
+os.scandir によるスナップショット（パス、サイズ、更新日時、inode）の差分を作成・変更・削除・移動のイベントとしてハンドラに渡します。
+
+    watch_mode: "polling" の場合に main.py で Observer の代わりに使用します。
+
+- ディレクトリの更新日時をキャッシュし、前回から変化のないディレクトリは一覧を取得し直しません
+  （ディレクトリの更新日時はエントリの追加・削除・名前の変更でのみ変わるため、
+  既存ファイルの上書きは poll_full_scan_interval 秒ごとのフルスキャンで検出します）。
+- 差分はディレクトリごとに辞書で比較するため、ファイル数に対して線形の時間で求められます。
+  削除と作成の組で inode とサイズが一致するものは移動として通知します。
+- ポーリング間隔はスキャンにかかった時間に合わせて延長します（ツリーが大きいほど間隔が長くなる）。
+- 共有に接続できない間はスナップショットを保持し、ファイルが削除されたとはみなしません。
+"""
+import os
+import time
+import logging
+import threading
+from watchdog.events import FileCreatedEvent, FileModifiedEvent, FileDeletedEvent, FileMovedEvent
+from modules.metrics import METRICS, STAGE_POLL
+
+
+# ポーリング間隔（秒）に対するスキャン時間の上限の割合（スキャンが 1 秒かかった場合は 10 秒以上空ける）
+SCAN_DUTY_CYCLE = 0.1
+
+
+class DirectoryState:
+    """1つのディレクトリの一覧（更新日時が変わらない間は次のスキャンで再利用する）"""
+    __slots__ = ("mtime", "files", "dirs")
+
+    def __init__(self, mtime, files, dirs):
+        self.mtime = mtime
+        # ファイルのパス -> (サイズ, 更新日時, inode)
+        self.files = files
+        # サブディレクトリのパスのリスト
+        self.dirs = dirs
+
+
+class PollingWatch:
+    def __init__(self, handler, path, recursive):
+        self.handler = handler
+        self.path = os.path.abspath(path)
+        self.is_recursive = recursive
+        # ディレクトリのパス -> DirectoryState（None の場合は次のスキャンを基準にする）
+        self.snapshot = None
+        self.last_full_scan = 0.0
+        self.entries = 0
+
+
+class PollingObserver:
+    def __init__(self, interval=5.0, max_interval=60.0, full_scan_interval=300.0):
+        self.interval = max(0.1, interval)
+        self.max_interval = max(self.interval, max_interval)
+        self.full_scan_interval = full_scan_interval
+        # スキャン時間に合わせて延長した現在のポーリング間隔
+        self.current_interval = self.interval
+        self.watches = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        METRICS.register("polling", self.collect_metrics)
+
+    def schedule(self, handler, path, recursive=False):
+        """ディレクトリの監視を追加し、unschedule に渡すオブジェクトを返します。"""
+        watch = PollingWatch(handler, path, recursive)
+        with self.lock:
+            self.watches.append(watch)
+        return watch
+
+    def unschedule(self, watch):
+        with self.lock:
+            if watch in self.watches:
+                self.watches.remove(watch)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="thumb-crafter-polling", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def join(self, timeout=None):
+        if self.thread is not None:
+            self.thread.join(timeout)
+        METRICS.unregister("polling", self.collect_metrics)
+
+    def run(self):
+        while not self.stopped.is_set():
+            started = time.monotonic()
+            with self.lock:
+                watches = list(self.watches)
+            for watch in watches:
+                if self.stopped.is_set():
+                    break
+                try:
+                    self.poll(watch)
+                except Exception as e:
+                    logging.error(f"Polling failed: {watch.path} ({e})")
+            elapsed = time.monotonic() - started
+            self.current_interval = min(self.max_interval, max(self.interval, elapsed / SCAN_DUTY_CYCLE))
+            self.stopped.wait(max(0.0, self.current_interval - elapsed))
+
+    def poll(self, watch):
+        """スナップショットを取得し、前回との差分をイベントとしてハンドラに渡します。"""
+        now = time.monotonic()
+        full = watch.snapshot is None or now - watch.last_full_scan >= self.full_scan_interval
+        started = time.perf_counter()
+        snapshot = scan(watch.path, watch.is_recursive, watch.snapshot, full)
+        if snapshot is None:
+            logging.warning(f"Polling skipped, directory is not accessible: {watch.path}")
+            METRICS.observe(STAGE_POLL, time.perf_counter() - started, "error")
+            return
+        METRICS.observe(STAGE_POLL, time.perf_counter() - started)
+        METRICS.inc("poll_scans_total", type="full" if full else "incremental")
+        if full:
+            watch.last_full_scan = now
+        previous, watch.snapshot = watch.snapshot, snapshot
+        watch.entries = sum(len(state.files) for state in snapshot.values())
+        if previous is None:
+            return
+        for event in diff(previous, snapshot):
+            METRICS.inc("poll_events_total", type=event.event_type)
+            watch.handler.dispatch(event)
+
+    def collect_metrics(self):
+        with self.lock:
+            entries = sum(watch.entries for watch in self.watches)
+        return [("poll_interval_seconds", {}, self.current_interval),
+                ("poll_entries", {}, entries)]
+
+
+def scan(root, recursive, previous=None, full=False):
+    """
+    root 以下のスナップショット {ディレクトリのパス: DirectoryState} を返します（root にアクセスできない場合は None）。
+    previous を指定した場合、更新日時が変わっていないディレクトリは previous の一覧を再利用します（full の場合はすべて取得し直す）。
+    """
+    try:
+        root_mtime = os.stat(root).st_mtime_ns
+    except OSError:
+        return None
+    snapshot = {}
+    stack = [(root, root_mtime)]
+    while stack:
+        path, mtime = stack.pop()
+        old = previous.get(path) if previous else None
+        if old is not None and not full and old.mtime == mtime:
+            state = old
+        else:
+            state = list_directory(path, mtime)
+            if state is None:
+                if old is None:
+                    continue
+                # 一時的に一覧を取得できない場合は前回の一覧を使う
+                state = old
+            METRICS.inc("poll_directories_listed_total")
+        snapshot[path] = state
+        if not recursive:
+            break
+        for directory in state.dirs:
+            try:
+                stack.append((directory, os.stat(directory).st_mtime_ns))
+            except FileNotFoundError:
+                # 削除されたディレクトリのファイルは差分で削除として扱う
+                pass
+            except OSError:
+                old_directory = previous.get(directory) if previous else None
+                if old_directory is not None:
+                    stack.append((directory, old_directory.mtime))
+    return snapshot
+
+
+def list_directory(path, mtime):
+    """ディレクトリの一覧を DirectoryState として返します（取得できない場合は None）。"""
+    files = {}
+    dirs = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.path)
+                    elif entry.is_file():
+                        # Windows では scandir の結果に stat が含まれるため、ファイルごとの問い合わせは発生しない
+                        stat_result = entry.stat()
+                        files[entry.path] = (stat_result.st_size, stat_result.st_mtime_ns, entry.inode())
+                except OSError:
+                    continue
+    except OSError as e:
+        logging.warning(f"Failed to list directory: {path} ({e})")
+        return None
+    return DirectoryState(mtime, files, dirs)
+
+
+def diff(previous, current):
+    """2つのスナップショットの差分を、移動・削除・作成・変更の順のイベントのリストとして返します。"""
+    created, modified, deleted = [], [], []
+    for path, state in current.items():
+        old = previous.get(path)
+        if old is state:
+            continue
+        old_files = old.files if old is not None else {}
+        for file_path, stat in state.files.items():
+            before = old_files.get(file_path)
+            if before is None:
+                created.append((file_path, stat))
+            elif before[:2] != stat[:2]:
+                modified.append(file_path)
+        for file_path, stat in old_files.items():
+            if file_path not in state.files:
+                deleted.append((file_path, stat))
+    for path, old in previous.items():
+        if path not in current:
+            deleted.extend(old.files.items())
+
+    # 同じ inode・サイズのファイルの削除と作成は移動とみなす（inode を取得できない場合は 0）
+    moved = []
+    if created and deleted:
+        sources = {(stat[2], stat[0]): file_path for file_path, stat in deleted if stat[2]}
+        remaining = []
+        for file_path, stat in created:
+            source = sources.pop((stat[2], stat[0]), None) if stat[2] else None
+            if source is not None:
+                moved.append((source, file_path))
+            else:
+                remaining.append((file_path, stat))
+        created = remaining
+        moved_sources = {source for source, _ in moved}
+        deleted = [(file_path, stat) for file_path, stat in deleted if file_path not in moved_sources]
+
+    return ([FileMovedEvent(source, destination) for source, destination in moved]
+            + [FileDeletedEvent(file_path) for file_path, _ in deleted]
+            + [FileCreatedEvent(file_path) for file_path, _ in created]
+            + [FileModifiedEvent(file_path) for file_path in modified])
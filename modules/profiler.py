@@ -0,0 +1,312 @@
+"""
+変換ジョブのプロファイリング（--profile または IPC の PROFILE コマンドで有効化）。
+有効な間は N 件に1件のジョブを cProfile と tracemalloc で計測し、ジョブが起動したサブプロセス
+（ffmpeg, ffprobe, soffice）の実時間とCPU時間を psutil で記録します。
+結果は ./logs/profiles/ にジョブごとの .prof（pstats形式）と .txt、全ジョブの summary.jsonl として出力します。
+
+cProfile は同時に1つしか有効にできないため、計測中に届いた別のジョブは計測しません。
+計測中は他のジョブやスレッドの処理も含まれる点に注意してください。
+
+cProfile は有効にしたプロセス（Python 3.12 より前は呼び出したスレッド）の処理しか記録しないため、
+ジョブがワーカー（PDFレンダリングのプロセスプール、OpenCVのデコードのスレッド）で実行する関数は run_in_worker で呼び出します。
+計測中のジョブの場合はワーカー内で cProfile を有効にし、その統計をジョブのプロファイルに合算します
+（ワーカーは並列に実行されるため、合算した時間はジョブの実時間を超えることがあります）。
+"""
+import io
+import os
+import json
+import time
+import pstats
+import asyncio
+import cProfile
+import logging
+import functools
+import itertools
+import threading
+import contextvars
+import tracemalloc
+from datetime import datetime
+import psutil
+
+
+PROFILE_DIR = os.path.join('./logs', 'profiles')
+# .txt に出力する関数の数（累積時間の上位）
+TOP_FUNCTIONS = 40
+# サブプロセスのCPU時間を取得する間隔（秒）
+SUBPROCESS_POLL_INTERVAL = 0.05
+
+# 実行中のジョブのプロファイル（サブプロセスの記録先）
+_current = contextvars.ContextVar("job_profile", default=None)
+
+
+class JobProfile:
+    def __init__(self, name, target):
+        self.name = name
+        self.target = str(target)
+        self.profile = cProfile.Profile()
+        # ワーカーで計測した統計（cProfile の stats の辞書）
+        self.worker_stats = []
+        self.subprocesses = []
+        self.started = time.perf_counter()
+        self.started_cpu = time.process_time()
+        self.started_at = datetime.now()
+        self.tracing = False
+        self.token = None
+
+    def add_subprocess(self, cmd, wall, cpu):
+        self.subprocesses.append({"cmd": cmd, "wall_sec": wall, "cpu_sec": cpu})
+
+    def stats(self, stream=None):
+        """ジョブのプロファイルとワーカーで計測した統計を合算した pstats.Stats を返します。"""
+        return pstats.Stats(self.profile, *map(WorkerStats, self.worker_stats), stream=stream)
+
+
+class WorkerStats:
+    """ワーカーから受け取った統計の辞書を pstats.Stats に渡すためのラッパー。"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class JobProfiler:
+    def __init__(self):
+        self.enabled = False
+        # N 件に1件のジョブを計測する
+        self.sample_rate = 1
+        self.output_dir = PROFILE_DIR
+        self.counter = itertools.count()
+        self.active = None
+        self.lock = threading.Lock()
+        self.profiled = 0
+        self.skipped = 0
+
+    def configure(self, enabled=None, sample_rate=None, output_dir=None):
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        if sample_rate is not None:
+            self.sample_rate = max(1, int(sample_rate))
+        if output_dir is not None:
+            self.output_dir = output_dir
+        logging.info(f"Profiling {'enabled' if self.enabled else 'disabled'} (1 in {self.sample_rate} jobs)")
+
+    def status(self):
+        return {"enabled": self.enabled, "sample_rate": self.sample_rate,
+                "profiled": self.profiled, "skipped": self.skipped, "output_dir": self.output_dir}
+
+    def begin(self, name, target):
+        """ジョブを計測する場合は JobProfile を返します（サンプリング対象外・計測中の場合は None）。"""
+        if not self.enabled or _current.get() is not None:
+            return None
+        if next(self.counter) % self.sample_rate:
+            return None
+        with self.lock:
+            if self.active is not None:
+                self.skipped += 1
+                return None
+            job = self.active = JobProfile(name, target)
+        try:
+            job.profile.enable()
+        except ValueError:
+            # 他のプロファイラが有効
+            self.active = None
+            self.skipped += 1
+            return None
+        job.tracing = not tracemalloc.is_tracing()
+        if job.tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        job.token = _current.set(job)
+        return job
+
+    def end(self, job, result):
+        job.profile.disable()
+        wall = time.perf_counter() - job.started
+        cpu = time.process_time() - job.started_cpu
+        current_memory, peak_memory = tracemalloc.get_traced_memory()
+        if job.tracing:
+            tracemalloc.stop()
+        _current.reset(job.token)
+        with self.lock:
+            self.active = None
+            self.profiled += 1
+        try:
+            self.dump(job, {
+                "time": job.started_at.isoformat(timespec="seconds"),
+                "job": job.name,
+                "target": job.target,
+                "result": result,
+                "wall_sec": wall,
+                "cpu_sec": cpu,
+                "peak_traced_mb": peak_memory / (1024 * 1024),
+                "worker_calls": len(job.worker_stats),
+                "subprocess_wall_sec": sum(p["wall_sec"] for p in job.subprocesses),
+                "subprocess_cpu_sec": sum(p["cpu_sec"] for p in job.subprocesses),
+                "subprocesses": job.subprocesses,
+            })
+        except Exception as e:
+            logging.error(f"Failed to write profile for {job.target}: {e}")
+
+    def dump(self, job, summary):
+        os.makedirs(self.output_dir, exist_ok=True)
+        stem = os.path.splitext(os.path.basename(job.target))[0][:40]
+        base = os.path.join(self.output_dir,
+                            f"{job.started_at:%Y%m%d-%H%M%S}_{self.profiled:05d}_{job.name}_{stem}")
+        text = io.StringIO()
+        stats = job.stats(stream=text)
+        stats.dump_stats(f"{base}.prof")
+        summary["profile"] = f"{base}.prof"
+        stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        with open(f"{base}.txt", 'w', encoding='utf-8') as f:
+            f.write(json.dumps({k: v for k, v in summary.items() if k != "subprocesses"},
+                               ensure_ascii=False, indent=2))
+            f.write("\n\n")
+            f.write(text.getvalue())
+        with open(os.path.join(self.output_dir, "summary.jsonl"), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(summary, ensure_ascii=False) + "\n")
+        logging.info(f"Profile written: {base}.prof ({summary['wall_sec']:.2f}s)")
+
+
+def profile_command(args):
+    """
+    IPC の PROFILE コマンド: "ON [N]" で有効化（N 件に1件を計測）、"OFF" で無効化します。
+    引数なしの場合は現在の状態のみを返します。
+    """
+    words = args.split()
+    if words and words[0].upper() == "ON":
+        PROFILER.configure(True, int(words[1]) if len(words) > 1 else None)
+    elif words and words[0].upper() == "OFF":
+        PROFILER.configure(False)
+    elif words:
+        raise ValueError("Usage: PROFILE [ON [N] | OFF]")
+    return json.dumps(PROFILER.status()) + "\n"
+
+
+def profiled(name):
+    """
+    ジョブ（コルーチン関数または通常の関数）を計測対象にするデコレータ。
+    最初の位置引数（self を除く）を計測対象のファイルとして記録します。
+    """
+    def decorator(func):
+        def target_of(args):
+            return args[1] if len(args) > 1 and not isinstance(args[0], (str, os.PathLike)) else args[0]
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                job = PROFILER.begin(name, target_of(args))
+                if job is None:
+                    return await func(*args, **kwargs)
+                result = "error"
+                try:
+                    value = await func(*args, **kwargs)
+                    result = "ok"
+                    return value
+                except asyncio.CancelledError:
+                    result = "cancelled"
+                    raise
+                finally:
+                    PROFILER.end(job, result)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                job = PROFILER.begin(name, target_of(args))
+                if job is None:
+                    return func(*args, **kwargs)
+                result = "error"
+                try:
+                    value = func(*args, **kwargs)
+                    result = "ok"
+                    return value
+                finally:
+                    PROFILER.end(job, result)
+        return wrapper
+    return decorator
+
+
+def run_in_worker(executor, func, *args):
+    """
+    executor（None の場合は既定のスレッドプール）で func(*args) を実行する Future を返します。
+    計測中のジョブから呼び出した場合は、ワーカー内で func を計測し、統計をジョブのプロファイルに合算します。
+    プロセスプールで実行する場合、func はモジュールの最上位の関数である必要があります。
+    """
+    loop = asyncio.get_running_loop()
+    job = _current.get()
+    if job is None:
+        return loop.run_in_executor(executor, func, *args)
+    return asyncio.ensure_future(run_profiled_in_worker(job, loop, executor, func, args))
+
+
+async def run_profiled_in_worker(job, loop, executor, func, args):
+    value, stats = await loop.run_in_executor(executor, profile_call, func, args)
+    if stats:
+        job.worker_stats.append(stats)
+    return value
+
+
+def reset_worker():
+    """
+    プロセスプールの initializer: fork で起動したワーカーが引き継いだ計測中のプロファイルを無効にします
+    （プールを作成した時点で計測中だったジョブのプロファイルが、ワーカー内で有効なまま残るため）。
+    """
+    job = PROFILER.active
+    if job is not None:
+        job.profile.disable()
+        PROFILER.active = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def profile_call(func, args):
+    """ワーカーで実行: func を cProfile で計測し、(戻り値, 統計の辞書) を返します。"""
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Python 3.12 以降のスレッドでは、ジョブのプロファイルが既にこのスレッドの処理も記録している
+        return func(*args), None
+    try:
+        value = func(*args)
+    finally:
+        profile.disable()
+    profile.create_stats()
+    return value, profile.stats
+
+
+def watch_subprocess(process, cmd):
+    """
+    計測中のジョブが起動したサブプロセスの実時間とCPU時間を記録します（計測中でなければ None）。
+    asyncio のサブプロセスを起動した直後に呼び出し、終了後に戻り値のタスクを待機してください。
+    """
+    job = _current.get()
+    if job is None:
+        return None
+    return asyncio.ensure_future(poll_subprocess(job, process, cmd))
+
+
+async def poll_subprocess(job, process, cmd):
+    started = time.perf_counter()
+    # シェル経由で起動した場合は子孫プロセスのCPU時間も合算する（終了後は取得できないため、実行中の最後の値を使う）
+    cpu_by_pid = {}
+    try:
+        ps_process = psutil.Process(process.pid)
+        while process.returncode is None:
+            for target in [ps_process] + ps_process.children(recursive=True):
+                try:
+                    times = target.cpu_times()
+                    cpu_by_pid[target.pid] = times.user + times.system
+                except psutil.Error:
+                    pass
+            await asyncio.sleep(SUBPROCESS_POLL_INTERVAL)
+    except psutil.Error:
+        pass
+    finally:
+        cpu = sum(cpu_by_pid.values())
+        command = cmd if isinstance(cmd, str) else " ".join(map(str, cmd))
+        job.add_subprocess(command[:200], time.perf_counter() - started, cpu)
+
+
+# アプリ全体で共有するプロファイラ
+PROFILER = JobProfiler()
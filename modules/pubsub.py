@@ -0,0 +1,184 @@
+"""
+IPCポートの SUBSCRIBE コマンドで、通知を複数の購読者に配信します。
+
+    SUBSCRIBE [prefix=<パス>] [types=created,deleted] [format=json|binary] [policy=resync|drop]
+
+接続すると、prefix 以下のファイルリストのスナップショットを送信し、以降は接続を維持したまま
+prefix と types に一致する差分を購読者ごとの連番（seq）付きで送信します（format=json は1行に1つのJSON）。
+購読者ごとに上限付きのキューを持ち、受信が追いつかずにキューがあふれた購読者は policy に従って
+キューを破棄してスナップショットを送り直す（resync）か、切断します（drop）。他の購読者には影響しません。
+メッセージの形式は modules.notification の delta 形式と同じです。
+"""
+import json
+import uuid
+import asyncio
+import logging
+from modules.metrics import METRICS
+from modules.notification import PROTOCOL_VERSION
+from utils.communication.wire import encode_binary
+from utils.communication.ipc_server import parse_options
+
+
+POLICIES = ("resync", "drop")
+# 購読者ごとのキューの上限（メッセージ数）
+DEFAULT_QUEUE_SIZE = 256
+# キューの終端（切断）
+CLOSE = object()
+
+
+class Subscriber:
+    def __init__(self, prefix="", types=None, message_format="json", policy="resync", queue_size=DEFAULT_QUEUE_SIZE):
+        self.id = uuid.uuid4().hex[:12]
+        self.prefix = prefix
+        # 配信するイベントの種類（None の場合はすべて）
+        self.types = types
+        self.message_format = message_format
+        self.policy = policy
+        self.queue = asyncio.Queue(queue_size)
+        self.seq = 0
+        self.overflows = 0
+        self.writer = None
+
+    def matches(self, path):
+        return not self.prefix or (path or "").startswith(self.prefix)
+
+    def filter(self, events, changes):
+        events = [event for event in events
+                  if (self.types is None or event.get("type") in self.types) and self.matches(event.get("path"))]
+        changes = [change for change in changes if self.matches(change.get("path"))]
+        return events, changes
+
+
+class SubscriptionHub:
+    def __init__(self, snapshot_source, root="", queue_size=DEFAULT_QUEUE_SIZE):
+        # 現在のファイルリスト (files, sequence_folders) を返す関数
+        self.snapshot_source = snapshot_source
+        # format=binary で相対パスにするルートディレクトリ
+        self.root = root
+        self.queue_size = queue_size
+        self.subscribers = {}
+        METRICS.register("subscribers", self.collect_metrics)
+
+    def publish(self, events, changes):
+        """差分を購読者ごとに絞り込んでキューに追加します。イベントループのスレッドから呼び出してください。"""
+        for subscriber in list(self.subscribers.values()):
+            events_for, changes_for = subscriber.filter(events, changes)
+            if not events_for and not changes_for:
+                continue
+            subscriber.seq += 1
+            self.put(subscriber, {
+                "version": PROTOCOL_VERSION, "type": "delta", "session": subscriber.id, "seq": subscriber.seq,
+                "events": events_for, "changes": changes_for
+            })
+
+    def snapshot(self, subscriber, reason):
+        files, sequence_folders = self.snapshot_source()
+        return {
+            "version": PROTOCOL_VERSION, "type": "snapshot", "session": subscriber.id, "seq": subscriber.seq,
+            "snapshot_id": uuid.uuid4().hex[:12], "chunk": 0, "chunks": 1, "reason": reason,
+            "files": [path for path in files if subscriber.matches(path)],
+            "sequence_folders": [path for path in sequence_folders if subscriber.matches(path)]
+        }
+
+    def put(self, subscriber, message):
+        try:
+            subscriber.queue.put_nowait(message)
+            return
+        except asyncio.QueueFull:
+            pass
+        # 受信が追いつかない購読者: 未送信のメッセージを破棄する
+        subscriber.overflows += 1
+        METRICS.inc("subscriber_overflows_total", policy=subscriber.policy)
+        discard(subscriber.queue)
+        if subscriber.policy == "drop":
+            logging.info(f"Dropping slow subscriber {subscriber.id}")
+            subscriber.queue.put_nowait({"type": "dropped", "reason": "overflow"})
+            subscriber.queue.put_nowait(CLOSE)
+            self.subscribers.pop(subscriber.id, None)
+            if subscriber.writer is not None and subscriber.writer.transport.get_write_buffer_size():
+                # 受信が止まっている場合は送信の完了を待たずに切断する
+                subscriber.writer.transport.abort()
+        else:
+            logging.info(f"Resyncing slow subscriber {subscriber.id}")
+            subscriber.queue.put_nowait(self.snapshot(subscriber, "overflow"))
+
+    def close(self):
+        """すべての購読者を切断します（終了時）。"""
+        for subscriber in list(self.subscribers.values()):
+            discard(subscriber.queue)
+            subscriber.queue.put_nowait(CLOSE)
+        self.subscribers.clear()
+
+    def encoder(self, subscriber):
+        if subscriber.message_format == "binary":
+            return lambda message: encode_binary(message, self.root)
+        return lambda message: (json.dumps(message) + "\n").encode()
+
+    async def serve(self, args, reader, writer):
+        """IPC の SUBSCRIBE コマンド: 接続が閉じられるまで購読者にメッセージを送信します。"""
+        try:
+            subscriber = self.parse(args)
+        except ValueError as e:
+            writer.write(f"ERROR {e}\n".encode())
+            return
+        subscriber.writer = writer
+        self.subscribers[subscriber.id] = subscriber
+        METRICS.inc("subscriptions_total")
+        logging.info(f"Subscriber {subscriber.id} connected (prefix={subscriber.prefix!r}, types={subscriber.types})")
+        encode = self.encoder(subscriber)
+        # 購読者からの切断を検出する（購読者から送られるデータは読み捨てる）
+        closed = asyncio.ensure_future(read_until_closed(reader))
+        try:
+            message = self.snapshot(subscriber, "subscribe")
+            while message is not CLOSE:
+                data = encode(message)
+                writer.write(data)
+                await writer.drain()
+                METRICS.inc("subscriber_messages_total")
+                METRICS.inc("subscriber_bytes_total", len(data))
+                received = asyncio.ensure_future(subscriber.queue.get())
+                await asyncio.wait((received, closed), return_when=asyncio.FIRST_COMPLETED)
+                if not received.done():
+                    received.cancel()
+                    break
+                message = received.result()
+        except ConnectionError:
+            pass
+        finally:
+            closed.cancel()
+            self.subscribers.pop(subscriber.id, None)
+            logging.info(f"Subscriber {subscriber.id} disconnected")
+
+    def parse(self, args):
+        # 空白を含むパスは prefix="C:\My Videos" のように引用符で囲む
+        options = parse_options(args)
+        types = options.get("types")
+        subscriber = Subscriber(
+            prefix=options.get("prefix", ""),
+            types=set(types.split(",")) if types else None,
+            message_format=options.get("format", "json"),
+            policy=options.get("policy", "resync"),
+            queue_size=self.queue_size)
+        if subscriber.message_format not in ("json", "binary"):
+            raise ValueError(f"Unknown format: {subscriber.message_format}")
+        if subscriber.policy not in POLICIES:
+            raise ValueError(f"Unknown policy: {subscriber.policy}")
+        return subscriber
+
+    def collect_metrics(self):
+        subscribers = list(self.subscribers.values())
+        return [("subscribers", {}, len(subscribers)),
+                ("subscriber_queue_max", {}, max((s.queue.qsize() for s in subscribers), default=0))]
+
+
+def discard(queue):
+    while not queue.empty():
+        queue.get_nowait()
+
+
+async def read_until_closed(reader):
+    try:
+        while await reader.read(4096):
+            pass
+    except ConnectionError:
+        pass
@@ -0,0 +1,120 @@
+"""
+IPCポートの問い合わせコマンド。応答はいずれも1行のJSONです。
+
+    LIST [prefix=<パス>] [kind=file|sequence_folder|source] [offset=0] [limit=100]
+    STATUS <パス>
+    QUEUE [limit=100]
+    REPROCESS <パス>
+
+LIST は通知するファイルリスト（レジストリ）をページ単位で返し、STATUS は1つのファイルの状態と出力、
+QUEUE は変換ジョブの待機・実行状況と起動時スキャンの進捗を返します。
+REPROCESS はマニフェストの記録を破棄して、指定したファイルを再生成します（生成された出力を指定した場合は元のファイル）。
+複数のルートディレクトリを監視している場合、パスを含むルートのハンドラが応答します。
+"""
+import os
+import json
+from watchdog.events import FileModifiedEvent
+from modules.notification import KIND_FILE, KIND_SEQUENCE_FOLDER
+from modules.registry import KIND_SOURCE, is_under
+from utils.communication.ipc_server import parse_options, parse_path
+
+
+KINDS = (KIND_FILE, KIND_SEQUENCE_FOLDER, KIND_SOURCE)
+# LIST の1ページの最大件数
+MAX_LIMIT = 1000
+
+
+class QueryCommands:
+    def __init__(self, handlers, registry, scheduler):
+        # handlers: ルートディレクトリごとの FileHandler（マニフェスト・イベントの集約を参照する）
+        # すべてのルートが削除されて handlers が空になる場合もある
+        self.handlers = handlers
+        self.registry = registry
+        # すべてのルートで共有しているジョブスケジューラ
+        self.scheduler = scheduler
+
+    def register(self, register_command):
+        register_command("LIST", self.list_command)
+        register_command("STATUS", self.status_command)
+        register_command("QUEUE", self.queue_command)
+        register_command("REPROCESS", self.reprocess_command)
+
+    def list_command(self, args):
+        options = parse_options(args)
+        kind = options.get("kind")
+        if kind is not None and kind not in KINDS:
+            raise ValueError(f"Unknown kind: {kind}")
+        offset = max(0, int(options.get("offset", 0)))
+        limit = min(MAX_LIMIT, max(1, int(options.get("limit", 100))))
+        total, entries = self.registry.query(options.get("prefix", ""), kind, offset, limit)
+        next_offset = offset + len(entries)
+        return respond({
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "next_offset": next_offset if next_offset < total else None,
+            "items": [entry.to_dict() for entry in entries],
+        })
+
+    def status_command(self, args):
+        path = os.path.abspath(parse_path(args))
+        entry = self.registry.get(path)
+        handler = self.handler_for(path)
+        manifest = handler.manifest if handler else None
+        return respond({
+            "path": path,
+            "exists": os.path.exists(path),
+            # 通知するファイルリストのエントリ（動画ファイル・生成された出力）
+            "entry": entry.to_dict() if entry else None,
+            # このファイルから生成されたシーケンスフォルダ・動画
+            "derived": [derived.to_dict() for derived in self.registry.from_source(path)],
+            "manifest": manifest.get(path) if manifest else None,
+            "root": handler.root if handler else None,
+            "event": handler.coalescer.state_of(path) if handler else None,
+            "jobs": self.scheduler.job_status(path),
+        })
+
+    def queue_command(self, args):
+        options = parse_options(args)
+        limit = max(1, int(options.get("limit", 100)))
+        jobs = self.scheduler.job_status()
+        return respond({
+            "job_classes": self.scheduler.stats(),
+            "jobs": jobs[:limit],
+            "jobs_total": len(jobs),
+            "roots": [{
+                "root": handler.root,
+                "pending_events": handler.coalescer.pending_count(),
+                "pending_notifications": len(handler.notifier.events),
+                "startup_scan": handler.scan_progress.to_dict() if handler.scan_progress else None,
+            } for handler in self.handlers],
+        })
+
+    def reprocess_command(self, args):
+        path = os.path.abspath(parse_path(args))
+        entry = self.registry.get(path)
+        if entry is not None and entry.source:
+            # 生成された出力が指定された場合は元のファイルを再生成する
+            path = entry.source
+        handler = self.handler_for(path)
+        if handler is None:
+            raise ValueError(f"Not under the target directory: {path}")
+        if not os.path.isfile(path):
+            raise LookupError(f"File not found: {path}")
+        if handler.manifest:
+            handler.manifest.remove(path)
+        # 書き込み中のファイルや処理中のジョブとまとめて、通常のイベントと同様に処理する
+        handler.coalescer.submit(FileModifiedEvent(path))
+        return respond({"path": path, "root": handler.root, "queued": True})
+
+    def handler_for(self, path):
+        """パスを含むルートディレクトリのハンドラを返します（どのルートにも含まれない場合は None）。"""
+        path = os.path.abspath(path)
+        for handler in self.handlers:
+            if is_under(path, os.path.abspath(handler.root)):
+                return handler
+        return None
+
+
+def respond(value):
+    return json.dumps(value, ensure_ascii=False) + "\n"
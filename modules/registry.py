@@ -0,0 +1,166 @@
+"""
+通知するファイルリスト（動画ファイルとシーケンスフォルダ）のレジストリ。
+パスをキーにした辞書で O(1) の検索・追加・削除を行い、登録順の列挙とディレクトリごとの索引を提供します。
+watchdog のスレッドとイベントループの両方から参照されるため、すべての操作をロックで保護しています。
+"""
+import os
+import time
+import threading
+from modules.notification import OP_ADD, OP_UPDATE, KIND_FILE, KIND_SEQUENCE_FOLDER
+
+
+# エントリの状態
+STATUS_READY = "ready"             # 出力がそろっている
+STATUS_PROCESSING = "processing"  # 再生成中
+STATUS_FAILED = "failed"           # 直近の再生成に失敗（前回の出力は残っている）
+
+# 変換元のファイル（PDF/PPT、出力がまだない動画）。状態の参照のみに使用し、通知するファイルリストには含めない
+KIND_SOURCE = "source"
+
+
+class RegistryEntry:
+    __slots__ = ("path", "kind", "source", "outputs", "status", "updated")
+
+    def __init__(self, path, kind, source=None, outputs=None, status=STATUS_READY):
+        self.path = path
+        self.kind = kind
+        # 出力の元になったファイル（シーケンスフォルダや変換した動画の場合）
+        self.source = source
+        self.outputs = outputs or {}
+        self.status = status
+        self.updated = time.time()
+
+    def to_dict(self):
+        return {"path": self.path, "kind": self.kind, "source": self.source,
+                "outputs": self.outputs, "status": self.status, "updated": self.updated}
+
+
+class FileRegistry:
+    def __init__(self):
+        self.lock = threading.RLock()
+        # パス -> RegistryEntry（辞書は挿入順を保持する）
+        self.entries = {}
+        # 索引: ディレクトリ・種類・出力元のファイル -> パスの辞書（順序付きの集合として使用）
+        self.directories = {}
+        self.kinds = {}
+        self.sources = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, path):
+        return path in self.entries
+
+    def get(self, path):
+        with self.lock:
+            return self.entries.get(path)
+
+    def add(self, path, kind, source=None, outputs=None, status=STATUS_READY):
+        """
+        エントリを登録し、新規の場合は OP_ADD、既存の場合は OP_UPDATE を返します。
+        KIND_SOURCE のエントリを通知する種類に変更した場合は、受信側にとっては新規のため OP_ADD を返します。
+        """
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None:
+                self.entries[path] = RegistryEntry(path, kind, source, outputs, status)
+                self.directories.setdefault(os.path.dirname(path), {})[path] = None
+                self.kinds.setdefault(kind, {})[path] = None
+                if source:
+                    self.sources.setdefault(source, {})[path] = None
+                return OP_ADD
+            op = OP_ADD if entry.kind == KIND_SOURCE and kind != KIND_SOURCE else OP_UPDATE
+            if entry.kind != kind:
+                unindex(self.kinds, entry.kind, path)
+                self.kinds.setdefault(kind, {})[path] = None
+                entry.kind = kind
+            if source and source != entry.source:
+                if entry.source:
+                    unindex(self.sources, entry.source, path)
+                self.sources.setdefault(source, {})[path] = None
+                entry.source = source
+            if outputs:
+                entry.outputs = outputs
+            entry.status = status
+            entry.updated = time.time()
+            return op
+
+    def remove(self, path):
+        """エントリを削除して返します（登録されていない場合は None）。"""
+        with self.lock:
+            entry = self.entries.pop(path, None)
+            if entry is not None:
+                unindex(self.directories, os.path.dirname(path), path)
+                unindex(self.kinds, entry.kind, path)
+                if entry.source:
+                    unindex(self.sources, entry.source, path)
+            return entry
+
+    def set_status(self, path, status):
+        """登録済みのエントリの状態を更新します。"""
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None:
+                entry.status = status
+                entry.updated = time.time()
+            return entry
+
+    def paths(self, kind=None):
+        """登録順のパスのリストを返します（kind を指定した場合はその種類のみ）。"""
+        with self.lock:
+            if kind is None:
+                return list(self.entries)
+            return list(self.kinds.get(kind, ()))
+
+    def in_directory(self, directory, kind=None):
+        """指定したディレクトリ直下のエントリのリストを返します。"""
+        with self.lock:
+            entries = [self.entries[path] for path in self.directories.get(directory, ())]
+        return [entry for entry in entries if kind is None or entry.kind == kind]
+
+    def from_source(self, source):
+        """指定したファイルから生成されたエントリ（シーケンスフォルダ・変換した動画）のリストを返します。"""
+        with self.lock:
+            return [self.entries[path] for path in self.sources.get(source, ())]
+
+    def query(self, prefix="", kind=None, offset=0, limit=100):
+        """
+        パスが prefix で始まるエントリを登録順に offset 件目から最大 limit 件返します。
+        戻り値は (条件に一致した件数, エントリのリスト) です。
+        """
+        with self.lock:
+            paths = self.kinds.get(kind, ()) if kind is not None else self.entries
+            matched = [path for path in paths if path.startswith(prefix)] if prefix else list(paths)
+            return len(matched), [self.entries[path] for path in matched[offset:offset + limit]]
+
+    def snapshot(self, root=None):
+        """通知に含めるファイルリスト (files, sequence_folders) を返します（root を指定した場合はその配下のみ）。"""
+        with self.lock:
+            files, sequence_folders = list(self.kinds.get(KIND_FILE, ())), list(self.kinds.get(KIND_SEQUENCE_FOLDER, ()))
+        if root:
+            files = [path for path in files if is_under(path, root)]
+            sequence_folders = [path for path in sequence_folders if is_under(path, root)]
+        return files, sequence_folders
+
+    def export(self):
+        """すべてのエントリを辞書のリストとして返します。"""
+        with self.lock:
+            return [entry.to_dict() for entry in self.entries.values()]
+
+
+def is_under(path, root):
+    """path が root 自身またはその配下のパスかどうかを返します。"""
+    trimmed = root.rstrip("/\\")
+    if not trimmed:
+        # ルートディレクトリ（"/"）
+        return path.startswith(root)
+    root = trimmed
+    return path == root or (path.startswith(root) and path[len(root)] in "/\\")
+
+
+def unindex(index, key, path):
+    paths = index.get(key)
+    if paths is not None:
+        paths.pop(path, None)
+        if not paths:
+            del index[key]
@@ -0,0 +1,90 @@
+"""
+1回のデコード結果（フレーム画像）から、複数のサイズ・形式のサムネイル（レンディション）を書き出します。
+レンディションは設定ファイルの "renditions" で指定します。
+
+    {"name": "list", "max_size": 320, "format": "jpeg", "quality": 80}
+
+出力ファイル名は "<ソース名>_<name>.<拡張子>" です（既定の "thumbnail" は従来どおり "_thumbnail.png"）。
+"""
+import os
+import logging
+import cv2
+import numpy as np
+from modules.metrics import METRICS, STAGE_ENCODE
+
+
+# 既定のレンディション（従来の "<名前>_thumbnail.png" のみ）
+DEFAULT_RENDITIONS = [{"name": "thumbnail", "max_size": 0, "format": "png"}]
+
+# 形式ごとの拡張子、品質パラメータ、既定の品質
+FORMATS = {
+    "png": (".png", cv2.IMWRITE_PNG_COMPRESSION, 3),
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY, 85),
+    "jpg": (".jpg", cv2.IMWRITE_JPEG_QUALITY, 85),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY, 80),
+}
+
+
+def rendition_path(source_path, spec):
+    """ソースファイルに対応するレンディションの出力パスを返します。"""
+    ext = FORMATS.get(spec.get("format", "png").lower(), FORMATS["png"])[0]
+    return f"{os.path.splitext(str(source_path))[0]}_{spec['name']}{ext}"
+
+
+def rendition_paths(source_path, renditions=None):
+    """すべてのレンディションの {名前: 出力パス} を返します。"""
+    return {spec["name"]: rendition_path(source_path, spec)
+            for spec in (renditions or DEFAULT_RENDITIONS)}
+
+
+def resize_to_fit(frame, max_size):
+    """長辺が max_size を超える場合に縮小します（0 の場合は元のサイズ）。"""
+    height, width = frame.shape[:2]
+    longest = max(height, width)
+    if not max_size or longest <= max_size:
+        return frame
+    scale = max_size / longest
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+
+def save_renditions(frame, source_path, renditions=None):
+    """
+    BGR形式のフレーム画像からすべてのレンディションを書き出し、{名前: 出力パス} を返します。
+    同じ max_size のレンディションは縮小結果を共有します。
+    """
+    with METRICS.timer(STAGE_ENCODE):
+        outputs = {}
+        resized = {}
+        for spec in renditions or DEFAULT_RENDITIONS:
+            fmt = spec.get("format", "png").lower()
+            if fmt not in FORMATS:
+                logging.error(f"Unsupported rendition format: {fmt} ({spec['name']})")
+                continue
+            ext, quality_flag, default_quality = FORMATS[fmt]
+            max_size = spec.get("max_size", 0)
+            if max_size not in resized:
+                resized[max_size] = resize_to_fit(frame, max_size)
+
+            # PNGは可逆圧縮のため品質は無視し、既定の圧縮レベルを使用する
+            quality = default_quality if fmt == "png" else spec.get("quality", default_quality)
+            ok, buffer = cv2.imencode(ext, resized[max_size], [quality_flag, int(quality)])
+            if not ok:
+                logging.error(f"Failed to encode rendition: {spec['name']}")
+                continue
+
+            # cv2.imwrite は Windows で日本語パスを扱えないため、エンコードしてから書き込む
+            output_path = rendition_path(source_path, spec)
+            with open(output_path, 'wb') as f:
+                f.write(buffer.tobytes())
+            outputs[spec["name"]] = output_path
+        return outputs
+
+
+def save_renditions_from_file(image_path, source_path, renditions=None):
+    """画像ファイル（シーケンスの1ページ目など）を読み込み、すべてのレンディションを書き出します。"""
+    data = np.fromfile(str(image_path), dtype=np.uint8)
+    frame = cv2.imdecode(data, cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError(f"Failed to decode image: {image_path}")
+    return save_renditions(frame, source_path, renditions)
@@ -0,0 +1,65 @@
+"""
+起動時スキャン用のディレクトリ走査。
+os.scandir でディレクトリを1回ずつ読み、処理対象のファイルのみを (パス, stat) のリストとして返します。
+
+- 深さの上限を超えるディレクトリには降りない（誤使用を想定した暴走ガード）
+- 生成したシーケンスフォルダ（同じディレクトリに元の PDF/PPT がある <名前>_sequence）には降りない
+- 拡張子で絞り込んでからファイルの stat を取得する（Windows では scandir の結果に含まれるため問い合わせは発生しない）
+"""
+import os
+import logging
+
+
+# サブディレクトリの深さの上限（start_path の直下が 1）
+MAX_DEPTH = 4
+# 生成したシーケンスフォルダの接尾辞と、その元になるファイルの拡張子
+SEQUENCE_SUFFIX = "_sequence"
+SEQUENCE_SOURCE_EXTENSIONS = (".pdf", ".pptx", ".ppsx")
+
+
+def scan_files(start_path, extensions, recursive=True, max_depth=MAX_DEPTH, stats=None):
+    """
+    start_path 以下の拡張子が extensions に含まれるファイルの (パス, stat_result) のリストを返します。
+    stats に辞書を渡すと、走査したエントリ数（entries）・ディレクトリ数（directories）・
+    降りなかったディレクトリ数（pruned）を加算します。
+    """
+    extensions = frozenset(extensions)
+    files = []
+    entries = directories = pruned = 0
+    stack = [(start_path, 0)]
+    while stack:
+        path, depth = stack.pop()
+        directories += 1
+        subdirectories = []
+        stems = set()
+        try:
+            with os.scandir(path) as iterator:
+                for entry in iterator:
+                    entries += 1
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirectories.append(entry)
+                            continue
+                        ext = os.path.splitext(entry.name)[1].lower()
+                        if ext in SEQUENCE_SOURCE_EXTENSIONS:
+                            stems.add(entry.name[:-len(ext)])
+                        if ext in extensions and entry.is_file():
+                            files.append((entry.path, entry.stat()))
+                    except OSError as e:
+                        logging.warning(f"Failed to stat: {entry.path} ({e})")
+        except OSError as e:
+            logging.error(f"Failed to list directory: {path} ({e})")
+            continue
+        if not recursive:
+            break
+        for entry in subdirectories:
+            if depth + 1 > max_depth or (entry.name.endswith(SEQUENCE_SUFFIX)
+                                         and entry.name[:-len(SEQUENCE_SUFFIX)] in stems):
+                pruned += 1
+                continue
+            stack.append((entry.path, depth + 1))
+    if stats is not None:
+        stats["entries"] = stats.get("entries", 0) + entries
+        stats["directories"] = stats.get("directories", 0) + directories
+        stats["pruned"] = stats.get("pruned", 0) + pruned
+    return files
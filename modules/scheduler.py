@@ -0,0 +1,200 @@
+"""
+変換ジョブのスケジューラ。
+ジョブの種類（動画サムネイル、PDFレンダリング、Office変換、動画エンコード）ごとに同時実行数を制限し、
+優先度（ライブイベント > 起動時スキャン、小さいファイル > 大きいファイル）の順に実行します。
+ソースファイルが削除・上書きされた場合は、待機中・実行中のジョブをキャンセルできます。
+"""
+import time
+import asyncio
+import itertools
+import logging
+from modules.metrics import METRICS
+
+
+# ジョブの種類
+JOB_VIDEO = "video"    # 動画の長さ取得・サムネイル生成
+JOB_PDF = "pdf"        # PDFページのレンダリング
+JOB_OFFICE = "office"  # PowerPoint/LibreOfficeによる変換
+JOB_ENCODE = "encode"  # 動画エンコード
+
+# 優先度（小さいほど先に実行）
+PRIORITY_LIVE = 0
+PRIORITY_STARTUP = 1
+
+
+class JobCancelled(Exception):
+    """ソースの削除・上書きなどによりジョブがキャンセルされた"""
+
+
+class Job:
+    def __init__(self, key, job_class, factory, priority, size):
+        self.key = key
+        self.job_class = job_class
+        # 引数なしで呼び出すとコルーチンを返す関数
+        self.factory = factory
+        self.priority = priority
+        self.size = size
+        self.future = None
+        self.task = None
+        self.cancelled = False
+        self.submitted = time.monotonic()
+
+
+class JobScheduler:
+    DEFAULT_LIMITS = {JOB_VIDEO: 4, JOB_PDF: 2, JOB_OFFICE: 1, JOB_ENCODE: 1}
+
+    def __init__(self, limits=None):
+        self.limits = dict(self.DEFAULT_LIMITS)
+        self.limits.update(limits or {})
+        self.queues = {}
+        self.workers = []
+        self.jobs = {}  # key -> 待機中・実行中のJobの集合
+        self.running = {job_class: 0 for job_class in self.limits}
+        self.counter = itertools.count()
+        METRICS.register("scheduler", self.collect_metrics)
+
+    def ensure_started(self):
+        """ジョブの種類ごとにワーカーを起動します（実行中のイベントループ内で呼び出してください）。"""
+        if self.workers:
+            return
+        for job_class, limit in self.limits.items():
+            self.queues[job_class] = asyncio.PriorityQueue()
+            for _ in range(max(1, int(limit))):
+                self.workers.append(asyncio.create_task(self.worker(job_class)))
+
+    async def submit(self, key, job_class, factory, priority=PRIORITY_LIVE, size=0):
+        """
+        ジョブを登録し、完了まで待機して結果を返します。
+        同じキーの待機中ジョブは新しいジョブに置き換えられます。
+        キャンセルされた場合は JobCancelled を送出します。
+        """
+        self.ensure_started()
+        if job_class not in self.queues:
+            raise ValueError(f"Unknown job class: {job_class}")
+
+        # 未着手の古いジョブは不要になる
+        for old_job in list(self.jobs.get(key, ())):
+            if old_job.task is None:
+                self.cancel_job(old_job)
+
+        job = Job(key, job_class, factory, priority, size)
+        job.future = asyncio.get_running_loop().create_future()
+        self.jobs.setdefault(key, set()).add(job)
+        await self.queues[job_class].put((priority, size, next(self.counter), job))
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            # 呼び出し元がキャンセルされた場合はジョブも不要
+            self.cancel_job(job)
+            raise
+
+    def cancel(self, key):
+        """指定したキーの待機中・実行中ジョブをすべてキャンセルします。"""
+        jobs = list(self.jobs.get(key, ()))
+        for job in jobs:
+            self.cancel_job(job)
+        if jobs:
+            logging.info(f"Cancelled {len(jobs)} job(s) for {key}")
+        return len(jobs)
+
+    def cancel_all(self):
+        for key in list(self.jobs):
+            self.cancel(key)
+
+    def cancel_job(self, job):
+        job.cancelled = True
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            self.finish(job)
+            if not job.future.done():
+                job.future.set_exception(JobCancelled(job.key))
+
+    def finish(self, job):
+        jobs = self.jobs.get(job.key)
+        if jobs is not None:
+            jobs.discard(job)
+            if not jobs:
+                del self.jobs[job.key]
+
+    def stats(self):
+        """ジョブの種類ごとの待機数と実行数を返します。"""
+        return {
+            job_class: {
+                "limit": self.limits[job_class],
+                "queued": self.queues[job_class].qsize() if job_class in self.queues else 0,
+                "running": self.running[job_class],
+            }
+            for job_class in self.limits
+        }
+
+    def job_status(self, key=None):
+        """待機中・実行中のジョブの一覧を返します（key を指定した場合はそのキーのジョブのみ）。"""
+        now = time.monotonic()
+        jobs = self.jobs.get(key, ()) if key is not None else [job for group in self.jobs.values() for job in group]
+        return sorted(({
+            "key": str(job.key),
+            "job_class": job.job_class,
+            "state": "running" if job.task is not None else "queued",
+            "priority": job.priority,
+            "size": job.size,
+            "age_sec": round(now - job.submitted, 3),
+        } for job in jobs if not job.cancelled), key=lambda job: (job["state"] != "running", job["priority"], job["size"]))
+
+    def collect_metrics(self):
+        """ジョブの種類ごとの待機数・実行数・同時実行数の上限をゲージとして返します。"""
+        gauges = []
+        for job_class, stats in self.stats().items():
+            labels = {"job_class": job_class}
+            gauges.append(("queue_depth", labels, stats["queued"]))
+            gauges.append(("jobs_in_flight", labels, stats["running"]))
+            gauges.append(("job_limit", labels, stats["limit"]))
+        return gauges
+
+    async def worker(self, job_class):
+        queue = self.queues[job_class]
+        while True:
+            _, _, _, job = await queue.get()
+            try:
+                if job.cancelled:
+                    continue
+                self.running[job_class] += 1
+                METRICS.observe("queue_wait", time.monotonic() - job.submitted)
+                job.task = asyncio.ensure_future(job.factory())
+                try:
+                    await asyncio.wait([job.task])
+                except asyncio.CancelledError:
+                    # スケジューラ自体の停止
+                    job.task.cancel()
+                    raise
+                finally:
+                    self.running[job_class] -= 1
+                    self.finish(job)
+
+                if job.task.cancelled():
+                    result = "cancelled"
+                elif job.task.exception() is not None:
+                    result = "error"
+                else:
+                    result = "ok"
+                METRICS.inc("jobs_total", job_class=job_class, result=result)
+
+                if job.future.done():
+                    continue
+                if result == "cancelled":
+                    job.future.set_exception(JobCancelled(job.key))
+                elif result == "error":
+                    job.future.set_exception(job.task.exception())
+                else:
+                    job.future.set_result(job.task.result())
+            finally:
+                queue.task_done()
+
+    async def stop(self):
+        """待機中・実行中のジョブをキャンセルし、ワーカーを停止します。"""
+        self.cancel_all()
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        self.queues = {}
@@ -47,9 +47,9 @@ class TrayIcon:
             config = self.dialog.get_config()
             self.thumb_crafter.config_manager.update_config(
                 config)  # 設定を更新
-            self.thumb_crafter.config = config  # ローカルの設定も更新
-            print("Config updated:", self.thumb_crafter.config)
-            self.thumb_crafter.restart()  # 再起動して設定を反映
+            print("Config updated:", config)
+            # 変更された項目のみを反映（ダイアログにない項目（targets など）は維持する）
+            self.thumb_crafter.apply_config(config)
         else:  # Cancelボタンが押された場合
             print("Dialog cancelled")
 
@@ -9,8 +9,10 @@ def check_existing_instance(port, key):
         try:
             client_socket.connect(("localhost", port))
             client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            client_socket.sendall(b"KEY\n")
 
-            response = client_socket.recv(96).decode("utf-8")
+            # 複数のルートを監視している場合のキーは長くなる
+            response = client_socket.recv(4096).decode("utf-8")
             client_socket.close()
             # 既に起動しているインスタンスが存在する
             if response == key: # 完全に一致
@@ -28,6 +30,19 @@ def check_existing_instance(port, key):
         print("check_existing_instance error")
         return False  # エラーが発生した場合も起動していないインスタンス
 
+
+def send_command(port, command, timeout=10):
+    """起動中のインスタンスにIPCコマンド（METRICS など）を送信し、応答の文字列を返します。"""
+    with socket.create_connection(("localhost", port), timeout=timeout) as client_socket:
+        client_socket.sendall(f"{command}\n".encode("utf-8"))
+        chunks = []
+        while True:
+            data = client_socket.recv(65536)
+            if not data:
+                break
+            chunks.append(data)
+    return b"".join(chunks).decode("utf-8")
+
 # async def async_check_existing_instance(port, key):
 #    try:
 #        reader, writer = await asyncio.open_connection('localhost', port)
@@ -1,20 +1,146 @@
+import re
 import asyncio
 import signal
 
 key = "ExistingInstance"
+# 最初の1行（コマンド）を待つ時間（秒）。何も送らない旧クライアントにはキーを返す
+COMMAND_TIMEOUT = 0.5
+# コマンド名 -> 引数の文字列を受け取り応答の文字列を返す関数（コルーチン関数も可）
+commands = {}
+# コマンドの引数 name=value（値は引用符で囲むと空白を含められる）
+OPTION = re.compile(r'(\w+)=("([^"]*)"|\S+)')
+# コマンド名 -> (引数の文字列, reader, writer) を受け取り、接続を維持して応答を送り続けるコルーチン関数
+streams = {}
+
+
+def register_command(name, handler):
+    """IPCコマンドを登録します（GET /<name> でも呼び出せます）。"""
+    commands[name.upper()] = handler
+
+
+def unregister_command(name):
+    commands.pop(name.upper(), None)
+    streams.pop(name.upper(), None)
+
+
+def register_stream(name, handler):
+    """接続を維持するIPCコマンド（SUBSCRIBE など）を登録します。handler が戻ると接続を閉じます。"""
+    streams[name.upper()] = handler
+
+
+def set_key(_key):
+    """監視対象のキーを変更します（設定の再読み込みでターゲットが変わった場合）。"""
+    global key
+    key = _key
+
+
+def parse_options(args):
+    """コマンドの引数 'name=value name="value with spaces"' を辞書（名前は小文字）に変換します。"""
+    options = {}
+    position = 0
+    for match in OPTION.finditer(args):
+        if args[position:match.start()].strip():
+            raise ValueError(f"Invalid option: {args[position:match.start()].strip()}")
+        options[match.group(1).lower()] = match.group(3) if match.group(3) is not None else match.group(2)
+        position = match.end()
+    if args[position:].strip():
+        raise ValueError(f"Invalid option: {args[position:].strip()}")
+    return options
+
+
+def parse_path(args):
+    """コマンドの引数をパスとして返します（前後の引用符は取り除く）。"""
+    path = args.strip()
+    if len(path) >= 2 and path[0] == path[-1] == '"':
+        path = path[1:-1]
+    if not path:
+        raise ValueError("Path is required")
+    return path
+
+
+async def dispatch(request):
+    """コマンドを実行して応答の文字列を返します。空行と KEY は監視対象のキーを返します。"""
+    name, _, args = request.strip().partition(" ")
+    name = name.upper()
+    if name in ("", "KEY"):
+        return key
+    handler = commands.get(name)
+    if handler is None:
+        raise LookupError(f"Unknown command: {name}")
+    result = handler(args.strip())
+    if asyncio.iscoroutine(result):
+        result = await result
+    return result
+
+
+async def handle_http(request, reader, writer):
+    """GET /<コマンド名> を処理します（Prometheus などのHTTPクライアント向け）。"""
+    # リクエストヘッダーを読み捨てる
+    while True:
+        line = await asyncio.wait_for(reader.readline(), COMMAND_TIMEOUT)
+        if not line or line in (b"\r\n", b"\n"):
+            break
+    path = request.split(" ")[1] if " " in request else "/"
+    name = path.split("?")[0].strip("/").replace("/", " ")
+    status = "200 OK"
+    try:
+        if not name:
+            raise LookupError("Not Found")
+        body = await dispatch(name)
+    except LookupError as e:
+        status, body = "404 Not Found", f"{e}\n"
+    except Exception as e:
+        status, body = "500 Internal Server Error", f"{e}\n"
+    data = body.encode()
+    writer.write((f"HTTP/1.0 {status}\r\n"
+                  "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                  f"Content-Length: {len(data)}\r\n"
+                  "Connection: close\r\n\r\n").encode() + data)
 
 
 async def handle_client(reader, writer):
-    writer.write(key.encode())
-    await writer.drain()
-    writer.close()
+    try:
+        try:
+            line = await asyncio.wait_for(reader.readline(), COMMAND_TIMEOUT)
+        except asyncio.TimeoutError:
+            line = b""
+        request = line.decode("utf-8", errors="replace").strip()
+        name, _, args = request.partition(" ")
+        if request.startswith("GET "):
+            await handle_http(request, reader, writer)
+        elif name.upper() in streams:
+            await streams[name.upper()](args.strip(), reader, writer)
+        else:
+            try:
+                response = await dispatch(request)
+            except Exception as e:
+                response = f"ERROR {e}\n"
+            writer.write(response.encode())
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+def bind_hosts(bind):
+    """
+    待ち受けるアドレスのリストを返します。
+    多重起動の確認（ipc_client）は localhost に接続するため、特定のアドレスを指定した場合も localhost で待ち受けます。
+    """
+    if not bind or bind in ("localhost", "127.0.0.1"):
+        return ["localhost"]
+    if bind in ("0.0.0.0", "::"):
+        # すべてのアドレス（localhost を含む）
+        return [bind]
+    return ["localhost", bind]
 
 
-async def start_server(port, _key):
+async def start_server(port, _key, bind="localhost"):
     global key
     key = _key
     server = await asyncio.start_server(
-        handle_client, 'localhost', port)
+        handle_client, bind_hosts(bind), port)
 
     addr = server.sockets[0].getsockname()
     # print(f'Serving on {addr}')
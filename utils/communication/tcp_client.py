@@ -1,15 +1,21 @@
 import socket
 import pickle
-from threading import Timer
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from modules.metrics import METRICS
 
 
 def send(message, port, server_address='localhost'):
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # 応答のない送信先で送信用のスレッドが長時間ブロックしないようにする
+    sock.settimeout(5)
     try:
         # サーバーに接続します
         sock.connect((server_address, port))
-        # オブジェクトをバイト列に変換（シリアライズ）します
-        data = pickle.dumps(message)
+        # オブジェクトをバイト列に変換（シリアライズ）します（バイナリ形式のフレームはそのまま送信）
+        data = message if isinstance(message, bytes) else pickle.dumps(message)
         # メッセージを送信します
         sock.sendall(data)
     finally:
@@ -24,24 +30,55 @@ def hello_server(message, port=12345, server_address='localhost'):
         sock.connect((server_address, port))
         # オブジェクトをバイト列に変換（シリアライズ）します
         # data = pickle.dumps(message)
-        sock.sendall(message)
+        sock.sendall(message.encode())
         response = sock.recv(1024).decode()
         sock.close()
         return response.strip()  # 既存のインスタンスからのレスポンスを返す
     except ConnectionRefusedError:
         return None  # 通信ができなかった場合、既存のインスタンスは存在しないと判断
 
-# 最初の更新から指定した遅延時間（ここでは 1 秒）が経過するまで無更新状態が続いた時点で、一度だけTCPが送信されます。
-
 
-class DelayedTCPSender:
-    def __init__(self, delay=1):
-        self.send_interval = delay
-        self.timer = None
+# 送信のタイミングは通知側（EventBatcher）で決めるため、メッセージごとに接続して直ちに送信します。
+# 接続と送信は最大 5 秒ブロックするため、送信専用のスレッドで送信順に実行し、イベントループを止めないようにします。
+class TCPSender:
+    def __init__(self, max_pending=1000):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="thumb-crafter-tcp")
+        # 送信待ちのメッセージ数の上限（応答のない送信先でメッセージがたまり続けないようにする）
+        self.max_pending = max_pending
+        self.pending = 0
+        self.lock = threading.Lock()
 
     def send_message(self, ip, port, message):
-        if self.timer is not None:
-            self.timer.cancel()
+        """メッセージの送信を送信用のスレッドに予約します（任意のスレッドから呼び出せる）。"""
+        with self.lock:
+            if self.pending >= self.max_pending:
+                METRICS.inc("tcp_dropped_total", policy="drop_newest")
+                logging.error("TCP send queue is full, dropping the newest message")
+                return
+            self.pending += 1
+        try:
+            self.executor.submit(self.send, ip, port, message)
+        except RuntimeError:
+            # 閉じた後の送信
+            with self.lock:
+                self.pending -= 1
+
+    def send(self, ip, port, message):
+        try:
+            send(message, port, ip)
+        except OSError as e:
+            print(f"Failed to send message: {e}")
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    def close(self, timeout=5):
+        """送信待ちのメッセージの送信を待ってから（最大 timeout 秒）送信用のスレッドを終了します。"""
+        try:
+            self.executor.submit(lambda: None).result(timeout)
+        except (FutureTimeoutError, RuntimeError):
+            logging.error(f"TCP sender closed with {self.pending} unsent message(s)")
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
-        self.timer = Timer(self.send_interval, send, [message, port, ip])
-        self.timer.start()
+    async def aclose(self, timeout=5):
+        await asyncio.to_thread(self.close, timeout)
@@ -0,0 +1,203 @@
+"""
+常時接続のTCP送信クライアント（asyncio）。
+1つの接続を維持してメッセージを長さ付きフレーム（4バイトのビッグエンディアンの長さ + pickleしたメッセージ）で送信し、
+切断された場合はバックオフしながら自動的に再接続します。
+送信待ちのメッセージは上限付きのキューに保持し、あふれた場合は overflow の方針に従って破棄します。
+
+    drop_oldest: 最も古いメッセージを破棄する（既定）
+    drop_newest: 新しいメッセージを破棄する
+
+delta 形式の通知では破棄したメッセージは seq の欠番になり、受信側は再同期を要求できます。
+--wire binary のメッセージ（bytes）は自身が長さを含むフレームのため、そのまま送信します。
+"""
+import time
+import pickle
+import socket
+import struct
+import asyncio
+import logging
+from collections import deque
+from modules.metrics import METRICS, STAGE_TCP_SEND, STAGE_TCP_QUEUE
+
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest")
+FRAME_HEADER = struct.Struct(">I")
+
+
+def encode_frame(message):
+    """メッセージを長さ付きフレームに変換します（バイナリ形式のフレームは長さを含むためそのまま送信）。"""
+    if isinstance(message, bytes):
+        return message
+    data = pickle.dumps(message)
+    return FRAME_HEADER.pack(len(data)) + data
+
+
+async def read_frame(reader):
+    """受信側の参考実装（--wire json）: フレームを1つ読み込み、メッセージを返します（接続が閉じられた場合は None）。"""
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+        (length,) = FRAME_HEADER.unpack(header)
+        return pickle.loads(await reader.readexactly(length))
+    except asyncio.IncompleteReadError:
+        return None
+
+
+def enable_keepalive(sock, idle=30, interval=5, count=3):
+    """TCPキープアライブを有効にし、無応答の接続を検出できるようにします。"""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if hasattr(socket, "SIO_KEEPALIVE_VALS"):  # Windows
+        sock.ioctl(socket.SIO_KEEPALIVE_VALS, (1, idle * 1000, interval * 1000))
+        return
+    for name, value in (("TCP_KEEPIDLE", idle), ("TCP_KEEPALIVE", idle),
+                        ("TCP_KEEPINTVL", interval), ("TCP_KEEPCNT", count)):
+        if hasattr(socket, name):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, name), value)
+
+
+class PersistentTCPSender:
+    def __init__(self, loop, queue_size=1000, overflow="drop_oldest", connect_timeout=5,
+                 backoff_initial=0.5, backoff_max=30, name=None):
+        # 送信処理を実行するイベントループ（send_message は任意のスレッドから呼び出せる）
+        self.loop = loop
+        self.queue_size = max(1, queue_size)
+        self.overflow = overflow if overflow in OVERFLOW_POLICIES else "drop_oldest"
+        self.connect_timeout = connect_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        # (送信先, フレーム, キューに追加した時刻)
+        self.queue = deque()
+        self.ready = None
+        self.task = None
+        self.writer = None
+        self.destination = None
+        self.closing = False
+        # 送信先ごとに送信クライアントを分ける場合に、メトリクスを区別する名前（"ip:port" など）
+        self.name = name
+        METRICS.register(f"tcp_sender:{name}" if name else "tcp_sender", self.collect_metrics)
+
+    def send_message(self, ip, port, message):
+        """メッセージを送信キューに追加します。"""
+        item = ((ip, port), encode_frame(message), time.monotonic())
+        if self.loop.is_running() and not self.in_loop_thread():
+            self.loop.call_soon_threadsafe(self.enqueue, item)
+        else:
+            self.enqueue(item)
+
+    def in_loop_thread(self):
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def enqueue(self, item):
+        if self.closing:
+            return
+        if len(self.queue) >= self.queue_size:
+            METRICS.inc("tcp_dropped_total", policy=self.overflow)
+            if self.overflow == "drop_newest":
+                logging.error("TCP send queue is full, dropping the newest message")
+                return
+            self.queue.popleft()
+            logging.error("TCP send queue is full, dropping the oldest message")
+        self.queue.append(item)
+        if self.task is None or self.task.done():
+            self.ready = asyncio.Event()
+            self.task = self.loop.create_task(self.run())
+        self.ready.set()
+
+    async def run(self):
+        """キューのメッセージを順に送信します。送信に失敗したメッセージは再接続後に再送します。"""
+        backoff = self.backoff_initial
+        while self.queue or not self.closing:
+            if not self.queue:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+            destination, frame, queued = self.queue[0]
+            started = time.monotonic()
+            try:
+                writer = await self.connect(destination)
+                writer.write(frame)
+                # 受信側の読み込みが追いつくまで待機する（背圧）
+                await writer.drain()
+            except (OSError, asyncio.TimeoutError) as e:
+                METRICS.observe(STAGE_TCP_SEND, time.monotonic() - started, "error")
+                self.disconnect()
+                if self.closing:
+                    break
+                logging.error(f"TCP send to {destination[0]}:{destination[1]} failed, "
+                              f"retrying in {backoff:.1f}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.backoff_max)
+                continue
+            backoff = self.backoff_initial
+            if self.queue and self.queue[0][1] is frame:
+                self.queue.popleft()
+            now = time.monotonic()
+            METRICS.observe(STAGE_TCP_SEND, now - started)
+            METRICS.observe(STAGE_TCP_QUEUE, now - queued)
+            METRICS.inc("tcp_sent_messages_total")
+            METRICS.inc("tcp_sent_bytes_total", len(frame))
+        self.disconnect()
+
+    async def connect(self, destination):
+        """送信先への接続を返します（切断されている、または送信先が変わった場合は接続し直す）。"""
+        if self.writer is not None and (self.destination != destination or self.writer.is_closing()):
+            self.disconnect()
+        if self.writer is None:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(*destination), self.connect_timeout)
+            sock = writer.get_extra_info("socket")
+            if sock is not None:
+                enable_keepalive(sock)
+            self.writer = writer
+            self.destination = destination
+            # 受信側からの切断を検出するため、読み込みを続ける
+            self.loop.create_task(self.watch(reader, writer))
+            METRICS.inc("tcp_connects_total")
+            logging.info(f"TCP connected to {destination[0]}:{destination[1]}")
+        return self.writer
+
+    async def watch(self, reader, writer):
+        try:
+            while await reader.read(4096):
+                pass
+        except OSError:
+            pass
+        if self.writer is writer:
+            logging.info("TCP connection closed by peer")
+            self.disconnect()
+
+    def disconnect(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    async def aclose(self, timeout=5):
+        """キューに残っているメッセージの送信を待ってから（最大 timeout 秒）接続を閉じます。"""
+        self.closing = True
+        if self.task is not None and not self.task.done():
+            self.ready.set()
+            try:
+                await asyncio.wait_for(asyncio.shield(self.task), timeout)
+            except asyncio.TimeoutError:
+                self.task.cancel()
+                logging.error(f"TCP sender closed with {len(self.queue)} unsent message(s)")
+        self.disconnect()
+        # 同じ送信先の新しい送信クライアントの登録は残す
+        METRICS.unregister(f"tcp_sender:{self.name}" if self.name else "tcp_sender", self.collect_metrics)
+
+    def close(self, timeout=5):
+        """イベントループ以外のスレッドから、送信の完了を待って接続を閉じます。"""
+        if self.loop.is_running():
+            try:
+                asyncio.run_coroutine_threadsafe(self.aclose(timeout), self.loop).result(timeout + 1)
+            except Exception as e:
+                logging.error(f"Error in closing TCP sender: {e}")
+        else:
+            self.loop.run_until_complete(self.aclose(timeout))
+
+    def collect_metrics(self):
+        labels = {"destination": self.name} if self.name else {}
+        return [("tcp_queue_depth", labels, len(self.queue)),
+                ("tcp_connected", labels, int(self.writer is not None and not self.writer.is_closing()))]
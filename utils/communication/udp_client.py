@@ -1,13 +1,12 @@
 import socket
 import pickle
-from threading import Timer
 
 
 def send(message, port=12345, server_address='localhost'):
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     try:
-        # オブジェクトをバイト列に変換（シリアライズ）します
-        data = pickle.dumps(message)
+        # オブジェクトをバイト列に変換（シリアライズ）します（バイナリ形式のフレームはそのまま送信）
+        data = message if isinstance(message, bytes) else pickle.dumps(message)
         sock.sendto(data, (server_address, port))
     finally:
         sock.close()
@@ -27,15 +26,10 @@ def hello_server(message, port=12345, server_address='localhost'):
         return None  # 通信ができなかった場合、既存のインスタンスは存在しないと判断
 
 
-# 最初の更新から指定した遅延時間（ここでは 1 秒）が経過するまで無更新状態が続いた時点で、一度だけUDPが送信されます。
-class DelayedUDPSender:
-    def __init__(self, delay=1):
-        self.send_interval = delay
-        self.timer = None
-
+# 送信のタイミングは通知側（EventBatcher）で決めるため、メッセージは直ちに送信します。
+class UDPSender:
     def send_message(self, ip, port, message):
-        if self.timer is not None:
-            self.timer.cancel()
-
-        self.timer = Timer(self.send_interval, send, [message, port, ip])
-        self.timer.start()
+        try:
+            send(message, port, ip)
+        except OSError as e:
+            print(f"Failed to send message: {e}")
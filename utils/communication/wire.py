@@ -0,0 +1,117 @@
+"""
+通知メッセージのワイヤ形式（--wire）。
+
+    json:   JSON文字列（送信時に pickle される従来の形式）
+    binary: 長さ付きのバイナリフレーム（形式は wire_decoder.py を参照）
+
+binary ではターゲットディレクトリ以下のパスをルートからの相対パスとして格納し、同じ文字列（ディレクトリ名など）は
+メッセージ内で2回目以降を番号で参照します。本体が compress_threshold バイトを超える場合は zlib で圧縮します。
+"""
+import json
+import zlib
+from utils.communication.wire_decoder import (
+    MAGIC, VERSION, HEADER, FLAG_ZLIB, FLOAT,
+    TAG_NONE, TAG_FALSE, TAG_TRUE, TAG_INT, TAG_FLOAT, TAG_STR, TAG_STRREF, TAG_LIST, TAG_DICT, TAG_PATH)
+
+
+WIRE_FORMATS = ("json", "binary")
+# この大きさ（バイト）を超える本体を zlib で圧縮する
+COMPRESS_THRESHOLD = 1024
+
+
+def encode_json(message):
+    """従来の形式: 辞書は JSON 文字列に、文字列（終了メッセージなど）はそのまま送信します。"""
+    return message if isinstance(message, str) else json.dumps(message)
+
+
+def encode_binary(message, root="", compress_threshold=COMPRESS_THRESHOLD):
+    """メッセージをバイナリフレーム（bytes）に変換します。"""
+    encoder = Encoder(root or "")
+    encoder.string(encoder.root)
+    encoder.value(message)
+    body = bytes(encoder.out)
+    flags = 0
+    if compress_threshold is not None and len(body) > compress_threshold:
+        compressed = zlib.compress(body, 6)
+        if len(compressed) < len(body):
+            body = compressed
+            flags |= FLAG_ZLIB
+    return HEADER.pack(MAGIC, VERSION, flags, len(body)) + body
+
+
+def encoder_for(wire, root=""):
+    """ワイヤ形式に対応する変換関数を返します。"""
+    if wire == "binary":
+        return lambda message: encode_binary(message, root)
+    return encode_json
+
+
+class Encoder:
+    def __init__(self, root):
+        # 末尾の区切り文字を除いたルートディレクトリ
+        self.root = root.rstrip("/\\") if len(root) > 1 else root
+        self.out = bytearray()
+        self.strings = {}
+
+    def varint(self, n):
+        while n >= 0x80:
+            self.out.append((n & 0x7F) | 0x80)
+            n >>= 7
+        self.out.append(n)
+
+    def string(self, text):
+        index = self.strings.get(text)
+        if index is not None:
+            self.out.append(TAG_STRREF)
+            self.varint(index)
+            return
+        self.strings[text] = len(self.strings)
+        data = text.encode("utf-8")
+        self.out.append(TAG_STR)
+        self.varint(len(data))
+        self.out.extend(data)
+
+    def path(self, text):
+        """ルート以下のパスであれば PATH として書き込み True を返します。"""
+        root = self.root
+        if not root or not text.startswith(root) or len(text) == len(root) or text[len(root)] not in "/\\":
+            return False
+        rest = text[len(root):]
+        split = max(rest.rfind("/"), rest.rfind("\\")) + 1
+        self.out.append(TAG_PATH)
+        self.string(rest[:split])
+        self.string(rest[split:])
+        return True
+
+    def value(self, value):
+        # 最も多い文字列を先に判定する
+        if isinstance(value, str):
+            if not self.path(value):
+                self.string(value)
+        elif value is None:
+            self.out.append(TAG_NONE)
+        elif value is True:
+            self.out.append(TAG_TRUE)
+        elif value is False:
+            self.out.append(TAG_FALSE)
+        elif isinstance(value, int):
+            self.out.append(TAG_INT)
+            # ジグザグ符号化（負の数も小さい値は短くなる）
+            self.varint(value * 2 if value >= 0 else -value * 2 - 1)
+        elif isinstance(value, float):
+            self.out.append(TAG_FLOAT)
+            self.out.extend(FLOAT.pack(value))
+        elif isinstance(value, (list, tuple)):
+            self.out.append(TAG_LIST)
+            self.varint(len(value))
+            for item in value:
+                self.value(item)
+        elif isinstance(value, dict):
+            self.out.append(TAG_DICT)
+            self.varint(len(value))
+            for key, item in value.items():
+                self.string(str(key))
+                self.value(item)
+        else:
+            # JSON と同様に、その他の値は文字列として送信する
+            self.string(str(value))
@@ -0,0 +1,154 @@
+"""
+通知のバイナリ形式（--wire binary）のデコーダ。
+標準ライブラリのみを使用しているため、受信側のプロジェクトにこのファイルをコピーして使用できます。
+
+    from wire_decoder import decode, FrameReader
+
+    # UDP: 1データグラムが1フレーム
+    message = decode(datagram)
+
+    # TCP: 受信したバイト列を順に渡すと、完成したメッセージを返す
+    reader = FrameReader()
+    for message in reader.feed(data):
+        ...
+
+フレームの構成（数値はビッグエンディアン）:
+
+    magic "TC"（2バイト） | version（1バイト） | flags（1バイト、bit0: zlib圧縮） | 本体の長さ（4バイト） | 本体
+
+本体は「ルートディレクトリ（文字列）」と「メッセージ」の2つの値を続けたものです。各値は1バイトのタグで始まります。
+一度出現した文字列には出現順に番号が付き、2回目以降は番号（STRREF）で参照されます。
+ルートディレクトリ以下のパスは PATH として「ルートからの相対ディレクトリ」と「ファイル名」に分けて格納され、
+ルートディレクトリ + 相対ディレクトリ + ファイル名 で元のパスに戻ります。
+整数はジグザグ符号化した可変長整数（LEB128）、浮動小数点数は8バイトの倍精度です。
+"""
+import zlib
+import struct
+
+
+MAGIC = b"TC"
+VERSION = 1
+HEADER = struct.Struct(">2sBBI")
+FLAG_ZLIB = 0x01
+
+# 値のタグ
+TAG_NONE = 0x00
+TAG_FALSE = 0x01
+TAG_TRUE = 0x02
+TAG_INT = 0x03
+TAG_FLOAT = 0x04
+TAG_STR = 0x05
+TAG_STRREF = 0x06
+TAG_LIST = 0x07
+TAG_DICT = 0x08
+TAG_PATH = 0x09
+
+FLOAT = struct.Struct(">d")
+
+
+class WireError(ValueError):
+    pass
+
+
+def decode(frame):
+    """1つのフレーム（bytes）をデコードし、メッセージを返します。"""
+    if len(frame) < HEADER.size:
+        raise WireError("Frame is too short")
+    magic, version, flags, length = HEADER.unpack_from(frame)
+    if magic != MAGIC:
+        raise WireError("Not a thumb-crafter binary frame")
+    if version != VERSION:
+        raise WireError(f"Unsupported wire version: {version}")
+    body = bytes(frame[HEADER.size:HEADER.size + length])
+    if len(body) != length:
+        raise WireError("Frame is truncated")
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    decoder = Decoder(body)
+    decoder.root = decoder.value()
+    return decoder.value()
+
+
+class Decoder:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+        self.strings = []
+        self.root = ""
+
+    def varint(self):
+        result = shift = 0
+        while True:
+            byte = self.data[self.pos]
+            self.pos += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def string(self, tag):
+        if tag == TAG_STRREF:
+            return self.strings[self.varint()]
+        if tag != TAG_STR:
+            raise WireError(f"Expected a string, got tag {tag:#x}")
+        length = self.varint()
+        text = self.data[self.pos:self.pos + length].decode("utf-8")
+        self.pos += length
+        self.strings.append(text)
+        return text
+
+    def tag(self):
+        tag = self.data[self.pos]
+        self.pos += 1
+        return tag
+
+    def value(self):
+        tag = self.tag()
+        if tag == TAG_NONE:
+            return None
+        if tag == TAG_FALSE:
+            return False
+        if tag == TAG_TRUE:
+            return True
+        if tag == TAG_INT:
+            n = self.varint()
+            return (n >> 1) ^ -(n & 1)
+        if tag == TAG_FLOAT:
+            (number,) = FLOAT.unpack_from(self.data, self.pos)
+            self.pos += FLOAT.size
+            return number
+        if tag in (TAG_STR, TAG_STRREF):
+            return self.string(tag)
+        if tag == TAG_LIST:
+            return [self.value() for _ in range(self.varint())]
+        if tag == TAG_DICT:
+            items = {}
+            for _ in range(self.varint()):
+                key = self.string(self.tag())
+                items[key] = self.value()
+            return items
+        if tag == TAG_PATH:
+            directory = self.string(self.tag())
+            name = self.string(self.tag())
+            return self.root + directory + name
+        raise WireError(f"Unknown tag {tag:#x}")
+
+
+class FrameReader:
+    """TCPのバイトストリームをフレームに区切ってデコードします。"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """受信したバイト列を追加し、完成したメッセージのリストを返します。"""
+        self.buffer.extend(data)
+        messages = []
+        while len(self.buffer) >= HEADER.size:
+            length = HEADER.unpack_from(self.buffer)[3]
+            end = HEADER.size + length
+            if len(self.buffer) < end:
+                break
+            messages.append(decode(bytes(self.buffer[:end])))
+            del self.buffer[:end]
+        return messages